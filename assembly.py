@@ -2,124 +2,385 @@
 # Date: 12/12/24
 # assembly.py
 
+# Converts 3-Address Code to x86-64 assembly following the System V AMD64 calling convention
+#   - the first six arguments are passed in edi, esi, edx, ecx, r8d, r9d, the rest on the stack
+#   - the result comes back in eax
+#   - ebx and r12d-r15d belong to the caller, they are saved before use and restored on return
+#   - rsp is 16-byte aligned at every call
+
+from constant_eval import NEGATED_COMPARISONS, SWAPPED_COMPARISONS, evaluate_binary
+from dataflow import parse_branch, parse_instruction, parse_table, ControlFlowGraph
+
+ARGUMENT_REGISTERS = ["edi", "esi", "edx", "ecx", "r8d", "r9d"]
+CALLEE_SAVED_REGISTERS = ["ebx", "r12d", "r13d", "r14d", "r15d"]
+# Registers a function without calls can keep variables in for free
+# eax, edx, and r11d are left out, every instruction may use them as scratch registers
+LEAF_REGISTERS = ["ecx", "esi", "edi", "r8d", "r9d", "r10d"]
+
+# push and pop only take 64-bit registers
+REGISTERS_64 = {"eax": "rax", "ebx": "rbx", "ecx": "rcx", "edx": "rdx", "esi": "rsi", "edi": "rdi",
+                "r8d": "r8", "r9d": "r9", "r10d": "r10", "r11d": "r11",
+                "r12d": "r12", "r13d": "r13", "r14d": "r14", "r15d": "r15"}
+
+ARITHMETIC_INSTRUCTIONS = {"+": "add", "-": "sub", "*": "imul"}
+
+# setcc and jcc suffix of each comparison
+CONDITION_CODES = {"<": "l", ">": "g", "<=": "le", ">=": "ge", "==": "e", "!=": "ne"}
+
+
+# Helper to check for an integer literal operand
+def is_int_literal(value):
+    return value.lstrip('-').isdigit()
+
+
+# Labels of the TAC become local assembler labels, L3 is written .L3 so it can never clash with a function named L3
+def local_label(label):
+    return f".{label}"
+
+
+# Where every variable of one function lives, and what its prologue has to set up
+# Worked out once per function before any code for it is generated
+class FrameLayout:
+    def __init__(self, name, params, body, weights = None):
+        self.name = name
+        self.params = params
+        self.homes = {}  # Variable -> register or stack slot operand
+        self.saved_registers = []  # Callee-saved registers in use, in push order
+        self.slot_count = 0
+        instructions = [parse_instruction(line) for line in body]
+        self.is_leaf = not any(kind == 'call' for kind, _, _, _ in instructions)
+
+        # Variables in order of first appearance, the most used ones get registers
+        # With a profile every use counts as often as its line ran, so the variables of hot loops win
+        counts = {}
+        for index, (_, defs, uses, _) in enumerate(instructions):
+            for var in defs + uses:
+                counts[var] = counts.get(var, 0) + (weights[index] if weights else 1)
+
+        if self.is_leaf:
+            # Parameters that arrive in a free register just stay there
+            for index, param in enumerate(params[:len(ARGUMENT_REGISTERS)]):
+                if ARGUMENT_REGISTERS[index] in LEAF_REGISTERS:
+                    self.homes[param] = ARGUMENT_REGISTERS[index]
+            taken = set(self.homes.values())
+            pool = [reg for reg in LEAF_REGISTERS if reg not in taken] + CALLEE_SAVED_REGISTERS
+        else:
+            # Anything in a caller-saved register would be lost at the first call
+            pool = list(CALLEE_SAVED_REGISTERS)
+
+        # Stack arguments are left where the caller put them, above the return address and saved rbp
+        for index, param in enumerate(params[len(ARGUMENT_REGISTERS):]):
+            self.homes[param] = f"DWORD PTR [rbp+{16 + 8 * index}]"
+
+        remaining = [param for param in params if param not in self.homes]
+        remaining += sorted((var for var in counts if var not in self.homes and var not in params),
+                            key = lambda var: -counts[var])
+        for var in remaining:
+            if pool:
+                self.homes[var] = pool.pop(0)
+                if self.homes[var] in CALLEE_SAVED_REGISTERS:
+                    self.saved_registers.append(self.homes[var])
+            else:
+                self.slot_count += 1
+                self.homes[var] = None  # Placed below the saved registers once their count is known
+
+        slot = 0
+        for var, home in self.homes.items():
+            if home is None:
+                slot += 1
+                self.homes[var] = f"DWORD PTR [rbp-{8 * len(self.saved_registers) + 4 * slot}]"
+
+        # A leaf function that fits in registers needs no frame pointer
+        self.uses_frame = not self.is_leaf or self.slot_count > 0 or len(params) > len(ARGUMENT_REGISTERS)
+        # Stack space for the slots, rounded so rsp stays 16-byte aligned after the pushes
+        pushed = 8 * len(self.saved_registers) + (8 if self.uses_frame else 0) + 8  # + the return address
+        self.stack_size = 4 * self.slot_count
+        self.stack_size += -(pushed + self.stack_size) % 16 if not self.is_leaf else 0
+
+
+    # Prologue, sets up the frame and moves register arguments into their homes
+    def prologue(self):
+        code = [f"{self.name}:"]
+        if self.uses_frame:
+            code += ["push rbp", "mov rbp, rsp"]
+        code += [f"push {REGISTERS_64[reg]}" for reg in self.saved_registers]
+        if self.stack_size:
+            code.append(f"sub rsp, {self.stack_size}")
+        for index, param in enumerate(self.params[:len(ARGUMENT_REGISTERS)]):
+            if self.homes[param] != ARGUMENT_REGISTERS[index]:
+                code.append(f"mov {self.homes[param]}, {ARGUMENT_REGISTERS[index]}")
+        return code
+
+
+    # Epilogue, undoes the prologue and returns, the result is already in eax
+    def epilogue(self):
+        code = []
+        if self.stack_size:
+            code.append(f"add rsp, {self.stack_size}")
+        code += [f"pop {REGISTERS_64[reg]}" for reg in reversed(self.saved_registers)]
+        if self.uses_frame:
+            code.append("pop rbp")
+        code.append("ret")
+        return code
+
+
+# Times each line of a function ran according to profiled block counts, a line that never ran still counts once
+def line_weights(lines, block_counts):
+    cfg = ControlFlowGraph(lines)
+    weights = [1] * len(lines)
+    for block, name in zip(cfg.blocks, cfg.block_names()):
+        for index in range(block.start, block.end):
+            weights[index] = block_counts.get(name, 0) + 1
+    return weights
+
+
 class TACtoAssemblyConverter:
-    def __init__(self, tac):
+    def __init__(self, tac, block_counts = None):
         self.tac = tac
-        self.registers = ["eax", "ebx", "ecx", "edx"]
-        self.register_map = {}
+        self.block_counts = block_counts  # Block name -> times it ran, from a profile
+        self.layout = None  # FrameLayout of the function being converted
+        self.params = []  # PARAM values waiting for their CALL
+        self.table_count = 0  # Jump tables of the function being converted, they are named after it
         self.assembly_code = []
 
-    # Allocate a register for a variable, if not already mapped
-    def allocate_register(self, var):
-        if var not in self.register_map:
-            for reg in self.registers:
-                if reg not in self.register_map.values():
-                    self.register_map[var] = reg
-                    return reg
-            raise Exception("No free registers available.")
-        return self.register_map[var]
-
-    # Clearing a register when a variable is no longer needed
-    def free_register(self, var):
-        if var in self.register_map:
-            del self.register_map[var]
-
     # Converst TAC to x86
     def convert(self):
+        function = None
         for line in self.tac:
-            if " = " in line:
-                var, expr = line.split(" = ", 1)
-                expr_parts = expr.split()
-
-                # Assignments / Constants
-                if len(expr_parts) == 1:
-                    if expr_parts[0].isdigit():
-                        reg = self.allocate_register(var)
-                        self.assembly_code.append(f"mov {reg}, {expr_parts[0]}")
-                    else:
-                        src_reg = self.allocate_register(expr_parts[0])
-                        dest_reg = self.allocate_register(var)
-                        self.assembly_code.append(f"mov {dest_reg}, {src_reg}")
-
-                # Binary Operations
-                elif len(expr_parts) == 3: 
-                    left, op, right = expr_parts
-                    left_reg = self.allocate_register(left)
-
-                    if right.isdigit():
-                        temp_reg = self.allocate_register(var)
-                        self.assembly_code.append(f"mov {temp_reg}, {left_reg}")
-                        if op == "+":
-                            self.assembly_code.append(f"add {temp_reg}, {right}")
-                        elif op == "-":
-                            self.assembly_code.append(f"sub {temp_reg}, {right}")
-                        elif op == "*":
-                            self.assembly_code.append(f"imul {temp_reg}, {right}")
-                        elif op == "/":
-                            self.assembly_code.append(f"mov edx, 0")  # Clear edx for division
-                            self.assembly_code.append(f"mov eax, {left_reg}")
-                            self.assembly_code.append(f"div {right}")
-                            self.assembly_code.append(f"mov {temp_reg}, eax")
-                        elif op == "%":
-                            self.assembly_code.append(f"mov edx, 0")  # Clear edx for division
-                            self.assembly_code.append(f"mov eax, {left_reg}")
-                            self.assembly_code.append(f"div {right}")
-                            self.assembly_code.append(f"mov {temp_reg}, edx")  # Remainder in edx
-                        #else:
-                            #raise Exception(f"Unsupported operator: {op}")
-
-                    # If the right-hand operand is a variable
-                    else: 
-                        right_reg = self.allocate_register(right)
-                        temp_reg = self.allocate_register(var)
-                        self.assembly_code.append(f"mov {temp_reg}, {left_reg}")
-                        if op == "+":
-                            self.assembly_code.append(f"add {temp_reg}, {right_reg}")
-                        elif op == "-":
-                            self.assembly_code.append(f"sub {temp_reg}, {right_reg}")
-                        elif op == "*":
-                            self.assembly_code.append(f"imul {temp_reg}, {right_reg}")
-                        elif op == "/":
-                            self.assembly_code.append(f"mov edx, 0")  # Clear edx for division
-                            self.assembly_code.append(f"mov eax, {left_reg}")
-                            self.assembly_code.append(f"div {right_reg}")
-                            self.assembly_code.append(f"mov {temp_reg}, eax")
-                        elif op == "%":
-                            self.assembly_code.append(f"mov edx, 0")  # Clear edx for division
-                            self.assembly_code.append(f"mov eax, {left_reg}")
-                            self.assembly_code.append(f"div {right_reg}")
-                            self.assembly_code.append(f"mov {temp_reg}, edx")  # Remainder stored in edx
-                        elif op == ">":
-                            self.assembly_code.append(f"cmp {left_reg}, {right_reg}")
-                            self.assembly_code.append(f"setg {temp_reg}")  # Set if greater 
-                        elif op == "<":
-                            self.assembly_code.append(f"cmp {left_reg}, {right_reg}")
-                            self.assembly_code.append(f"setl {temp_reg}")  # Set if less
-                        else:
-                            raise Exception(f"Unsupported operator: {op}")
-
-            elif "goto" in line:  # Jump statement
-                if "if" in line:
-                    condition, target = line.split(" goto ", 1)
-                    cond_var = condition.split()[1]
-                    reg = self.allocate_register(cond_var)
-                    self.assembly_code.append(f"cmp {reg}, 0")
-                    self.assembly_code.append(f"jne {target}")
-                else:
-                    label = line.split()[1]
-                    self.assembly_code.append(f"jmp {label}")
+            if line.endswith(" BEGIN"):
+                function = [line]
+            elif line.endswith(" END"):
+                function.append(line)
+                self.convert_function(function)
+                function = None
+            elif function is not None:
+                function.append(line)
+        return "\n".join(self.assembly_code)
+
+
+    # Converts one function, from its BEGIN line to its END line
+    def convert_function(self, lines):
+        name = lines[0].split("(")[0]
+        _, params, _, _ = parse_instruction(lines[0])
+        body = lines[1:-1]
+        weights = line_weights(lines, self.block_counts)[1:-1] if self.block_counts else None
+        self.layout = FrameLayout(name, params, body, weights)
+        self.params = []
+        self.table_count = 0
+        self.assembly_code += self.layout.prologue()
 
-            elif ":" in line:  # Label
-                label = line.split(":")[0]
-                self.assembly_code.append(f"{label}:")
+        return_label = f".L{name}_return"
+        returns_early = False
+        previous_kind = 'begin'
+        for index, line in enumerate(body):
+            kind = parse_instruction(line)[0]
+            if kind == 'return':
+                self.convert_return(line)
+                # The last return falls straight into the epilogue
+                if index + 1 < len(body):
+                    self.assembly_code.append(f"jmp {return_label}")
+                    returns_early = True
+            else:
+                self.convert_line(line, kind)
+            previous_kind = kind
 
-            elif "RETURN" in line:  # Return statement
-                var = line.split()[1]
-                if var.isdigit():  # Handle constant returns
-                    self.assembly_code.append(f"mov eax, {var}")
+        # Falling off the end of main returns 0
+        if previous_kind not in ('return', 'jump', 'table') and name == "main":
+            self.assembly_code.append("mov eax, 0")
+        if returns_early:
+            self.assembly_code.append(f"{return_label}:")
+        self.assembly_code += self.layout.epilogue()
+
+
+    # Operand for a TAC value, an immediate or the home of a variable
+    def operand(self, value):
+        if is_int_literal(value):
+            return str(int(value))
+        if value.startswith('"'):
+            raise Exception("String literals are not supported by the x86 backend.")
+        if value not in self.layout.homes:
+            raise Exception(f"Floating point value '{value}' is not supported by the x86 backend.")
+        return self.layout.homes[value]
+
+
+    # Converts one TAC line that is not a return
+    def convert_line(self, line, kind):
+        if kind in ('assign', 'call'):
+            var, expr = line.split(" = ", 1)
+            expr_parts = expr.split()
+
+            # Function calls, the result comes back in eax
+            if expr_parts[0] == "CALL":
+                self.convert_call(expr_parts[1], int(expr_parts[2]))
+                self.store(var, "eax")
+
+            # Declared but not yet given a value
+            elif expr_parts[0] == "UNINITIALIZED":
+                pass
+
+            # Assignments / Constants
+            elif len(expr_parts) == 1:
+                self.move(self.operand(var), self.operand(expr_parts[0]))
+
+            # Binary Operations
+            elif len(expr_parts) == 3:
+                left, op, right = expr_parts
+                destination, left, right = self.operand(var), self.operand(left), self.operand(right)
+                # Simple arithmetic into a register can skip the scratch register
+                if op in ("+", "-", "*") and destination in REGISTERS_64 and destination != right:
+                    self.move(destination, left)
+                    self.assembly_code.append(f"{ARITHMETIC_INSTRUCTIONS[op]} {destination}, {right}")
                 else:
-                    reg = self.allocate_register(var)
-                    self.assembly_code.append(f"mov eax, {reg}")
-                self.assembly_code.append("ret")
+                    self.move(destination, self.convert_binary(left, op, right))
 
-        return "\n".join(self.assembly_code)
+        elif kind == 'param':  # Call argument, passed when the CALL is reached
+            self.params.append(line.split()[1])
+
+        elif kind == 'branch':
+            branch, condition, target = parse_branch(line)
+            target = local_label(target)
+            # ifFalse jumps when the condition is zero
+            jump_if_true = branch == "if"
+            if len(condition) == 3:
+                self.convert_compare_branch(condition, target, jump_if_true)
+            # A folded condition is either always or never taken
+            elif is_int_literal(condition[0]):
+                if (int(condition[0]) != 0) == jump_if_true:
+                    self.assembly_code.append(f"jmp {target}")
+            else:
+                self.assembly_code.append(f"cmp {self.operand(condition[0])}, 0")
+                self.assembly_code.append(f"{'jne' if jump_if_true else 'je'} {target}")
+
+        elif kind == 'jump':
+            self.assembly_code.append(f"jmp {local_label(line.split()[1])}")
+
+        elif kind == 'table':
+            self.convert_table(line)
+
+        elif kind == 'label':
+            self.assembly_code.append(f"{local_label(line[:-1])}:")
+
+
+    # A branch on "left op right" is one cmp and one conditional jump, the comparison is never stored
+    def convert_compare_branch(self, condition, target, jump_if_true):
+        left, op, right = condition
+        if not jump_if_true:
+            op = NEGATED_COMPARISONS[op]
+        if is_int_literal(left) and is_int_literal(right):
+            # A folded condition is either always or never taken
+            if evaluate_binary(op, int(left), int(right)):
+                self.assembly_code.append(f"jmp {target}")
+            return
+        # cmp only takes a constant on the right
+        if is_int_literal(left):
+            left, op, right = right, SWAPPED_COMPARISONS[op], left
+        left, right = self.operand(left), self.operand(right)
+        if left not in REGISTERS_64 and right not in REGISTERS_64 and not is_int_literal(right):
+            # Two stack slots, one has to be loaded first
+            self.assembly_code.append(f"mov eax, {left}")
+            left = "eax"
+        self.assembly_code.append(f"cmp {left}, {right}")
+        self.assembly_code.append(f"j{CONDITION_CODES[op]} {target}")
+
+
+    # Computes "left op right" into a scratch register and returns it
+    def convert_binary(self, left, op, right):
+        self.assembly_code.append(f"mov eax, {left}")
+        if op in ARITHMETIC_INSTRUCTIONS:
+            self.assembly_code.append(f"{ARITHMETIC_INSTRUCTIONS[op]} eax, {right}")
+        elif op in ("/", "%"):
+            # Signed division of edx:eax, the quotient ends up in eax and the remainder in edx
+            if is_int_literal(right):
+                self.assembly_code.append(f"mov r11d, {right}")
+                right = "r11d"
+            self.assembly_code.append("cdq")
+            self.assembly_code.append(f"idiv {right}")
+            return "eax" if op == "/" else "edx"
+        elif op in CONDITION_CODES:
+            self.assembly_code.append(f"cmp eax, {right}")
+            self.assembly_code.append(f"set{CONDITION_CODES[op]} al")
+            self.assembly_code.append("movzx eax, al")
+        elif op in ("&&", "||"):
+            # Both sides are turned into 0 or 1 first
+            self.assembly_code.append("cmp eax, 0")
+            self.assembly_code.append("setne al")
+            self.assembly_code.append("movzx eax, al")
+            self.assembly_code.append(f"mov edx, {right}")
+            self.assembly_code.append("cmp edx, 0")
+            self.assembly_code.append("setne dl")
+            self.assembly_code.append("movzx edx, dl")
+            self.assembly_code.append(f"{'and' if op == '&&' else 'or'} eax, edx")
+        else:
+            raise Exception(f"Unsupported operator: {op}")
+        return "eax"
+
+
+    # Jump table, the case labels are stored right after the jump as 32-bit offsets from the start of the table
+    # Subtracting the lowest case turns values below it into large unsigned numbers, so one unsigned compare
+    # sends everything outside the table to the default
+    def convert_table(self, line):
+        value, low, labels, default = parse_table(line)
+        self.table_count += 1
+        table = f".L{self.layout.name}_table{self.table_count}"
+        self.assembly_code.append(f"mov eax, {self.operand(value)}")
+        if low:
+            self.assembly_code.append(f"sub eax, {low}")
+        self.assembly_code.append(f"cmp eax, {len(labels) - 1}")
+        self.assembly_code.append(f"ja {local_label(default)}")
+        # Writing eax cleared the upper half of rax, so rax is the index
+        self.assembly_code.append(f"lea r11, [rip+{table}]")
+        self.assembly_code.append("movsxd rax, DWORD PTR [r11+rax*4]")
+        self.assembly_code.append("add rax, r11")
+        self.assembly_code.append("jmp rax")
+        self.assembly_code.append(f"{table}:")
+        self.assembly_code += [f".long {local_label(label)}-{table}" for label in labels]
+
+
+    # Passes the last count PARAM values and calls the function
+    def convert_call(self, function_name, count):
+        args = self.params[len(self.params) - count:]
+        del self.params[len(self.params) - count:]
+
+        # Arguments past the sixth are pushed right to left, with padding to keep rsp aligned
+        stack_args = args[len(ARGUMENT_REGISTERS):]
+        padding = 8 * (len(stack_args) % 2)
+        if padding:
+            self.assembly_code.append(f"sub rsp, {padding}")
+        for arg in reversed(stack_args):
+            value = self.operand(arg)
+            if value in REGISTERS_64:
+                self.assembly_code.append(f"push {REGISTERS_64[value]}")
+            elif is_int_literal(value):
+                self.assembly_code.append(f"push {value}")
+            else:
+                self.assembly_code.append(f"mov eax, {value}")
+                self.assembly_code.append("push rax")
+
+        # Homes are never argument registers in a function that calls, so the moves cannot clobber each other
+        for register, arg in zip(ARGUMENT_REGISTERS, args):
+            self.assembly_code.append(f"mov {register}, {self.operand(arg)}")
+        self.assembly_code.append(f"call {function_name}")
+        if stack_args:
+            self.assembly_code.append(f"add rsp, {8 * len(stack_args) + padding}")
+
+
+    # Return statement, the value goes in eax
+    def convert_return(self, line):
+        parts = line.split()
+        if len(parts) > 1:
+            self.assembly_code.append(f"mov eax, {self.operand(parts[1])}")
+
+
+    # Stores a register into the home of a variable
+    def store(self, var, register):
+        self.move(self.operand(var), register)
+
+
+    # mov that goes through eax when both sides are in memory
+    def move(self, destination, source):
+        if destination == source:
+            return
+        if destination.startswith("DWORD") and source.startswith("DWORD"):
+            self.assembly_code.append(f"mov eax, {source}")
+            source = "eax"
+        self.assembly_code.append(f"mov {destination}, {source}")
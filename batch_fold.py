@@ -0,0 +1,124 @@
+# Author: Thomas Lander
+# Date: 10/19/26
+# batch_fold.py
+
+# Batch constant folding over a columnar copy of the TAC
+# Every "x = <int> op <int>" instruction is pulled into NumPy columns (opcode, lhs, rhs) and they are all
+# evaluated together with int32 arithmetic, instead of being split and evaluated one line at a time.
+# The few other lines the scalar folder could fold (floats, stores into float variables, ...) still go through it.
+
+import re
+from itertools import repeat
+import numpy as np
+from constant_eval import INT_MIN, INT_MAX
+
+OPCODES = ('+', '-', '*', '/', '%', '<', '>', '<=', '>=', '==', '!=', '&&', '||')
+OPCODE_INDEX = {op: code for code, op in enumerate(OPCODES)}
+
+# One match per TAC line, the right hand side if it is made only of numbers and an empty string otherwise
+# A single group keeps findall returning plain strings, which is a lot cheaper than a tuple per line
+NUMERIC_RHS = re.compile(r'^(?:\S+ = (-?[\d.]+(?: \S{1,2} -?[\d.]+)?)$)?.*$', re.MULTILINE)
+# One match per numeric right hand side, itself again if it is an operation on two int literals
+INT_OPERATION = re.compile(r'^(?:(-?\d{1,10} \S{1,2} -?\d{1,10})$)?.*$', re.MULTILINE)
+
+
+# Columnar view of a TAC listing, only the literal operations are turned into numbers
+class TACColumns:
+    def __init__(self, tac):
+        candidates = NUMERIC_RHS.findall("\n".join(tac))
+        candidate_rows = np.flatnonzero(np.fromiter(map(bool, candidates), bool, len(candidates)))
+        candidates = [candidates[row] for row in candidate_rows.tolist()]
+
+        # Line numbers of the int literal operations, every other numeric line is left to the scalar folder
+        operations = INT_OPERATION.findall("\n".join(candidates)) if candidates else []
+        is_operation = np.fromiter(map(bool, operations), bool, len(operations))
+        self.rows = candidate_rows[is_operation]
+        self.scalar_rows = candidate_rows[~is_operation]
+        self.operations = [operation for operation in operations if operation]
+
+        # Columns, each operation is exactly "lhs op rhs"
+        parts = " ".join(self.operations).split(" ")
+        count = len(self.operations)
+        self.opcode = np.fromiter(map(OPCODE_INDEX.get, parts[1::3], repeat(-1)), np.int8, count)
+        self.lhs = np.fromstring(" ".join(parts[0::3]), dtype = np.int64, sep = " ") if count else np.zeros(0, np.int64)
+        self.rhs = np.fromstring(" ".join(parts[2::3]), dtype = np.int64, sep = " ") if count else np.zeros(0, np.int64)
+
+
+# Evaluates every literal operation at once with C int semantics
+# Returns the int32 results and a mask of the ones that could be folded
+def evaluate_columns(opcode, lhs, rhs):
+    values = np.zeros(len(opcode), dtype = np.int64)
+    # Unknown operators and operands outside the int range are left to the scalar folder
+    foldable = (opcode >= 0) & (lhs >= INT_MIN) & (lhs <= INT_MAX) & (rhs >= INT_MIN) & (rhs <= INT_MAX)
+
+    for code, op in enumerate(OPCODES):
+        mask = opcode == code
+        if not mask.any():
+            continue
+        left, right = lhs[mask], rhs[mask]
+
+        if op == '+':
+            result = left + right
+        elif op == '-':
+            result = left - right
+        elif op == '*':
+            result = left * right
+        elif op in ('/', '%'):
+            # Division by zero is not folded, the divisor is replaced so the rest can still be computed
+            nonzero = right != 0
+            right = np.where(nonzero, right, 1)
+            foldable[mask] &= nonzero
+            # Integer division truncates toward zero, the remainder takes the sign of the left operand
+            quotient = np.abs(left) // np.abs(right)
+            quotient = np.where((left < 0) != (right < 0), -quotient, quotient)
+            result = quotient if op == '/' else left - right * quotient
+        elif op == '<':
+            result = left < right
+        elif op == '>':
+            result = left > right
+        elif op == '<=':
+            result = left <= right
+        elif op == '>=':
+            result = left >= right
+        elif op == '==':
+            result = left == right
+        elif op == '!=':
+            result = left != right
+        elif op == '&&':
+            result = (left != 0) & (right != 0)
+        else:
+            result = (left != 0) | (right != 0)
+        values[mask] = result
+
+    # Casting down to int32 wraps around the same way C int arithmetic does
+    return values.astype(np.int32), foldable
+
+
+# Folds a TAC listing, fold_line is the scalar folder for the lines that cannot be done in a batch
+def batch_constant_folding(tac, variable_types, fold_line):
+    if not tac:
+        return []
+    columns = TACColumns(tac)
+    values, foldable = evaluate_columns(columns.opcode, columns.lhs, columns.rhs)
+
+    # A store into a float variable needs the result converted, the scalar folder does that
+    float_names = {name for name, var_type in variable_types.items() if var_type in ('float', 'double')}
+    if float_names:
+        foldable &= np.fromiter((tac[row].split(" = ", 1)[0] not in float_names for row in columns.rows.tolist()),
+                                bool, len(columns.rows))
+
+    # Rebuild the folded lines, the operation is always at the end of the line
+    rows = columns.rows[foldable].tolist()
+    operations = [columns.operations[index] for index in np.flatnonzero(foldable).tolist()]
+    folded = [tac[row][:-len(operation)] + value
+              for row, operation, value in zip(rows, operations, map(str, values[foldable].tolist()))]
+
+    # Write every folded line back in one step
+    optimized_tac = np.array(tac, dtype = object)
+    optimized_tac[rows] = folded
+
+    # Everything else that might fold goes through the scalar folder
+    for row in columns.scalar_rows.tolist() + columns.rows[~foldable].tolist():
+        optimized_tac[row] = fold_line(tac[row])
+
+    return optimized_tac.tolist()
@@ -3,192 +3,527 @@
 # compiler.py
 
 import argparse
-from lexer import Lexer, TOKEN_TYPES
-from my_parser import Parser, SymbolTable
+import sys
+from lexer import Lexer, TokenBuffer, TOKEN_TYPES
+from my_parser import Parser, ParseError
 from three_address_code import ThreeAddressCodeGenerator
-from optimize import Optimizer
-from assembly import TACtoAssemblyConverter
+from output import OutputWriter, EMITTABLE, FORMATS
 
+# The other stages are imported where they are used, so a run only loads what its flags need
 
-# Printing tokens (I loved the way Tullis's AI written code printed in code review, so I used the same template)
-def print_tokens(tokens):
 
-    # Print the header
-    print(f"{'Token':<20} {'Type':<20} {'Line':<5} {'Column':<5}")
-    print('-' * 50)
+def read_file(file_path, jobs = 1):
+    # Reading in the file
+    with open(file_path, 'r') as file:
+        content = file.read()
 
-    # Prints each token
-    for tokenText, tokenType, line, column in tokens:
-        print(f"{repr(tokenText):<20} {tokenType:<20} {line:<5} {column:<5}")
+    # Large files can be lexed in chunks on several processes, jobs = 0 uses every CPU
+    lexer = Lexer(TOKEN_TYPES)
+    tokens = lexer.tokenize(content) if jobs == 1 else lexer.tokenize_parallel(content, jobs or None)
 
+    return tokens
 
-# Printing out the AST
-def print_ast(node, indent = 0):
-    spacing = '  ' * indent
 
-    if isinstance(node, tuple):
-        print(f"{spacing}{node[0]}")
-        for child in node[1:]:
-            print_ast(child, indent + 1)
-    elif isinstance(node, list):
-        for item in node:
-            print_ast(item, indent)
-    elif isinstance(node, str):
-        # Print the string directly without breaking it down
-        print(f"{spacing}{node}")
-    else:
-        print(f"{spacing}{node}")
-
-
-# Printing out the Symbol Table, having some troubles with it though
-def print_symboltable(symbol_table):
-    print("Symbol Table:")
-    print("--------------------------------------------------")
-
-    # Print Global Scope (function declarations)
-    print("Global Scope (function declarations):")
-    global_functions = symbol_table.scopes[0]
-    for func_name, func_type in global_functions.items():
-        print(f"  {func_name}: {func_type}")
-
-    # Print Local Variables in each active and exited scope
-    for scope_level, scope in enumerate(symbol_table.scopes[1:], start=1):
-        print(f"\nLocal Variables in Active Scope Level {scope_level}:")
-        if scope:
-            for var_name, var_type in scope.items():
-                print(f"  {var_name}: {var_type}")
+# Whole-program mode, every file is one translation unit of the same program
+def compile_program(args, out):
+    from whole_program import WholeProgram
+    program = WholeProgram(args.file)
+    program.parse_units()
+    out.message(f"Parsed {len(program.units)} translation units, {len(program.function_index)} functions indexed.")
+
+    # The global function index
+    if out.wants('symbols'):
+        index = {function_name: {"file": file_path, "return_type": return_type, "parameters": parameters}
+                 for function_name, (file_path, return_type, parameters) in program.function_index.items()}
+        out.emit('symbols', "Global Function Index:", index, function_index_lines)
+
+    profile = load_profile(args.use_profile, out) if args.use_profile else None
+
+    # Whole-program optimizations, a profiling build keeps every call so the profile can decide what to inline
+    if args.o_inline and args.gen_profile:
+        out.message("Inlining is skipped while generating a profile.")
+    elif args.o_inline:
+        inlined = program.inline_functions(profile)
+        out.message(f"Inlined functions: {', '.join(sorted(inlined)) if inlined else 'None'}")
+    if args.o_dfe:
+        removed = program.eliminate_dead_functions()
+        out.message(f"Removed dead functions: {', '.join(sorted(removed)) if removed else 'None'}")
+
+    if args.o_ast:
+        from optimize_node import NodeOptimizer
+        for file_path, ast in program.units.items():
+            program.units[file_path] = NodeOptimizer(ast, program.symbol_tables[file_path]).optimize(
+                constant_folding = True,
+                constant_propagation = True,
+                dead_code_elimination = True
+            )
+
+    # The whole program as one IR file, the units merged into one AST and one listing
+    if args.emit_ir:
+        symbol_info = [symbol for symbol_table in program.symbol_tables.values() for symbol in symbol_table.symbol_info]
+        write_ir_file(args.emit_ir, [node for ast in program.units.values() for node in ast],
+                      [line for tac in program.generate_tac().values() for line in tac], symbol_info, out)
+
+    if args.gen_profile:
+        generate_profile([line for tac in program.generate_tac().values() for line in tac], args.gen_profile, out)
+    if profile:
+        report_stale_functions(profile, [line for tac in program.generate_tac().values() for line in tac], out)
+
+    tac_units = program.generate_tac(
+        constant_folding = args.o_cf,
+        constant_propagation = args.o_cp,
+        dead_code_elimination = args.o_dc,
+        batch_folding = args.o_cf_batch,
+        verify_batch = args.verify_batch,
+        jump_threading = args.o_jt,
+        profile = profile
+    )
+    for file_path, tac in tac_units.items():
+        out.tac(tac, f"Generated 3-Address Code ({file_path}):")
+
+    # Run the whole program, main can be in any unit
+    if args.run:
+        run_tac([line for tac in tac_units.values() for line in tac], "Whole Program", out)
+
+    # Generate Assembly Code, one listing per unit or a single merged one
+    if out.wants('asm'):
+        if args.merge:
+            out.asm(program.generate_assembly(tac_units, merged = True), "Generated x86 Assembly Code (merged):")
         else:
-            print("  No local variables.")
+            for file_path, assembly_code in program.generate_assembly(tac_units).items():
+                out.asm(assembly_code, f"Generated x86 Assembly Code ({file_path}):")
 
-    for scope_level, scope in enumerate(symbol_table.exited_scopes, start=len(symbol_table.scopes)):
-        print(f"\nLocal Variables in Scope Level {scope_level}:")
-        if scope:
-            for var_name, var_type in scope.items():
-                print(f"  {var_name}: {var_type}")
-        else:
-            print("  No local variables.")
+    # One object file for the whole program, labels are already unique across the units
+    if args.emit_obj:
+        write_object_file(program.generate_assembly(tac_units, merged = True), args.emit_obj, out)
 
 
-def read_file(file_path):
-    # Reading in the file
-    with open(file_path, 'r') as file:
-        content = file.read()
+# One file, tokens to assembly
+def compile_file(args, out):
+    file = args.file[0]
+    tokens = read_file(file, args.lex_jobs)
+    if tokens is None:
+        out.message(f"Failed to process file: {file}")
+        return
 
-    lexer = Lexer(TOKEN_TYPES)
-    tokens = lexer.tokenize(content)
+    if out.wants('tokens'):
+        out.tokens(tokens, f"Tokens from file: {file}")
+    else:
+        out.message(f"Tokens generated from file: {file} but not printed. Use -L to list tokens.")
+
+    # Parse the tokens to generate an AST
+    parser = Parser(tokens)
+    ast = parser.parse()
+    out.ast(ast, "Abstract Syntax Tree:")
+    out.symbols(parser.symbol_table)
+
+    # AST Optimization, less TAC is generated from the optimized tree
+    if args.o_ast:
+        from optimize_node import NodeOptimizer
+        before_count = len(ThreeAddressCodeGenerator(ast).generate()) if out.wants('report') else None
+        node_optimizer = NodeOptimizer(ast, parser.symbol_table)
+        ast = node_optimizer.optimize(
+            constant_folding = True,
+            constant_propagation = True,
+            dead_code_elimination = True
+        )
+        out.ast(ast, "Abstract Syntax Tree (After AST Optimization):")
+
+    # Generate Three Address Code from the AST
+    generator = ThreeAddressCodeGenerator(ast)
+    tac = generator.generate()
+
+    if args.o_ast:
+        out.message(f"AST Optimization: {before_count} TAC instructions before, {len(tac)} after")
+
+    # Hand the front end's work to a later back end run
+    if args.emit_ir:
+        write_ir_file(args.emit_ir, ast, tac, parser.symbol_table.symbol_info, out)
+
+    compile_tac(args, out, tac, parser.symbol_table)
+
+
+# Back end only, everything the front end produced is loaded from an IR file
+def compile_ir(args, out):
+    from ir_file import IRFile, LoadedSymbolTable
+    with IRFile(args.from_ir) as ir:
+        tac = ir.tac()
+        ast = ir.ast() if tac is None or out.wants('ast') else None
+        symbol_table = LoadedSymbolTable(ir.symbols())
+    out.message(f"Loaded IR from '{args.from_ir}'")
+    if ast is not None:
+        out.ast(ast, "Abstract Syntax Tree:")
+    # A file without TAC still has the AST to generate it from
+    if tac is None:
+        tac = ThreeAddressCodeGenerator(ast).generate()
+    compile_tac(args, out, tac, symbol_table)
+
+
+# The back end, optimizes the generated TAC, runs it, and converts it to assembly
+def compile_tac(args, out, tac, symbol_table):
+    # Profiles are recorded from and matched against the TAC as generated
+    if args.gen_profile:
+        generate_profile(tac, args.gen_profile, out)
+    profile = load_profile(args.use_profile, out) if args.use_profile else None
+    if profile:
+        report_stale_functions(profile, tac, out)
+
+    # No TAC Optimizations
+    if not (args.o_cf or args.o_cp or args.o_dc or args.o_jt or profile):
+        out.tac(tac, "Generated 3-Address Code:")
+        if args.run:
+            run_tac(tac, "No Optimization", out)
+        generate_code(args, tac, out)
+        return
+
+    out.tac(tac, "Generated 3-Address Code (Before Optimization):")
+
+    # Optimize the Three Address Code
+    from optimize import Optimizer
+    optimizer = Optimizer(tac, symbol_table, profile)
+    optimized_tac = optimizer.optimize(
+        constant_folding = args.o_cf,
+        constant_propagation = args.o_cp,
+        dead_code_elimination = args.o_dc,
+        batch_folding = args.o_cf_batch,
+        verify_batch = args.verify_batch,
+        jump_threading = args.o_jt
+    )
+    out.tac(optimized_tac, "Generated 3-Address Code (After Optimization):")
+
+    # Run both versions to see what the optimizations saved
+    if args.run:
+        before = run_tac(tac, "Before Optimization", out)
+        after = run_tac(optimized_tac, "After Optimization", out)
+        report_savings(before, after, out)
+
+    # Generate Assembly Code for optimized TAC
+    generate_code(args, optimized_tac, out, optimizer.block_counts)
+
+
+# Streaming mode, every function is lowered, optimized, and written as soon as it is parsed and then dropped
+# Tokens are lexed as the parser needs them, so memory depends on the largest function instead of the file
+def compile_stream(args, out):
+    from optimize import Optimizer
+    from optimize_node import NodeOptimizer
+    from assembly import TACtoAssemblyConverter
+    from encoder import X86Encoder
+    file = args.file[0]
+    with open(file, 'r') as source:
+        content = source.read()
+
+    parser = Parser(TokenBuffer.from_text(content), keep_exited_scopes = False)
+    # One generator for the whole file keeps labels unique, just as without streaming
+    generator = ThreeAddressCodeGenerator([])
+    profile = load_profile(args.use_profile, out) if args.use_profile else None
+    optimize = args.o_cf or args.o_cp or args.o_dc or args.o_jt or profile
+    encoder = X86Encoder() if args.emit_obj else None
+    next_label = 1
+    functions = 0
+
+    for item in parser.parse_items():
+        # Once the file is known to have errors nothing more is generated, they are all raised at the end
+        if parser.errors:
+            continue
+        functions += 1
+        name = item[2] if item[0] == 'FunctionDefinition' else item[0]
+        out.ast(item, f"Abstract Syntax Tree ({name}):")
+
+        items = [item]
+        if args.o_ast:
+            items = NodeOptimizer(items, parser.symbol_table).optimize(
+                constant_folding = True,
+                constant_propagation = True,
+                dead_code_elimination = True
+            )
+        generator.ast = items
+        generator.code = []
+        tac = generator.generate()
+
+        block_counts = None
+        if optimize:
+            optimizer = Optimizer(tac, parser.symbol_table, profile)
+            tac = optimizer.optimize(
+                constant_folding = args.o_cf,
+                constant_propagation = args.o_cp,
+                dead_code_elimination = args.o_dc,
+                batch_folding = args.o_cf_batch,
+                verify_batch = args.verify_batch,
+                jump_threading = args.o_jt,
+                first_label = next_label
+            )
+            next_label = optimizer.next_label
+            block_counts = optimizer.block_counts
+        out.tac(tac, f"Generated 3-Address Code ({name}):")
+
+        if out.wants('asm') or encoder:
+            assembly_code = TACtoAssemblyConverter(tac, block_counts).convert()
+            out.asm(assembly_code, f"Generated x86 Assembly Code ({name}):")
+            if encoder:
+                for line in assembly_code.splitlines():
+                    encoder.encode_line(line)
+
+    out.symbols(parser.symbol_table)
+    out.message(f"Streamed {functions} top-level items from file: {file}")
+    if encoder:
+        encoder.resolve_fixups()
+        encoder.write_object(args.emit_obj)
+        out.message(f"Wrote {len(encoder.code)} bytes of machine code to '{args.emit_obj}'")
+
+
+def function_index_lines(index):
+    lines = []
+    for function_name, function in index.items():
+        param_list = ", ".join(f"{param_type} {param_name}" for param_type, param_name in function["parameters"])
+        lines.append(f"  {function['return_type']} {function_name}({param_list})  [{function['file']}]")
+    return lines
+
+
+# Runs TAC in the virtual machine and reports how often every block ran
+def run_tac(tac, title, out):
+    from tac_vm import TACVirtualMachine
+    vm = TACVirtualMachine(tac)
+    result = vm.run()
+    execution = {
+        "result": result,
+        "instructions": vm.instruction_count(),
+        "blocks": [{"function": function, "block": label, "runs": count, "instructions": instructions}
+                   for function, label, count, instructions in vm.block_report()]
+    }
+    out.emit('report', f"Execution ({title}):", execution, execution_lines)
+    return vm
+
+
+def execution_lines(execution):
+    lines = [f"{'Function':<15} {'Block':<15} {'Runs':>10} {'Instructions':>14}"]
+    for block in execution["blocks"]:
+        lines.append(f"{block['function']:<15} {block['block']:<15} {block['runs']:>10} {block['instructions']:>14}")
+    lines.append(f"main returned {execution['result']}, {execution['instructions']} TAC instructions executed")
+    return lines
+
+
+# Runs the unoptimized TAC and saves how often every block ran, for a later compile with --use-profile
+def generate_profile(tac, path, out):
+    from tac_vm import TACVirtualMachine
+    from profile_data import Profile
+    vm = TACVirtualMachine(tac)
+    result = vm.run()
+    Profile.from_vm(vm).save(path)
+    out.message(f"Profiled run returned {result}, {vm.instruction_count()} TAC instructions executed, wrote '{path}'")
+
+
+def load_profile(path, out):
+    from profile_data import Profile
+    profile = Profile.load(path)
+    out.message(f"Using profile '{path}' ({len(profile.functions)} functions)")
+    return profile
+
+
+# Functions the profile has no counts for are compiled as without one
+def report_stale_functions(profile, tac, out):
+    stale = profile.stale_functions(tac)
+    if stale:
+        out.message(f"Profile does not match functions: {', '.join(stale)}")
+
+
+# Reports the executed instructions optimization saved, in total and per function
+def report_savings(before, after, out):
+    after_functions = after.function_counts()
+    savings = {
+        "before": before.instruction_count(),
+        "after": after.instruction_count(),
+        "functions": {function: [count, after_functions.get(function, 0)]
+                      for function, count in before.function_counts().items()}
+    }
+    out.emit('report', "Optimization Savings:", savings, savings_lines)
+
+
+def savings_lines(savings):
+    before_count = savings["before"]
+    saved = before_count - savings["after"]
+    lines = [f"Optimization saved {saved} of {before_count} executed TAC instructions "
+             f"({100 * saved / before_count if before_count else 0:.1f}%)"]
+    for function, (count, after_count) in savings["functions"].items():
+        lines.append(f"  {function:<15} {count:>10} -> {after_count}")
+    return lines
+
+
+# Converts TAC to assembly, writes the listing and/or encodes it into an object file
+def generate_code(args, tac, out, block_counts = None):
+    if not (out.wants('asm') or args.emit_obj):
+        return
+    from assembly import TACtoAssemblyConverter
+    assembly_code = TACtoAssemblyConverter(tac, block_counts).convert()
+    out.asm(assembly_code, "Generated x86 Assembly Code:")
+    if args.emit_obj:
+        write_object_file(assembly_code, args.emit_obj, out)
+
+
+def write_ir_file(path, ast, tac, symbol_info, out):
+    from ir_file import write_ir
+    writer = write_ir(path, ast, tac, symbol_info)
+    out.message(f"Wrote IR with {len(writer.kinds)} AST nodes and {len(tac)} TAC lines to '{path}'")
+
+
+# Encodes an assembly listing to machine code and writes it as a relocatable ELF object
+def write_object_file(assembly_code, path, out):
+    from encoder import X86Encoder
+    encoder = X86Encoder()
+    code = encoder.assemble(assembly_code.splitlines())
+    encoder.write_object(path)
+    out.message(f"Wrote {len(code)} bytes of machine code to '{path}'")
+
+
+# Artifacts to write, nothing but what --emit, -L, and --gen-asm ask for unless --verbose wants the classic listing
+# Reports are part of the verbose listing, and of --run, which is asked for to see them
+def selected_artifacts(args):
+    if args.emit is not None:
+        artifacts = set(args.emit)
+    elif args.verbose:
+        artifacts = {'ast', 'symbols', 'tac'}
+    else:
+        artifacts = set()
+    if args.list_tokens:
+        artifacts.add('tokens')
+    if args.gen_asm:
+        artifacts.add('asm')
+    if args.verbose or args.run:
+        artifacts.add('report')
+    return artifacts
 
-    return tokens
+
+# --emit=tokens,ast,tac,asm
+def artifact_list(text):
+    artifacts = [artifact.strip() for artifact in text.split(",") if artifact.strip()]
+    unknown = [artifact for artifact in artifacts if artifact not in EMITTABLE]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown artifact(s) {', '.join(unknown)}, choose from {', '.join(EMITTABLE)}")
+    return artifacts
 
 
 def main():
     # Setting up the Argument Parser
     parser = argparse.ArgumentParser(description='Process a file through the lexer.')
-    parser.add_argument('file', type = str, help = 'The file to be processed.')
+    parser.add_argument('file', type = str, nargs = '*', help = 'The file(s) to be processed, more than one compiles the whole program.')
     # List Tokens Generated
     parser.add_argument('-L', '--list-tokens', action = 'store_true', help = 'Print the list of tokens.')
+    # Streaming, one function at a time from parsing to output
+    parser.add_argument('--stream', action = 'store_true', help = 'Compile and write each function as soon as it is parsed.')
+    # Parallel Lexing of large files
+    parser.add_argument('-j', '--lex-jobs', type = int, default = 1, metavar = 'N', help = 'Lex large files in N processes (0 for one per CPU).')
+    # AST Optimizations (folding, propagation, and dead code on the tree, before TAC is generated)
+    parser.add_argument('--o-ast', action = 'store_true', help = 'Enable AST-level optimization before TAC generation.')
     # Constant Folding Optimization
     parser.add_argument('--o-cf', action = 'store_true', help = 'Enable constant folding optimization.')
+    # Batch Constant Folding (NumPy, falls back to the scalar folder when it is not installed)
+    parser.add_argument('--o-cf-batch', action = 'store_true', help = 'Fold literal operations in one vectorized batch (implies --o-cf).')
+    parser.add_argument('--verify-batch', action = 'store_true', help = 'Check batch folding against the scalar folder.')
     # Constant Propagation Optimization
     parser.add_argument('--o-cp', action = 'store_true', help = 'Enable constant propagation optimization')
     # Dead Code Elimination Optimization
     parser.add_argument('--o-dc', action = 'store_true', help = 'Enable dead code elimination optimization.')
+    # Jump Threading and Branch Simplification
+    parser.add_argument('--o-jt', action = 'store_true', help = 'Enable jump threading and branch simplification.')
     # Assembly Code Generation
     parser.add_argument('--gen-asm', action = 'store_true', help = 'Generate assembly code from TAC.')
-    
+    # Run the TAC in the virtual machine
+    parser.add_argument('--run', action = 'store_true', help = 'Run the TAC and count the instructions executed per block.')
+    # Machine Code Generation, the assembly is encoded without an external assembler
+    parser.add_argument('--emit-obj', metavar = 'FILE', help = 'Encode the assembly into a relocatable ELF object file.')
+    # Whole-Program Options
+    parser.add_argument('--o-inline', action = 'store_true', help = 'Inline small functions across files.')
+    parser.add_argument('--o-dfe', action = 'store_true', help = 'Remove functions unreachable from main.')
+    parser.add_argument('--merge', action = 'store_true', help = 'Merge the assembly of every file into one listing.')
+    # Profile-Guided Optimization
+    parser.add_argument('--gen-profile', metavar = 'FILE', help = 'Run the program and write its block counts to FILE.')
+    parser.add_argument('--use-profile', metavar = 'FILE', help = 'Use block counts for layout, unrolling, inlining, and registers.')
+    # Binary IR, the front end and back end as separate runs
+    parser.add_argument('--emit-ir', metavar = 'FILE', help = 'Write the AST and generated TAC to a binary IR file.')
+    parser.add_argument('--from-ir', metavar = 'FILE', help = 'Skip lexing and parsing, start from a binary IR file.')
+    # Output, what is written, where, and how
+    parser.add_argument('--emit', type = artifact_list, metavar = 'LIST', help = f'Artifacts to write, any of {",".join(EMITTABLE)}.')
+    verbosity = parser.add_mutually_exclusive_group()
+    verbosity.add_argument('-q', '--quiet', action = 'store_true', help = 'Write nothing but the selected artifacts and errors (the default).')
+    verbosity.add_argument('-v', '--verbose', action = 'store_true', help = 'Write the AST, symbol table, TAC, and reports as well.')
+    parser.add_argument('-o', '--output', metavar = 'FILE', help = 'Write the output to FILE instead of stdout.')
+    parser.add_argument('--format', choices = FORMATS, default = 'text', help = 'Output format, text or compact json/ndjson.')
+
     # Parse the above added arguments
     args = parser.parse_args()
-    file = args.file
+    if args.o_cf_batch:
+        args.o_cf = True
+    if bool(args.file) == bool(args.from_ir):
+        parser.error("give either source files or --from-ir")
+    # Streaming never has the whole program at once
+    if args.stream:
+        whole_program = [option for option, used in (('--run', args.run), ('--gen-profile', args.gen_profile),
+                                                      ('--emit-ir', args.emit_ir), ('--from-ir', args.from_ir),
+                                                      ('-L', args.list_tokens), ('more than one file', len(args.file) > 1))
+                         if used]
+        if whole_program or (args.emit and 'tokens' in args.emit):
+            parser.error(f"--stream cannot be used with {', '.join(whole_program) or '--emit=tokens'}")
+
+    artifacts = selected_artifacts(args)
+    # A single artifact is written as just itself, e.g. an assembly file
+    out = OutputWriter(artifacts, args.format, args.output, titles = len(artifacts) > 1 or 'report' in artifacts)
     try:
-        tokens = read_file(file)
-        
-        # Print the tokens
-        if tokens is not None:
-            if args.list_tokens:
-                print(f"Tokens from file: {file}")
-                print_tokens(tokens)
-            # If flag is not used, just generate the tokens
-            else:
-                print(f"Tokens generated from file: {file} but not printed. Use -L to list tokens.")
-
-            # Parse the tokens to generate an AST
-            parser = Parser(tokens) 
-            ast = parser.parse()
-
-            # Print the AST before Optimization
-            print('-' * 50)
-            print("Abstract Syntax Tree:")
-            print('-' * 50)
-            print_ast(ast)
-            print('-' * 50)
-
-            # Print the symbol table
-            print_symboltable(parser.symbol_table)
-
-            # Generate Three Address Code from the AST
-            generator = ThreeAddressCodeGenerator(ast)
-            tac = generator.generate()
-
-            # Optimization
-            if args.o_cf or args.o_cp or args.o_dc:
-
-                # Print the TAC before optimization
-                print('-' * 50)
-                print("Generated 3-Address Code (Before Optimization):")
-                print('-' * 50)
-                for line in tac:
-                    print(line)
-
-                # Optimize the Three Address Code
-                optimizer = Optimizer(tac)
-                optimized_tac = optimizer.optimize(
-                    constant_folding = args.o_cf,
-                    constant_propagation = args.o_cp,
-                    dead_code_elimination = args.o_dc
-                )
-                
-                # Print the TAC after optimization
-                print('-' * 50)
-                print("Generated 3-Address Code (After Optimization):")
-                print('-' * 50)
-                for line in optimized_tac:
-                    print(line)
-                print('-' * 50)
-
-                # Generate Assembly Code for optimized TAC
-                if args.gen_asm:
-                    print("Generated x86 Assembly Code:")
-                    print('-' * 50)
-                    converter = TACtoAssemblyConverter(optimized_tac)
-                    assembly_code = converter.convert()
-                    print(assembly_code)
-                    print('-' * 50)
-
-            # No TAC Optimizations
-            else:
-                print('-' * 50)
-                print("Generated 3-Address Code:")
-                print('-' * 50)
-                for line in tac:
-                    print(line)
-
-                # Generate Assembly Code
-                if args.gen_asm:
-                    print("Generated x86 Assembly Code:")
-                    print('-' * 50)
-                    converter = TACtoAssemblyConverter(tac)
-                    assembly_code = converter.convert()
-                    print(assembly_code)
-                    print('-' * 50)
-
+        if args.from_ir:
+            succeeded = compile_from_ir(args, out)
+        elif len(args.file) > 1:
+            succeeded = compile_files(args, out)
         else:
-            print(f"Failed to process file: {file}")
+            succeeded = compile_single(args, out)
+    finally:
+        out.close()
+    if not succeeded:
+        sys.exit(1)
+
+
+# The compile_ functions write any error through the writer and return whether the compile succeeded
+def compile_files(args, out):
+    files = ", ".join(args.file)
+    try:
+        compile_program(args, out)
+        return True
+    except ParseError as e:
+        out.diagnostics(e.filename, e.diagnostics)
+    except SyntaxError as e:
+        out.error(f"Syntax error in files '{files}': {e}")
+    except NameError as e:
+        out.error(f"Error while linking files '{files}': {e}")
+    except FileNotFoundError as e:
+        out.error(f"Error: File '{e.filename}' not found.")
+    except Exception as e:
+        out.error(f"An error occurred while processing '{files}': {e}")
+    return False
+
+
+def compile_from_ir(args, out):
+    try:
+        compile_ir(args, out)
+        return True
+    except FileNotFoundError:
+        out.error(f"Error: File '{args.from_ir}' not found.")
+    except Exception as e:
+        out.error(f"An error occurred while processing '{args.from_ir}': {e}")
+    return False
+
+
+def compile_single(args, out):
+    file = args.file[0]
+    try:
+        compile_stream(args, out) if args.stream else compile_file(args, out)
+        return True
+    except ParseError as e:
+        out.diagnostics(file, e.diagnostics)
     except SyntaxError as e:
-        print(f"Syntax error in file '{file}': {e}")
+        out.error(f"Syntax error in file '{file}': {e}")
     except FileNotFoundError:
-        print(f"Error: File '{file}' not found.")
+        out.error(f"Error: File '{file}' not found.")
     except Exception as e:
-        print(f"An error occurred while processing '{file}': {e}")
+        out.error(f"An error occurred while processing '{file}': {e}")
+    return False
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,120 @@
+# Author: Thomas Lander
+# Date: 10/19/26
+# constant_eval.py
+
+# Constant evaluation with C semantics, shared by the AST and TAC optimizers
+#   - int is 32 bits and wraps around on overflow
+#   - integer division truncates toward zero, and % takes the sign of the left operand
+#   - an int and a float together are computed as floats
+# Every function returns None when the expression cannot be folded (division by zero, % on floats, ...)
+
+INT_BITS = 32
+INT_MIN = -(1 << (INT_BITS - 1))
+INT_MAX = (1 << (INT_BITS - 1)) - 1
+
+ARITHMETIC_OPERATORS = {'+', '-', '*', '/', '%'}
+COMPARISON_OPERATORS = {'<', '>', '<=', '>=', '==', '!='}
+LOGICAL_OPERATORS = {'&&', '||'}
+BINARY_OPERATORS = ARITHMETIC_OPERATORS | COMPARISON_OPERATORS | LOGICAL_OPERATORS
+INTEGER_TYPES = ('int', 'char', 'short', 'long')
+FLOAT_TYPES = ('float', 'double')
+
+# The comparison that is true exactly when the given one is false, and the one that gives the same result when
+# the operands are swapped
+NEGATED_COMPARISONS = {'<': '>=', '>': '<=', '<=': '>', '>=': '<', '==': '!=', '!=': '=='}
+SWAPPED_COMPARISONS = {'<': '>', '>': '<', '<=': '>=', '>=': '<=', '==': '==', '!=': '!='}
+
+
+# Wraps an integer into the 32-bit int range
+def wrap_int(value):
+    return ((value - INT_MIN) & ((1 << INT_BITS) - 1)) + INT_MIN
+
+
+# Converts a value to the given declared type, the same as assigning it to a variable of that type
+def convert(value, var_type):
+    if var_type in INTEGER_TYPES:
+        return wrap_int(int(value))  # int() truncates floats toward zero
+    elif var_type in FLOAT_TYPES:
+        return float(value)
+    return value
+
+
+# Reads a constant out of a TAC operand, returns None if it is not a number
+def parse_constant(text):
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        value = float(text)
+    except ValueError:
+        return None
+    # inf and nan are not literals this compiler produces
+    return value if value - value == 0 else None
+
+
+# Writes a constant back out as a TAC operand
+def format_constant(value):
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+# Evaluates "left operator right"
+def evaluate_binary(operator, left, right):
+    if operator in COMPARISON_OPERATORS:
+        if operator == '<':
+            return int(left < right)
+        elif operator == '>':
+            return int(left > right)
+        elif operator == '<=':
+            return int(left <= right)
+        elif operator == '>=':
+            return int(left >= right)
+        elif operator == '==':
+            return int(left == right)
+        return int(left != right)
+
+    if operator in LOGICAL_OPERATORS:
+        if operator == '&&':
+            return int(left != 0 and right != 0)
+        return int(left != 0 or right != 0)
+
+    if operator not in ARITHMETIC_OPERATORS:
+        return None
+
+    # Usual arithmetic conversions, a float operand makes it a float operation
+    if isinstance(left, float) or isinstance(right, float):
+        left, right = float(left), float(right)
+        if operator == '+':
+            return left + right
+        elif operator == '-':
+            return left - right
+        elif operator == '*':
+            return left * right
+        elif operator == '/' and right != 0:
+            return left / right
+        return None
+
+    if operator == '+':
+        return wrap_int(left + right)
+    elif operator == '-':
+        return wrap_int(left - right)
+    elif operator == '*':
+        return wrap_int(left * right)
+
+    if right == 0:
+        return None
+    quotient = abs(left) // abs(right)
+    if (left < 0) != (right < 0):
+        quotient = -quotient
+    if operator == '/':
+        return wrap_int(quotient)
+    return left - right * quotient
+
+
+# Evaluates a prefix "operator value"
+def evaluate_unary(operator, value):
+    if operator == '-':
+        return -value if isinstance(value, float) else wrap_int(-value)
+    elif operator == '!':
+        return int(value == 0)
+    return None
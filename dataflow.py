@@ -0,0 +1,424 @@
+# Author: Thomas Lander
+# Date: 10/19/26
+# dataflow.py
+
+# Dataflow analysis over the basic blocks of a 3-Address Code listing
+# Sets of variables, definitions, or expressions are Python ints used as bitsets, bit i is the item with id i.
+# Union, intersection, and difference are then |, &, and & ~, which stay fast with tens of thousands of items.
+
+from heapq import heappop, heappush
+
+# Words in TAC that are never variables
+TAC_KEYWORDS = {'if', 'goto', 'CALL', 'PARAM', 'RETURN', 'BEGIN', 'END', 'UNINITIALIZED'}
+
+
+# Splits a TAC line into (kind, defined variable, used variables, jump target)
+# kind is one of 'begin', 'end', 'label', 'assign', 'call', 'branch', 'jump', 'table', 'return', 'param'
+# The target of a table is the tuple of its case labels followed by its default label
+def parse_instruction(line):
+    if line.endswith(" BEGIN"):
+        # Parameters are defined on entry to the function
+        params = line[line.index("(") + 1:line.rindex(")")]
+        return 'begin', [name.strip() for name in params.split(",") if name.strip()], [], None
+    if line.endswith(" END"):
+        return 'end', [], [], None
+    if " = " in line:
+        var, expr = line.split(" = ", 1)
+        parts = expr.split(" ")
+        if parts[0] == "CALL":
+            # Arguments are used by the PARAM lines before the call
+            return 'call', [var], [], None
+        return 'assign', [var], [part for part in parts if part.isidentifier() and part not in TAC_KEYWORDS], None
+    parts = line.split()
+    if parts[0] in ("if", "ifFalse"):
+        return 'branch', [], [part for part in parts[1:-2] if part.isidentifier()], parts[-1]
+    if parts[0] == "goto":
+        return 'jump', [], [], parts[1]
+    if parts[0] == "switch":
+        value, _, labels, default = parse_table(line)
+        return 'table', [], [value] if value.isidentifier() else [], tuple(labels) + (default,)
+    if parts[0] == "RETURN":
+        return 'return', [], [part for part in parts[1:] if part.isidentifier()], None
+    if parts[0] == "PARAM":
+        return 'param', [], [part for part in parts[1:] if part.isidentifier()], None
+    if line.endswith(":"):
+        return 'label', [], [], line[:-1]
+    return 'other', [], [], None
+
+
+# Splits a branch "if t1 goto L1" or "ifFalse a < b goto L1" into (branch, condition, target label)
+# The condition is a list, either one value or a comparison [a, op, b] that is tested without being stored
+def parse_branch(line):
+    parts = line.split(" ")
+    return parts[0], parts[1:-2], parts[-1]
+
+
+def format_branch(branch, condition, target):
+    return f"{branch} {' '.join(condition)} goto {target}"
+
+
+# Splits a jump table "switch x 10 L3 L4 L5 else L6" into (value, lowest case, case labels, default label)
+# x == 10 jumps to L3, x == 11 to L4, x == 12 to L5, and any other value to L6
+def parse_table(line):
+    parts = line.split(" ")
+    return parts[1], int(parts[2]), parts[3:-2], parts[-1]
+
+
+def format_table(value, low, labels, default):
+    return f"switch {value} {low} {' '.join(labels)} else {default}"
+
+
+# Labels a parsed instruction can jump to
+def jump_targets(instruction):
+    kind, _, _, target = instruction
+    if kind in ('branch', 'jump'):
+        return (target,)
+    if kind == 'table':
+        return target
+    return ()
+
+
+# Gives every name a small integer id, so a set of names can be a bitset
+class VariableIndex:
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+
+    # Id of a name, new names get the next free id
+    def intern(self, name):
+        var_id = self.ids.get(name)
+        if var_id is None:
+            var_id = len(self.names)
+            self.ids[name] = var_id
+            self.names.append(name)
+        return var_id
+
+    # Bitset holding the given names
+    def bits(self, names):
+        bits = 0
+        for name in names:
+            bits |= 1 << self.intern(name)
+        return bits
+
+    # Names in a bitset, lowest id first
+    def members(self, bits):
+        names = []
+        while bits:
+            low = bits & -bits
+            names.append(self.names[low.bit_length() - 1])
+            bits ^= low
+        return names
+
+
+# A run of instructions that is only entered at the top and only left at the bottom
+class BasicBlock:
+    def __init__(self, index, start, end):
+        self.index = index
+        self.start = start  # First line of the block in the TAC
+        self.end = end  # One past the last line
+        self.successors = []
+        self.predecessors = []
+
+
+# Basic blocks and the edges between them, for one TAC listing (which may hold several functions)
+class ControlFlowGraph:
+    def __init__(self, tac):
+        self.tac = tac
+        self.instructions = [parse_instruction(line) for line in tac]
+        self.variables = VariableIndex()
+        self.blocks = []
+        self.label_blocks = {}  # Label -> block that starts with it
+        self.build_blocks()
+        self.build_edges()
+
+
+    # A new block starts at every label and function entry, and after every jump, table, return, and function end
+    def build_blocks(self):
+        start = 0
+        for line_number, (kind, _, _, target) in enumerate(self.instructions):
+            if kind in ('label', 'begin') and line_number > start:
+                self.add_block(start, line_number)
+                start = line_number
+            if kind == 'label':
+                self.label_blocks[target] = len(self.blocks)
+            if kind in ('branch', 'jump', 'table', 'return', 'end'):
+                self.add_block(start, line_number + 1)
+                start = line_number + 1
+        if start < len(self.tac):
+            self.add_block(start, len(self.tac))
+
+
+    # Helper to append a block covering lines [start, end)
+    def add_block(self, start, end):
+        self.blocks.append(BasicBlock(len(self.blocks), start, end))
+
+
+    # Falls through to the next block unless the block ends in a jump, table, return, or function end
+    def build_edges(self):
+        for block in self.blocks:
+            instruction = self.instructions[block.end - 1]
+            kind = instruction[0]
+            for target in jump_targets(instruction):
+                if target in self.label_blocks and self.label_blocks[target] not in block.successors:
+                    block.successors.append(self.label_blocks[target])
+            if kind not in ('jump', 'table', 'return', 'end') and block.index + 1 < len(self.blocks):
+                next_block = block.index + 1
+                # A function entry is never reached by falling off the previous function
+                if self.instructions[self.blocks[next_block].start][0] != 'begin' and next_block not in block.successors:
+                    block.successors.append(next_block)
+        for block in self.blocks:
+            for successor in block.successors:
+                self.blocks[successor].predecessors.append(block.index)
+
+
+    # Name of every block: the function name for an entry, its label, or for a block that is only fallen into
+    # the last name before it with a counter ("L3.1"), so names do not shift when lines are added elsewhere
+    def block_names(self):
+        names = []
+        last_name = None
+        unnamed = 0
+        for block in self.blocks:
+            kind, _, _, target = self.instructions[block.start]
+            if kind == 'begin':
+                last_name = self.tac[block.start].split("(")[0]
+                unnamed = 0
+                names.append(last_name)
+            elif kind == 'label':
+                last_name = target
+                unnamed = 0
+                names.append(last_name)
+            else:
+                unnamed += 1
+                names.append(f"{last_name}.{unnamed}")
+        return names
+
+
+    # Blocks in reverse postorder from every function entry, unreachable blocks come last
+    def reverse_postorder(self):
+        visited = [False] * len(self.blocks)
+        order = []
+        roots = [block.index for block in self.blocks
+                 if block.index == 0 or self.instructions[block.start][0] == 'begin']
+        for root in roots:
+            if visited[root]:
+                continue
+            visited[root] = True
+            stack = [(root, iter(self.blocks[root].successors))]
+            while stack:
+                block, successors = stack[-1]
+                for successor in successors:
+                    if not visited[successor]:
+                        visited[successor] = True
+                        stack.append((successor, iter(self.blocks[successor].successors)))
+                        break
+                else:
+                    stack.pop()
+                    order.append(block)
+        order.reverse()
+        return order + [block for block in range(len(self.blocks)) if not visited[block]]
+
+
+    # Strongly connected components (loops) in topological order, found with an iterative Tarjan
+    def components(self):
+        count = len(self.blocks)
+        index = [None] * count
+        lowlink = [0] * count
+        on_stack = [False] * count
+        stack = []
+        components = []
+        next_index = 0
+
+        for root in range(count):
+            if index[root] is not None:
+                continue
+            index[root] = lowlink[root] = next_index
+            next_index += 1
+            stack.append(root)
+            on_stack[root] = True
+            work = [(root, iter(self.blocks[root].successors))]
+            while work:
+                block, successors = work[-1]
+                for successor in successors:
+                    if index[successor] is None:
+                        index[successor] = lowlink[successor] = next_index
+                        next_index += 1
+                        stack.append(successor)
+                        on_stack[successor] = True
+                        work.append((successor, iter(self.blocks[successor].successors)))
+                        break
+                    elif on_stack[successor]:
+                        lowlink[block] = min(lowlink[block], index[successor])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[block])
+                    if lowlink[block] == index[block]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack[member] = False
+                            component.append(member)
+                            if member == block:
+                                break
+                        components.append(component)
+
+        # Tarjan finds the components in reverse topological order
+        components.reverse()
+        return components
+
+
+    # Order to visit blocks in for a forward analysis, every loop is finished before the code after it
+    # Loops come in topological order, and the blocks inside one loop in reverse postorder
+    def analysis_order(self):
+        position = [0] * len(self.blocks)
+        for rank, block in enumerate(self.reverse_postorder()):
+            position[block] = rank
+        order = []
+        for component in self.components():
+            order.extend(sorted(component, key = position.__getitem__))
+        return order
+
+
+# Generic iterative solver
+# gen/kill hold one bitset per block, the transfer function is out = gen | (in & ~kill) in the direction of the analysis
+# meet is 'union' (may analyses) or 'intersection' (must analyses), universe is the bitset of every item
+# Returns (in, out) per block, in is always the value at the top of the block and out at the bottom
+def solve(cfg, gen, kill, direction = 'forward', meet = 'union', universe = 0, boundary = 0):
+    count = len(cfg.blocks)
+    initial = universe if meet == 'intersection' else 0
+    block_in = [initial] * count
+    block_out = [initial] * count
+
+    order = cfg.analysis_order()
+    if direction == 'backward':
+        order.reverse()
+    forward = direction == 'forward'
+    position = [0] * count
+    for index, block_index in enumerate(order):
+        position[block_index] = index
+
+    # Worklist ordered by position in the analysis order, blocks are only revisited when an input changed
+    # Changes only flow forward in that order except inside a loop, so a loop settles before the code after it runs
+    worklist = list(range(count))
+    pending = [True] * count
+    while worklist:
+        block_index = order[heappop(worklist)]
+        pending[block_index] = False
+        block = cfg.blocks[block_index]
+        sources = block.predecessors if forward else block.successors
+
+        # Meet over the incoming edges, blocks without any (entries, or exits going backward) take the boundary
+        if not sources:
+            value = boundary
+        elif meet == 'union':
+            value = 0
+            for source in sources:
+                value |= block_out[source] if forward else block_in[source]
+        else:
+            value = universe
+            for source in sources:
+                value &= block_out[source] if forward else block_in[source]
+
+        result = gen[block_index] | (value & ~kill[block_index])
+        if forward:
+            block_in[block_index] = value
+            changed = result != block_out[block_index]
+            block_out[block_index] = result
+            targets = block.successors
+        else:
+            block_out[block_index] = value
+            changed = result != block_in[block_index]
+            block_in[block_index] = result
+            targets = block.predecessors
+
+        if changed:
+            for target in targets:
+                if not pending[target]:
+                    pending[target] = True
+                    heappush(worklist, position[target])
+
+    return block_in, block_out
+
+
+# Liveness, the variables whose current value may still be read later
+# Returns (live_in, live_out) bitsets per block, over cfg.variables
+def liveness(cfg):
+    variables = cfg.variables
+    gen = []
+    kill = []
+    for block in cfg.blocks:
+        used = 0
+        defined = 0
+        # Walking backwards, a use before any definition in the block is upward exposed
+        for line_number in range(block.end - 1, block.start - 1, -1):
+            _, defs, uses, _ = cfg.instructions[line_number]
+            def_bits = variables.bits(defs)
+            used = (used & ~def_bits) | variables.bits(uses)
+            defined |= def_bits
+        gen.append(used)
+        kill.append(defined)
+    return solve(cfg, gen, kill, direction = 'backward', meet = 'union')
+
+
+# Reaching definitions, the assignments whose value may still be held at a point
+# A definition is a line number, returns (reach_in, reach_out) bitsets per block over line numbers
+def reaching_definitions(cfg):
+    # Every definition of each variable, so one assignment can kill all the others
+    definitions = {}
+    for line_number, (_, defs, _, _) in enumerate(cfg.instructions):
+        for var in defs:
+            definitions[var] = definitions.get(var, 0) | (1 << line_number)
+
+    gen = []
+    kill = []
+    for block in cfg.blocks:
+        generated = 0
+        killed = 0
+        for line_number in range(block.start, block.end):
+            for var in cfg.instructions[line_number][1]:
+                killed |= definitions[var]
+                generated = (generated & ~definitions[var]) | (1 << line_number)
+        gen.append(generated)
+        kill.append(killed)
+    return solve(cfg, gen, kill, direction = 'forward', meet = 'union')
+
+
+# Available expressions, the "a op b" computations that have already been done on every path with
+# unchanged operands. Returns (expressions, avail_in, avail_out), expressions is a VariableIndex of the
+# expression strings that the bitsets refer to.
+def available_expressions(cfg):
+    expressions = VariableIndex()
+    operand_uses = {}  # Variable -> bitset of the expressions that read it
+
+    # Intern every binary expression that is computed somewhere
+    computed = [None] * len(cfg.tac)
+    for line_number, (kind, _, uses, _) in enumerate(cfg.instructions):
+        if kind == 'assign':
+            parts = cfg.tac[line_number].split(" = ", 1)[1].split(" ")
+            if len(parts) == 3:
+                expression_id = expressions.intern(" ".join(parts))
+                computed[line_number] = expression_id
+                for var in uses:
+                    operand_uses[var] = operand_uses.get(var, 0) | (1 << expression_id)
+
+    gen = []
+    kill = []
+    for block in cfg.blocks:
+        generated = 0
+        killed = 0
+        for line_number in range(block.start, block.end):
+            expression_id = computed[line_number]
+            if expression_id is not None:
+                generated |= 1 << expression_id
+            # Assigning a variable kills every expression that reads it, including one computed just now
+            for var in cfg.instructions[line_number][1]:
+                killed |= operand_uses.get(var, 0)
+                generated &= ~operand_uses.get(var, 0)
+        gen.append(generated)
+        kill.append(killed)
+
+    universe = (1 << len(expressions.names)) - 1
+    avail_in, avail_out = solve(cfg, gen, kill, direction = 'forward', meet = 'intersection',
+                                universe = universe, boundary = 0)
+    return expressions, avail_in, avail_out
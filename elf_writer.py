@@ -0,0 +1,118 @@
+# Author: Thomas Lander
+# Date: 10/19/26
+# elf_writer.py
+
+# Writes machine code out as a relocatable x86-64 ELF object (.o) that ld or cc can link
+# Sections: null, .text, .rela.text, .symtab, .strtab, .shstrtab, .note.GNU-stack
+# The empty .note.GNU-stack tells the linker the code does not need an executable stack
+
+import struct
+
+ELF_HEADER_SIZE = 64
+SECTION_HEADER_SIZE = 64
+SYMBOL_SIZE = 24
+RELOCATION_SIZE = 24
+
+# Section types
+SHT_PROGBITS = 1
+SHT_SYMTAB = 2
+SHT_STRTAB = 3
+SHT_RELA = 4
+# Section flags
+SHF_ALLOC = 0x2
+SHF_EXECINSTR = 0x4
+SHF_INFO_LINK = 0x40
+# Symbol binding and type
+STB_LOCAL = 0
+STB_GLOBAL = 1
+STT_NOTYPE = 0
+STT_FUNC = 2
+STT_SECTION = 3
+
+TEXT_SECTION = 1
+SHSTRTAB_SECTION = 5
+
+
+# Helper to build a string table, returns the offset of every added name
+class StringTable:
+    def __init__(self):
+        self.data = bytearray(b'\x00')
+        self.offsets = {'': 0}
+
+    def add(self, name):
+        if name not in self.offsets:
+            self.offsets[name] = len(self.data)
+            self.data += name.encode() + b'\x00'
+        return self.offsets[name]
+
+
+# code: the .text bytes, labels: label -> offset in the code, global_symbols: labels to export as functions
+# relocations: (offset, symbol, type, addend), symbols not in labels are left undefined for the linker
+def write_elf_object(path, code, labels, global_symbols, relocations):
+    strtab = StringTable()
+    shstrtab = StringTable()
+
+    # ELF wants every local symbol before the first global one
+    exported = set(global_symbols)
+    symbols = [(0, 0, 0, 0, 0), (0, (STB_LOCAL << 4) | STT_SECTION, TEXT_SECTION, 0, 0)]
+    for label, offset in labels.items():
+        if label not in exported:
+            symbols.append((strtab.add(label), (STB_LOCAL << 4) | STT_NOTYPE, TEXT_SECTION, offset, 0))
+    first_global = len(symbols)
+
+    # A function runs up to the start of the next one
+    starts = sorted(labels[name] for name in global_symbols) + [len(code)]
+    symbol_index = {}
+    for name in global_symbols:
+        start = labels[name]
+        size = min(end for end in starts if end > start) - start if start < len(code) else 0
+        symbol_index[name] = len(symbols)
+        symbols.append((strtab.add(name), (STB_GLOBAL << 4) | STT_FUNC, TEXT_SECTION, start, size))
+    for _, name, _, _ in relocations:
+        if name not in symbol_index:
+            if name in labels:
+                raise ValueError(f"Relocation against local label '{name}'")
+            symbol_index[name] = len(symbols)
+            symbols.append((strtab.add(name), (STB_GLOBAL << 4) | STT_NOTYPE, 0, 0, 0))
+
+    symtab = b''.join(struct.pack('<IBBHQQ', name, info, 0, section, value, size)
+                      for name, info, section, value, size in symbols)
+    rela = b''.join(struct.pack('<QQq', offset, (symbol_index[name] << 32) | kind, addend)
+                    for offset, name, kind, addend in relocations)
+
+    # Section contents, in file order after the ELF header
+    names = [shstrtab.add(name) for name in ('.text', '.rela.text', '.symtab', '.strtab', '.shstrtab', '.note.GNU-stack')]
+    contents = [bytes(code), rela, symtab, bytes(strtab.data), bytes(shstrtab.data), b'']
+    offsets = []
+    body = bytearray()
+    for data in contents:
+        body += b'\x00' * (-(ELF_HEADER_SIZE + len(body)) % 16)
+        offsets.append(ELF_HEADER_SIZE + len(body))
+        body += data
+    body += b'\x00' * (-(ELF_HEADER_SIZE + len(body)) % 8)
+    section_headers_offset = ELF_HEADER_SIZE + len(body)
+
+    # name, type, flags, addr, offset, size, link, info, addralign, entsize
+    sections = [
+        (0, 0, 0, 0, 0, 0, 0, 0, 0, 0),
+        (names[0], SHT_PROGBITS, SHF_ALLOC | SHF_EXECINSTR, 0, offsets[0], len(code), 0, 0, 16, 0),
+        (names[1], SHT_RELA, SHF_INFO_LINK, 0, offsets[1], len(rela), 3, TEXT_SECTION, 8, RELOCATION_SIZE),
+        (names[2], SHT_SYMTAB, 0, 0, offsets[2], len(symtab), 4, first_global, 8, SYMBOL_SIZE),
+        (names[3], SHT_STRTAB, 0, 0, offsets[3], len(strtab.data), 0, 0, 1, 0),
+        (names[4], SHT_STRTAB, 0, 0, offsets[4], len(shstrtab.data), 0, 0, 1, 0),
+        (names[5], SHT_PROGBITS, 0, 0, offsets[5], 0, 0, 0, 1, 0),
+    ]
+
+    header = b'\x7fELF' + bytes([2, 1, 1, 0]) + b'\x00' * 8  # 64-bit, little endian, System V ABI
+    header += struct.pack('<HHIQQQIHHHHHH',
+                          1,  # ET_REL
+                          62,  # EM_X86_64
+                          1,  # EV_CURRENT
+                          0, 0, section_headers_offset, 0,
+                          ELF_HEADER_SIZE, 0, 0, SECTION_HEADER_SIZE, len(sections), SHSTRTAB_SECTION)
+
+    with open(path, 'wb') as file:
+        file.write(header)
+        file.write(body)
+        for section in sections:
+            file.write(struct.pack('<IIQQQQIIQQ', *section))
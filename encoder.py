@@ -0,0 +1,414 @@
+# Author: Thomas Lander
+# Date: 10/19/26
+# encoder.py
+
+# x86-64 machine code encoder for the Intel syntax assembly the compiler emits
+# Instructions are encoded straight into a bytearray. Jumps and calls to labels in the same listing are patched
+# once every label is known, calls to anything else are left as relocations for the linker.
+
+from elf_writer import write_elf_object
+
+REGISTERS_64 = ['rax', 'rcx', 'rdx', 'rbx', 'rsp', 'rbp', 'rsi', 'rdi',
+                'r8', 'r9', 'r10', 'r11', 'r12', 'r13', 'r14', 'r15']
+REGISTERS_32 = ['eax', 'ecx', 'edx', 'ebx', 'esp', 'ebp', 'esi', 'edi',
+                'r8d', 'r9d', 'r10d', 'r11d', 'r12d', 'r13d', 'r14d', 'r15d']
+REGISTERS_8 = ['al', 'cl', 'dl', 'bl', 'spl', 'bpl', 'sil', 'dil',
+               'r8b', 'r9b', 'r10b', 'r11b', 'r12b', 'r13b', 'r14b', 'r15b']
+
+# Register name -> (number, size in bits)
+REGISTERS = {}
+for size, names in ((64, REGISTERS_64), (32, REGISTERS_32), (8, REGISTERS_8)):
+    for number, name in enumerate(names):
+        REGISTERS[name] = (number, size)
+
+# Condition codes, used by jcc and setcc
+CONDITIONS = {'o': 0x0, 'no': 0x1, 'b': 0x2, 'ae': 0x3, 'e': 0x4, 'z': 0x4, 'ne': 0x5, 'nz': 0x5,
+              'be': 0x6, 'a': 0x7, 's': 0x8, 'ns': 0x9, 'l': 0xC, 'ge': 0xD, 'le': 0xE, 'g': 0xF}
+
+# Two operand ALU instructions, (opcode for "rm, reg", opcode for "reg, rm", /digit for the immediate forms)
+ALU_OPERATIONS = {'add': (0x01, 0x03, 0), 'or': (0x09, 0x0B, 1), 'and': (0x21, 0x23, 4),
+                  'sub': (0x29, 0x2B, 5), 'xor': (0x31, 0x33, 6), 'cmp': (0x39, 0x3B, 7)}
+
+# One operand instructions on the F7 opcode, mnemonic -> /digit
+UNARY_OPERATIONS = {'not': 2, 'neg': 3, 'mul': 4, 'div': 6, 'idiv': 7}
+
+MEMORY_SIZES = {'BYTE': 8, 'DWORD': 32, 'QWORD': 64}
+
+# Index scale factor -> the two bits of the SIB byte that hold it
+SCALES = {1: 0, 2: 1, 4: 2, 8: 3}
+
+
+# Operand kinds, kept as small tuples
+#   ('reg', number, size)
+#   ('mem', base number, displacement, size or None, index number or None, scale)
+#   ('rip', label, size or None), an address relative to the next instruction
+#   ('imm', value)
+#   ('sym', name)
+def parse_operand(text):
+    text = text.strip()
+    if text in REGISTERS:
+        number, size = REGISTERS[text]
+        return ('reg', number, size)
+
+    size = None
+    words = text.split(None, 2)
+    if len(words) == 3 and words[0] in MEMORY_SIZES and words[1] == 'PTR':
+        size = MEMORY_SIZES[words[0]]
+        text = words[2]
+    if text.startswith('[') and text.endswith(']'):
+        address = text[1:-1].replace(' ', '')
+        if address.startswith('rip+'):
+            return ('rip', address[4:], size)
+        # base + index*scale + displacement, every part but the base is optional
+        base = index = None
+        scale = 1
+        displacement = 0
+        for term in address.replace('-', '+-').split('+'):
+            register, _, factor = term.partition('*')
+            if register in REGISTERS and REGISTERS[register][1] == 64:
+                if base is None and not factor:
+                    base = REGISTERS[register][0]
+                elif index is None and int(factor or 1) in SCALES:
+                    index, scale = REGISTERS[register][0], int(factor or 1)
+                else:
+                    raise ValueError(f"Unsupported memory operand: {text}")
+            elif term:
+                try:
+                    displacement += int(term, 0)
+                except ValueError:
+                    raise ValueError(f"Unsupported memory operand: {text}") from None
+        if base is None:
+            raise ValueError(f"Unsupported memory operand: {text}")
+        return ('mem', base, displacement, size, index, scale)
+
+    try:
+        return ('imm', int(text, 0))
+    except ValueError:
+        return ('sym', text)
+
+
+class X86Encoder:
+    def __init__(self):
+        self.code = bytearray()
+        self.labels = {}  # Label -> offset in the code
+        self.fixups = []  # (offset of a rel32 field, label), patched once every label is known
+        self.differences = []  # (offset of a 32-bit field, label, base label), patched with label - base
+        self.relocations = []  # (offset, symbol, type, addend), left for the linker
+        self.global_symbols = []  # Function names, in order
+
+
+    # Encode a listing and resolve every jump inside it, returns the code
+    def assemble(self, lines):
+        for line in lines:
+            self.encode_line(line)
+        self.resolve_fixups()
+        return bytes(self.code)
+
+
+    # Encode one line of assembly, either a label or an instruction
+    def encode_line(self, line):
+        line = line.split(';', 1)[0].strip()
+        if not line:
+            return
+        if line.endswith(':'):
+            label = line[:-1]
+            if label in self.labels:
+                raise ValueError(f"Label '{label}' defined twice")
+            self.labels[label] = len(self.code)
+            # Compiler made labels start with .L, anything else is a function
+            if not label.startswith('.L'):
+                self.global_symbols.append(label)
+            return
+
+        mnemonic, _, rest = line.partition(' ')
+        operands = [parse_operand(operand) for operand in self.split_operands(rest)] if rest.strip() else []
+        try:
+            self.encode_instruction(mnemonic.lower(), operands)
+        except (ValueError, KeyError, IndexError) as error:
+            raise ValueError(f"Cannot encode '{line}': {error}") from None
+
+
+    # Helper to split operands on commas that are not inside a memory operand
+    def split_operands(self, text):
+        operands = []
+        depth = 0
+        current = ''
+        for char in text:
+            if char == ',' and depth == 0:
+                operands.append(current)
+                current = ''
+                continue
+            depth += char == '['
+            depth -= char == ']'
+            current += char
+        operands.append(current)
+        return operands
+
+
+    # Pick the encoding of one instruction from its mnemonic and operand kinds
+    def encode_instruction(self, mnemonic, operands):
+        kinds = tuple(operand[0] for operand in operands)
+
+        if mnemonic == 'mov':
+            destination, source = operands
+            if kinds == ('reg', 'reg'):
+                self.emit_rm(0x89, source[1], destination, operand_size(destination, source))
+            elif kinds == ('reg', 'imm'):
+                self.emit_mov_immediate(destination, source[1])
+            elif kinds == ('reg', 'mem'):
+                self.emit_rm(0x8B, destination[1], source, destination[2], byte_opcode = 0x8A)
+            elif kinds == ('mem', 'reg'):
+                self.emit_rm(0x89, source[1], destination, source[2], byte_opcode = 0x88)
+            elif kinds == ('mem', 'imm'):
+                size = destination[3] or 32
+                if size == 8:
+                    self.emit_rm(0xC6, 0, destination, 8)
+                    self.code += (source[1] & 0xFF).to_bytes(1, 'little')
+                else:
+                    self.emit_rm(0xC7, 0, destination, size)
+                    self.emit_imm32(source[1])
+            else:
+                raise ValueError("unsupported operands")
+
+        elif mnemonic in ALU_OPERATIONS:
+            rm_reg, reg_rm, digit = ALU_OPERATIONS[mnemonic]
+            destination, source = operands
+            if kinds == ('reg', 'reg'):
+                self.emit_rm(rm_reg, source[1], destination, operand_size(destination, source))
+            elif kinds == ('reg', 'mem'):
+                self.emit_rm(reg_rm, destination[1], source, destination[2])
+            elif kinds == ('mem', 'reg'):
+                self.emit_rm(rm_reg, source[1], destination, source[2])
+            elif kinds in (('reg', 'imm'), ('mem', 'imm')):
+                size = destination[2] if kinds[0] == 'reg' else destination[3] or 32
+                if -128 <= source[1] <= 127:
+                    self.emit_rm(0x83, digit, destination, size)
+                    self.code += (source[1] & 0xFF).to_bytes(1, 'little')
+                elif kinds[0] == 'reg' and destination[1] == 0:
+                    # eax/rax has a shorter form without a ModRM byte
+                    self.emit_rex(1 if size == 64 else 0, 0, 0)
+                    self.code.append((digit << 3) | 0x05)
+                    self.emit_imm32(source[1])
+                else:
+                    self.emit_rm(0x81, digit, destination, size)
+                    self.emit_imm32(source[1])
+            else:
+                raise ValueError("unsupported operands")
+
+        elif mnemonic == 'imul':
+            if kinds == ('reg', 'reg') or kinds == ('reg', 'mem'):
+                destination, source = operands
+                self.emit_rm(0xAF, destination[1], source, destination[2], prefix = b'\x0f')
+            elif kinds == ('reg', 'imm'):
+                destination, source = operands
+                if -128 <= source[1] <= 127:
+                    self.emit_rm(0x6B, destination[1], destination, destination[2])
+                    self.code += (source[1] & 0xFF).to_bytes(1, 'little')
+                else:
+                    self.emit_rm(0x69, destination[1], destination, destination[2])
+                    self.emit_imm32(source[1])
+            else:
+                raise ValueError("unsupported operands")
+
+        elif mnemonic in UNARY_OPERATIONS:
+            operand, = operands
+            if operand[0] == 'imm':
+                raise ValueError("the operand cannot be an immediate")
+            size = operand[2] if operand[0] == 'reg' else operand[3] or 32
+            self.emit_rm(0xF7, UNARY_OPERATIONS[mnemonic], operand, size)
+
+        elif mnemonic == 'test' and kinds == ('reg', 'reg'):
+            destination, source = operands
+            self.emit_rm(0x85, source[1], destination, operand_size(destination, source))
+
+        elif mnemonic == 'lea' and kinds in (('reg', 'mem'), ('reg', 'rip')):
+            destination, source = operands
+            self.emit_rm(0x8D, destination[1], source, destination[2])
+
+        elif mnemonic == 'movsxd' and kinds in (('reg', 'mem'), ('reg', 'reg')):
+            destination, source = operands
+            self.emit_rm(0x63, destination[1], source, 64)
+
+        elif mnemonic == 'movzx' and kinds == ('reg', 'reg') and operands[1][2] == 8:
+            destination, source = operands
+            self.emit_rm(0xB6, destination[1], source, destination[2], prefix = b'\x0f', byte_register = source[1])
+
+        elif mnemonic.startswith('set') and mnemonic[3:] in CONDITIONS:
+            operand, = operands
+            if operand[0] != 'reg' or operand[2] != 8:
+                raise ValueError("setcc needs an 8-bit register")
+            self.emit_rm(0x90 + CONDITIONS[mnemonic[3:]], 0, operand, 32, prefix = b'\x0f', byte_register = operand[1])
+
+        elif mnemonic == 'push':
+            operand, = operands
+            if operand[0] == 'reg':
+                # Only 64-bit pushes exist in long mode, a 32-bit name means the whole register
+                self.emit_rex(0, 0, operand[1])
+                self.code.append(0x50 + (operand[1] & 7))
+            elif operand[0] == 'imm':
+                if -128 <= operand[1] <= 127:
+                    self.code += bytes([0x6A, operand[1] & 0xFF])
+                else:
+                    self.code.append(0x68)
+                    self.emit_imm32(operand[1])
+            else:
+                raise ValueError("unsupported operand")
+
+        elif mnemonic == 'pop':
+            operand, = operands
+            if operand[0] != 'reg':
+                raise ValueError("unsupported operand")
+            self.emit_rex(0, 0, operand[1])
+            self.code.append(0x58 + (operand[1] & 7))
+
+        elif mnemonic == 'jmp' and kinds == ('reg',):
+            # Indirect jump, always to a 64-bit address
+            self.emit_rm(0xFF, 4, operands[0], 32)
+
+        elif mnemonic == 'jmp':
+            self.code.append(0xE9)
+            self.emit_label_reference(operands[0][1])
+
+        elif mnemonic.startswith('j') and mnemonic[1:] in CONDITIONS:
+            self.code += bytes([0x0F, 0x80 + CONDITIONS[mnemonic[1:]]])
+            self.emit_label_reference(operands[0][1])
+
+        elif mnemonic == 'call':
+            self.code.append(0xE8)
+            self.emit_label_reference(operands[0][1], call = True)
+
+        elif mnemonic == 'ret' and not operands:
+            self.code.append(0xC3)
+        elif mnemonic == 'leave' and not operands:
+            self.code.append(0xC9)
+        elif mnemonic == 'cdq' and not operands:
+            self.code.append(0x99)
+        elif mnemonic == 'cqo' and not operands:
+            self.code += b'\x48\x99'
+        elif mnemonic == 'nop' and not operands:
+            self.code.append(0x90)
+
+        # Data, a 32-bit number or the distance between two labels (".L3-.Lmain_table1")
+        elif mnemonic == '.long' and kinds == ('imm',):
+            self.emit_imm32(operands[0][1])
+        elif mnemonic == '.long' and kinds == ('sym',) and '-' in operands[0][1]:
+            label, base = operands[0][1].split('-')
+            self.differences.append((len(self.code), label, base))
+            self.code += b'\x00\x00\x00\x00'
+        else:
+            raise ValueError("unknown instruction")
+
+
+    # REX prefix, only written when one of its bits is needed
+    def emit_rex(self, w, reg, rm, force = False, index = 0):
+        rex = 0x40 | (w << 3) | ((reg >> 3) << 2) | ((index >> 3) << 1) | (rm >> 3)
+        if rex != 0x40 or force:
+            self.code.append(rex)
+
+
+    # Opcode + ModRM (+ SIB and displacement) for an instruction with a reg field and a register or memory operand
+    # byte_register is set when the rm operand is an 8-bit register, spl/bpl/sil/dil need an empty REX
+    def emit_rm(self, opcode, reg, rm_operand, size, prefix = b'', byte_opcode = None, byte_register = None):
+        if size == 16:
+            raise ValueError("16-bit operands are not supported")
+        if size == 8 and byte_opcode is not None:
+            opcode = byte_opcode
+        rm = rm_operand[1] if rm_operand[0] != 'rip' else 0
+        index = rm_operand[4] if rm_operand[0] == 'mem' else None
+        force_rex = (byte_register is not None and 4 <= byte_register <= 7) or \
+                    (size == 8 and byte_opcode is not None and 4 <= reg <= 7)
+        self.emit_rex(1 if size == 64 else 0, reg, rm, force_rex, index or 0)
+        self.code += prefix
+        self.code.append(opcode)
+
+        if rm_operand[0] == 'reg':
+            self.code.append(0xC0 | ((reg & 7) << 3) | (rm & 7))
+            return
+        if rm_operand[0] == 'rip':
+            # Mode 0 with rm 101 is rip + disp32, the field is filled in like a jump to the label
+            self.code.append(((reg & 7) << 3) | 5)
+            self.emit_label_reference(rm_operand[1])
+            return
+
+        displacement = rm_operand[2]
+        # rbp/r13 as a base always need a displacement, rsp/r12 always need a SIB byte
+        if displacement == 0 and rm & 7 != 5:
+            mode = 0
+        elif -128 <= displacement <= 127:
+            mode = 1
+        else:
+            mode = 2
+        if index is not None:
+            # rm 100 means a SIB byte with the scale, index, and base follows
+            self.code.append((mode << 6) | ((reg & 7) << 3) | 4)
+            self.code.append((SCALES[rm_operand[5]] << 6) | ((index & 7) << 3) | (rm & 7))
+        else:
+            self.code.append((mode << 6) | ((reg & 7) << 3) | (rm & 7))
+            if rm & 7 == 4:
+                self.code.append(0x24)
+        if mode == 1:
+            self.code += (displacement & 0xFF).to_bytes(1, 'little')
+        elif mode == 2:
+            self.code += (displacement & 0xFFFFFFFF).to_bytes(4, 'little')
+
+
+    # mov reg, imm - the shortest form that keeps the value
+    def emit_mov_immediate(self, destination, value):
+        _, number, size = destination
+        if size == 64 and not -2 ** 31 <= value < 2 ** 31:
+            self.emit_rex(1, 0, number)
+            self.code.append(0xB8 + (number & 7))
+            self.code += (value & (2 ** 64 - 1)).to_bytes(8, 'little')
+        elif size == 64:
+            self.emit_rm(0xC7, 0, destination, 64)
+            self.emit_imm32(value)
+        elif size == 32:
+            self.emit_rex(0, 0, number)
+            self.code.append(0xB8 + (number & 7))
+            self.emit_imm32(value)
+        else:
+            raise ValueError("unsupported operand size")
+
+
+    # 32-bit immediate, negative values are written in two's complement
+    def emit_imm32(self, value):
+        if not -2 ** 31 <= value < 2 ** 32:
+            raise ValueError(f"immediate {value} does not fit in 32 bits")
+        self.code += (value & 0xFFFFFFFF).to_bytes(4, 'little')
+
+
+    # rel32 field for a jump or call, filled in by resolve_fixups
+    def emit_label_reference(self, label, call = False):
+        self.fixups.append((len(self.code), label, call))
+        self.code += b'\x00\x00\x00\x00'
+
+
+    # Patch every jump and call to a label in this listing, calls to other functions become relocations
+    def resolve_fixups(self):
+        for offset, label, call in self.fixups:
+            if label in self.labels:
+                relative = self.labels[label] - (offset + 4)
+                self.code[offset:offset + 4] = (relative & 0xFFFFFFFF).to_bytes(4, 'little')
+            elif call:
+                # R_X86_64_PLT32, the linker adds the symbol address minus the end of the field
+                self.relocations.append((offset, label, 4, -4))
+            else:
+                raise ValueError(f"Jump to undefined label '{label}'")
+        self.fixups = []
+        for offset, label, base in self.differences:
+            if label not in self.labels or base not in self.labels:
+                raise ValueError(f"Jump table refers to an undefined label in '{label}-{base}'")
+            self.code[offset:offset + 4] = ((self.labels[label] - self.labels[base]) & 0xFFFFFFFF).to_bytes(4, 'little')
+        self.differences = []
+
+
+    # Write the encoded code as a relocatable ELF object
+    def write_object(self, path):
+        write_elf_object(path, bytes(self.code), self.labels, self.global_symbols, self.relocations)
+
+
+# Operand size of a two-register instruction, both registers have to agree
+def operand_size(destination, source):
+    if destination[2] != source[2]:
+        raise ValueError("operand sizes do not match")
+    return destination[2]
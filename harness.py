@@ -0,0 +1,480 @@
+# Author: Thomas Lander
+# Date: 10/19/26
+# harness.py
+
+# Executable test harness for the generated code
+# Every tests/*.c is compiled to x86-64, assembled and linked with the local binutils, and run. Its exit code is
+# compared against the same file built by cc. Both builds are then timed in the same generated driver, so the
+# harness also works as a performance regression benchmark for the emitted code, not just for compile time.
+#
+#   python harness.py                          every test, no TAC optimizations
+#   python harness.py --o-cf --o-cp --o-dc     with optimizations
+#   python harness.py --save base.json         keep the results
+#   python harness.py --baseline base.json     and flag tests that got slower since
+#
+# Besides the single files, tests/programs/<name>/ holds programs of several files, linked as one program with
+# inlining and dead function elimination, and tests/errors/*.c holds files with errors, whose first line
+# says how many errors the front end has to report ("// errors: 3"). --stream, --via-ir, and --incremental send
+# the single file tests through the streaming compile, an IR file, or the incremental front end instead.
+# Each TAC optimization is also timed on a generated function of --scaling statements and on one four times as
+# large, a pass that takes more than SCALING_LIMIT times as long on the larger one does not scale linearly.
+
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import Namespace
+from compiler import read_file, compile_stream
+from my_parser import Parser, ParseError
+from three_address_code import ThreeAddressCodeGenerator
+from optimize import Optimizer
+from optimize_node import NodeOptimizer
+from assembly import TACtoAssemblyConverter
+from encoder import X86Encoder
+from incremental import IncrementalFrontEnd
+from ir_file import IRFile, LoadedSymbolTable, write_ir
+from output import OutputWriter
+from whole_program import WholeProgram
+
+# Calls main and exits with its result, so the program runs without the C runtime
+START_STUB = """.intel_syntax noprefix
+.text
+.globl _start
+_start:
+    call main
+    mov edi, eax
+    mov eax, 60
+    syscall
+"""
+
+# Times test_main (the renamed main of a test), prints the fewest cycles any one call took
+TIMING_DRIVER = """#include <stdio.h>
+#include <stdlib.h>
+#include <x86intrin.h>
+
+int test_main(void);
+
+int main(int argc, char **argv) {
+    long iterations = argc > 1 ? atol(argv[1]) : 1000;
+    unsigned long long best = ~0ULL;
+    for (long i = 0; i < iterations; i++) {
+        unsigned long long start = __rdtsc();
+        test_main();
+        unsigned long long cycles = __rdtsc() - start;
+        if (cycles < best)
+            best = cycles;
+    }
+    printf("%llu\\n", best);
+    return 0;
+}
+"""
+
+TOOLS = ['as', 'ld', 'cc', 'objcopy']
+RUN_TIMEOUT = 10  # Seconds, a test that runs longer is treated as hanging
+EXPECTED_ERRORS = re.compile(r'//\s*errors:\s*(\d+)')
+EXPECTED_INLINED = re.compile(r'//\s*inlined:(.*)')
+SCALING_PASSES = ('constant_folding', 'constant_propagation', 'dead_code_elimination', 'jump_threading')
+SCALING_LIMIT = 8  # Four times the statements, linear passes take about four times as long and quadratic ones 16
+
+
+# Compiles one C file down to an assembly listing, with the same passes compiler.py would run
+def compile_to_assembly(file_path, args):
+    if args.stream:
+        return stream_to_assembly(file_path, args)
+    parser = Parser(read_file(file_path))
+    ast = parser.parse()
+    symbol_table = parser.symbol_table
+    if args.incremental:
+        ast = incremental_ast(file_path)
+    if args.o_ast:
+        ast = NodeOptimizer(ast, symbol_table).optimize(
+            constant_folding = True,
+            constant_propagation = True,
+            dead_code_elimination = True
+        )
+    tac = ThreeAddressCodeGenerator(ast).generate()
+    if args.via_ir:
+        tac, symbol_table = ir_round_trip(ast, tac, symbol_table)
+    if args.o_cf or args.o_cp or args.o_dc or args.o_jt:
+        tac = Optimizer(tac, symbol_table).optimize(
+            constant_folding = args.o_cf,
+            constant_propagation = args.o_cp,
+            dead_code_elimination = args.o_dc,
+            jump_threading = args.o_jt
+        )
+    return TACtoAssemblyConverter(tac).convert()
+
+
+# The streaming compile of compiler.py, its listing is written to a file one function at a time
+def stream_to_assembly(file_path, args):
+    stream_args = Namespace(file = [file_path], use_profile = None, emit_obj = None, o_ast = args.o_ast,
+                            o_cf = args.o_cf, o_cp = args.o_cp, o_dc = args.o_dc, o_jt = args.o_jt,
+                            o_cf_batch = False, verify_batch = False)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "stream.s")
+        out = OutputWriter({'asm'}, path = path, titles = False)
+        try:
+            compile_stream(stream_args, out)
+        finally:
+            out.close()
+        with open(path) as file:
+            return file.read()
+
+
+# The front end starts from the file with the value of its last return cut out, then gets the cut typed back in
+# as an edit, so the AST that is compiled is the one the incremental re-parse made
+def incremental_ast(file_path):
+    with open(file_path) as file:
+        source = file.read()
+    start = source.rfind("return ") + len("return ")
+    end = source.find(";", start)
+    if start < len("return ") or end < 0:
+        return IncrementalFrontEnd(source).ast
+    front_end = IncrementalFrontEnd(source[:start] + "0" + source[end:])
+    return front_end.update(front_end.source, (start, start + 1), source[start:end])
+
+
+# Writes the AST and TAC to an IR file and gives back what the back end loads from it
+def ir_round_trip(ast, tac, symbol_table):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "test.ir")
+        write_ir(path, ast, tac, symbol_table.symbol_info)
+        with IRFile(path) as ir:
+            return ir.tac(), LoadedSymbolTable(ir.symbols())
+
+
+# Compiles a program of several files into one listing, returns it with the functions that were inlined
+def compile_program_to_assembly(file_paths, args):
+    program = WholeProgram(file_paths)
+    program.parse_units(parallel = False)
+    inlined = program.inline_functions()
+    program.eliminate_dead_functions()
+    tac_units = program.generate_tac(
+        constant_folding = args.o_cf,
+        constant_propagation = args.o_cp,
+        dead_code_elimination = args.o_dc,
+        jump_threading = args.o_jt
+    )
+    return program.generate_assembly(tac_units, merged = True), inlined
+
+
+# Number of errors the front end reports for a file
+def count_errors(file_path):
+    try:
+        Parser(read_file(file_path)).parse()
+    except ParseError as e:
+        return len(e.diagnostics)
+    except (SyntaxError, NameError):
+        return 1
+    return 0
+
+
+# What the first line of a test comment declares, None if it does not
+def expectation(pattern, file_paths):
+    for file_path in file_paths:
+        with open(file_path) as file:
+            match = pattern.match(file.readline().strip())
+        if match:
+            return match.group(1)
+    return None
+
+
+# Turns a listing into a file GNU as accepts, functions are exported so the start stub and driver can call them
+def gas_source(assembly_code):
+    lines = [".intel_syntax noprefix", ".text"]
+    for line in assembly_code.splitlines():
+        label = line[:-1]
+        if line.endswith(":") and not label.startswith(".L"):
+            lines.append(f".globl {label}")
+        lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+# A main of the given number of statements, each declares a variable computed from an earlier one, and every 50th
+# is an if that changes one, so the function has many variables and many blocks
+def large_function(statements):
+    generator = random.Random(statements)
+    lines = ["int main() {", "int a0 = 1;"]
+    for index in range(1, statements):
+        if index % 50 == 0:
+            lines.append(f"if (a{index - 1} > a{generator.randrange(index)}) {{ a{index - 1} = a{index - 1} - 1; }}")
+        lines.append(f"int a{index} = a{generator.randrange(index)} + {generator.randrange(1, 10)};")
+    lines += [f"return a{statements - 1};", "}"]
+    return "\n".join(lines) + "\n"
+
+
+# Seconds every TAC optimization takes on its own on a generated function
+def time_passes(statements):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "large.c")
+        with open(path, "w") as file:
+            file.write(large_function(statements))
+        parser = Parser(read_file(path))
+        tac = ThreeAddressCodeGenerator(parser.parse()).generate()
+    seconds = {}
+    for optimization in SCALING_PASSES:
+        start = time.perf_counter()
+        Optimizer(tac, parser.symbol_table).optimize(**{optimization: True})
+        seconds[optimization] = time.perf_counter() - start
+    return seconds
+
+
+# Times the passes on a function and one four times as large, returns a result dict per pass
+def scaling_results(statements):
+    small, large = time_passes(statements), time_passes(4 * statements)
+    results = []
+    for optimization in SCALING_PASSES:
+        ratio = large[optimization] / max(small[optimization], 1e-6)
+        result = {"name": f"scaling {optimization}", "seconds": [small[optimization], large[optimization]],
+                  "status": "PASS" if ratio <= SCALING_LIMIT else "FAIL"}
+        if result["status"] == "FAIL":
+            result["reason"] = f"{ratio:.1f} times as long for 4 times the statements"
+        results.append(result)
+    return results
+
+
+# Runs a command, raises with its output if it fails
+def run_tool(command):
+    result = subprocess.run(command, capture_output = True, text = True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{command[0]} failed: {(result.stderr or result.stdout).strip()}")
+    return result.stdout
+
+
+# Runs a test program and returns its exit code, None if it hangs
+def run_program(path, *arguments):
+    try:
+        result = subprocess.run([path, *arguments], capture_output = True, text = True, timeout = RUN_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        return None, ""
+    return result.returncode, result.stdout
+
+
+class Harness:
+    def __init__(self, args, build_dir):
+        self.args = args
+        self.build_dir = build_dir
+        self.start_object = None
+        self.driver_object = None
+
+
+    # Builds the start stub and the timing driver once for every test
+    def prepare(self):
+        start_source = os.path.join(self.build_dir, "start.s")
+        with open(start_source, "w") as file:
+            file.write(START_STUB)
+        self.start_object = os.path.join(self.build_dir, "start.o")
+        run_tool(["as", "--64", "-o", self.start_object, start_source])
+
+        if self.args.iterations:
+            driver_source = os.path.join(self.build_dir, "driver.c")
+            with open(driver_source, "w") as file:
+                file.write(TIMING_DRIVER)
+            self.driver_object = os.path.join(self.build_dir, "driver.o")
+            run_tool(["cc", "-O2", "-c", "-o", self.driver_object, driver_source])
+
+
+    # Builds, runs, and times one test, returns a result dict
+    # A directory is a program of several files, a file in an errors directory only has its errors counted
+    def run_test(self, file_path):
+        name = os.path.splitext(os.path.basename(os.path.normpath(file_path)))[0]
+        if os.path.basename(os.path.dirname(os.path.abspath(file_path))) == "errors":
+            return self.run_error_test(name, file_path)
+        base = os.path.join(self.build_dir, name)
+        result = {"name": name}
+        sources = sorted(glob.glob(os.path.join(file_path, "*.c"))) if os.path.isdir(file_path) else [file_path]
+
+        try:
+            if os.path.isdir(file_path):
+                assembly_code, inlined = compile_program_to_assembly(sources, self.args)
+            else:
+                assembly_code = compile_to_assembly(file_path, self.args)
+        except Exception as e:
+            result["status"] = "SKIP"
+            result["reason"] = f"does not compile: {e}"
+            return result
+
+        # A program can say which of its functions have to be inlined
+        expected = expectation(EXPECTED_INLINED, sources) if len(sources) > 1 else None
+        if expected is not None and set(expected.split()) != inlined:
+            result["status"] = "FAIL"
+            result["reason"] = f"inlined {', '.join(sorted(inlined)) or 'nothing'}, expected {expected.strip()}"
+            return result
+
+        # The reference build, warnings are the test's business
+        try:
+            run_tool(["cc", "-w", self.args.cc_opt, "-o", base + ".ref", *sources])
+        except RuntimeError as e:
+            result["status"] = "SKIP"
+            result["reason"] = f"no reference build: {e}"
+            return result
+
+        # Assemble with GNU as, or with the built-in encoder
+        try:
+            if self.args.builtin_encoder:
+                encoder = X86Encoder()
+                encoder.assemble(assembly_code.splitlines())
+                encoder.write_object(base + ".o")
+            else:
+                with open(base + ".s", "w") as file:
+                    file.write(gas_source(assembly_code))
+                run_tool(["as", "--64", "-o", base + ".o", base + ".s"])
+            run_tool(["ld", "-o", base, base + ".o", self.start_object])
+        except (RuntimeError, ValueError) as e:
+            result["status"] = "FAIL"
+            result["reason"] = f"build failed: {e}"
+            return result
+
+        result["exit"], _ = run_program(base)
+        result["cc_exit"], _ = run_program(base + ".ref")
+        if result["exit"] is None:
+            result["status"] = "FAIL"
+            result["reason"] = "timed out"
+        elif result["exit"] != result["cc_exit"]:
+            result["status"] = "FAIL"
+            result["reason"] = f"exit code {result['exit']}, cc gives {result['cc_exit']}"
+        else:
+            result["status"] = "PASS"
+
+        # Only single files are timed, main is renamed in one object
+        if self.driver_object and result["status"] == "PASS" and len(sources) == 1:
+            result["cycles"] = self.time_object(base + ".o", base + ".bench")
+            run_tool(["cc", "-w", self.args.cc_opt, "-c", "-o", base + ".ref.o", file_path])
+            result["cc_cycles"] = self.time_object(base + ".ref.o", base + ".ref.bench")
+        return result
+
+
+    # Checks that the front end reports as many errors as the file's first line says
+    def run_error_test(self, name, file_path):
+        result = {"name": name, "errors": count_errors(file_path)}
+        expected = expectation(EXPECTED_ERRORS, [file_path])
+        if expected is None:
+            result["status"] = "SKIP"
+            result["reason"] = "no \"// errors: N\" line"
+        elif result["errors"] != int(expected):
+            result["status"] = "FAIL"
+            result["reason"] = f"{result['errors']} error(s), expected {expected}"
+        else:
+            result["status"] = "PASS"
+        return result
+
+
+    # Links an object with main renamed into the timing driver and returns the best cycle count
+    def time_object(self, object_path, executable):
+        renamed = executable + ".o"
+        run_tool(["objcopy", "--redefine-sym", "main=test_main", object_path, renamed])
+        run_tool(["cc", "-o", executable, self.driver_object, renamed])
+        _, output = run_program(executable, str(self.args.iterations))
+        return int(output) if output.strip().isdigit() else None
+
+
+# Marks tests whose cycle count grew by more than the threshold since the baseline
+def compare_to_baseline(results, baseline, threshold):
+    regressions = []
+    for result in results:
+        before = baseline.get(result["name"], {}).get("cycles")
+        after = result.get("cycles")
+        if before and after and after > before * (1 + threshold):
+            result["regression"] = f"{before} -> {after} cycles"
+            regressions.append(result["name"])
+    return regressions
+
+
+# Printing the results table
+def print_results(results):
+    print(f"{'Test':<22} {'Result':<7} {'Exit':>5} {'cc':>5} {'Cycles':>8} {'cc Cycles':>10}")
+    print('-' * 62)
+    for result in results:
+        if result["status"] == "SKIP" or ("errors" in result and result["status"] == "FAIL"):
+            print(f"{result['name']:<22} {result['status']:<7} {result['reason']}")
+            continue
+        if "errors" in result:
+            print(f"{result['name']:<22} {result['status']:<7} {result['errors']} error(s)")
+            continue
+        if "seconds" in result:
+            small, large = result["seconds"]
+            print(f"{result['name']:<35} {result['status']:<7} {small:.2f}s -> {large:.2f}s")
+            if result["status"] == "FAIL":
+                print(f"{'':<22} {result['reason']}")
+            continue
+        cycles = result.get("cycles")
+        cc_cycles = result.get("cc_cycles")
+        print(f"{result['name']:<22} {result['status']:<7} {str(result['exit']):>5} {str(result['cc_exit']):>5} "
+              f"{'' if cycles is None else cycles:>8} {'' if cc_cycles is None else cc_cycles:>10}")
+        if result["status"] == "FAIL":
+            print(f"{'':<22} {result['reason']}")
+        if "regression" in result:
+            print(f"{'':<22} slower than the baseline: {result['regression']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Build, run, and time the tests against cc.')
+    parser.add_argument('tests', nargs = '*', help = 'C files to test (default: tests/*.c).')
+    parser.add_argument('--o-ast', action = 'store_true', help = 'Enable AST-level optimization.')
+    parser.add_argument('--o-cf', action = 'store_true', help = 'Enable constant folding optimization.')
+    parser.add_argument('--o-cp', action = 'store_true', help = 'Enable constant propagation optimization.')
+    parser.add_argument('--o-dc', action = 'store_true', help = 'Enable dead code elimination optimization.')
+    parser.add_argument('--o-jt', action = 'store_true', help = 'Enable jump threading and branch simplification.')
+    parser.add_argument('--stream', action = 'store_true', help = 'Compile single files one function at a time.')
+    parser.add_argument('--via-ir', action = 'store_true', help = 'Pass single files through an IR file to the back end.')
+    parser.add_argument('--incremental', action = 'store_true', help = 'Parse single files through an incremental edit.')
+    parser.add_argument('--builtin-encoder', action = 'store_true', help = 'Assemble with encoder.py instead of GNU as.')
+    parser.add_argument('--cc-opt', default = '-O0', help = 'Optimization level of the cc reference build.')
+    parser.add_argument('--iterations', type = int, default = 1000, help = 'Timed calls per test, 0 skips timing.')
+    parser.add_argument('--scaling', type = int, default = 2000, metavar = 'N',
+                        help = 'Statements of the generated function the passes are timed on, 0 skips it.')
+    parser.add_argument('--save', metavar = 'FILE', help = 'Write the results as JSON.')
+    parser.add_argument('--baseline', metavar = 'FILE', help = 'Compare cycles against saved results.')
+    parser.add_argument('--threshold', type = float, default = 0.10, help = 'Slowdown that counts as a regression.')
+    parser.add_argument('--build-dir', help = 'Keep the build products here instead of a temporary directory.')
+    args = parser.parse_args()
+
+    missing = [tool for tool in TOOLS if shutil.which(tool) is None]
+    if missing:
+        print(f"Error: the harness needs {', '.join(missing)}.")
+        sys.exit(2)
+
+    test_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tests")
+    tests = args.tests or (sorted(glob.glob(os.path.join(test_dir, "*.c")))
+                           + sorted(glob.glob(os.path.join(test_dir, "programs", "*", "")))
+                           + sorted(glob.glob(os.path.join(test_dir, "errors", "*.c"))))
+    build_dir = args.build_dir or tempfile.mkdtemp(prefix = "harness-")
+    os.makedirs(build_dir, exist_ok = True)
+    try:
+        harness = Harness(args, build_dir)
+        harness.prepare()
+        results = [harness.run_test(file_path) for file_path in tests]
+        if args.scaling:
+            results += scaling_results(args.scaling)
+    finally:
+        if not args.build_dir:
+            shutil.rmtree(build_dir, ignore_errors = True)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = {result["name"]: result for result in json.load(file)}
+        regressions = compare_to_baseline(results, baseline, args.threshold)
+    print_results(results)
+
+    failed = [result["name"] for result in results if result["status"] == "FAIL"]
+    passed = sum(result["status"] == "PASS" for result in results)
+    print('-' * 62)
+    print(f"{passed} passed, {len(failed)} failed, {len(results) - passed - len(failed)} skipped, "
+          f"{len(regressions)} slower than the baseline")
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent = 2)
+    sys.exit(1 if failed or regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+# Author: Thomas Lander
+# Date: 10/19/26
+# incremental.py
+
+from bisect import bisect_left, bisect_right
+from lexer import Lexer, TOKEN_TYPES
+from my_parser import Parser
+
+
+# Incremental front end for editor integrations
+# Keeps the tokens and AST of the last version of a file, so an edit only re-lexes the tokens it damaged
+# and only re-parses the function it landed in
+class IncrementalFrontEnd:
+    def __init__(self, source):
+        self.lexer = Lexer(TOKEN_TYPES)
+        self.rebuild(source)
+
+
+    # Full lex and parse of the source, nothing is replaced if it fails
+    def rebuild(self, source):
+        tokens = []
+        offsets = []  # Index in the source where every token starts
+        for token, index in self.lexer.scan(source):
+            tokens.append(token)
+            offsets.append(index)
+
+        ast = []
+        spans = []
+        if tokens:
+            parser = Parser(tokens)
+            ast = parser.parse()
+            spans = parser.spans
+
+        self.source = source
+        self.tokens = tokens
+        self.offsets = offsets
+        self.ast = ast
+        self.spans = spans
+
+        # What the last update had to redo
+        self.relexed_tokens = len(tokens)
+        self.reparsed_item = None
+        self.full_rebuild = True
+        return ast
+
+
+    # Source range [start, end) of a top-level item in the AST
+    def source_span(self, item):
+        start, end = self.spans[item]
+        return self.offsets[start], self.offsets[end - 1] + len(self.tokens[end - 1][0])
+
+
+    # Replace old_source[start:end] with new_text and return the updated AST
+    def update(self, old_source, edit_range, new_text):
+        start, end = edit_range
+        new_source = old_source[:start] + new_text + old_source[end:]
+
+        # The edit is not against the version we have, so nothing can be reused
+        if old_source is not self.source and old_source != self.source:
+            return self.rebuild(new_source)
+
+        # If the new source has errors, keep the last good version
+        saved = (self.source, self.tokens, self.offsets)
+        try:
+            first, old_end, new_end = self.relex(new_source, start, end, new_text)
+            self.source = new_source
+            self.reparsed_item = None
+            self.full_rebuild = False
+
+            # Nothing but whitespace or comments changed
+            if first == old_end and first == new_end:
+                return self.ast
+
+            item = self.enclosing_function(first, old_end)
+            if item is None or not self.reparse_function(item, old_end, new_end):
+                return self.rebuild(new_source)
+            return self.ast
+        except (SyntaxError, NameError):
+            self.source, self.tokens, self.offsets = saved
+            raise
+
+
+    # Re-lex from just before the edit until the new tokens line up with the old ones again
+    # Returns the damaged token range, [first, old_end) in the old tokens became [first, new_end)
+    def relex(self, new_source, start, end, new_text):
+        delta = len(new_text) - (end - start)
+        edit_end = start + len(new_text)
+
+        # Start one token early, since an edit right after a token can merge with it
+        first = max(bisect_right(self.offsets, start) - 2, 0)
+        if self.offsets and self.offsets[first] <= start:
+            index = self.offsets[first]
+            _, _, lineNum, columnNum = self.tokens[first]
+        else:
+            first, index, lineNum, columnNum = 0, 0, 1, 1
+
+        new_tokens = []
+        new_offsets = []
+        old_end = len(self.tokens)
+        for token, token_start in self.lexer.scan(new_source, index, lineNum, columnNum):
+            # Past the edit, an old token at the same (shifted) position with the same text means we are back in sync
+            if token_start >= edit_end:
+                j = bisect_left(self.offsets, token_start - delta)
+                if j < len(self.tokens) and self.offsets[j] == token_start - delta \
+                        and self.tokens[j][:2] == token[:2]:
+                    old_end = j
+                    break
+            new_tokens.append(token)
+            new_offsets.append(token_start)
+        else:
+            token = None
+
+        # Tokens after the resync point keep their text, only their position moves
+        shifted_tokens = []
+        if token is not None:
+            old_line, old_column = self.tokens[old_end][2:]
+            line_delta = token[2] - old_line
+            column_delta = token[3] - old_column
+            for text, token_type, line, column in self.tokens[old_end:]:
+                if line == old_line:
+                    column += column_delta
+                shifted_tokens.append((text, token_type, line + line_delta, column))
+
+        # Re-lexed tokens that did not change are not damaged
+        same = 0
+        while same < len(new_tokens) and first + same < old_end \
+                and new_tokens[same] == self.tokens[first + same] and new_offsets[same] == self.offsets[first + same]:
+            same += 1
+
+        self.relexed_tokens = len(new_tokens)
+        self.tokens = self.tokens[:first] + new_tokens + shifted_tokens
+        self.offsets = self.offsets[:first] + new_offsets + [offset + delta for offset in self.offsets[old_end:]]
+
+        return first + same, old_end, first + len(new_tokens)
+
+
+    # Index of the function definition whose tokens contain the old damaged range, if there is one
+    def enclosing_function(self, first, old_end):
+        item = bisect_right(self.spans, (first, float('inf'))) - 1
+        if item < 0:
+            return None
+        span_start, span_end = self.spans[item]
+        if span_start <= first < span_end and old_end <= span_end and self.ast[item][0] == 'FunctionDefinition':
+            return item
+        return None
+
+
+    # Re-parse only one function, returns False if it no longer parses as exactly one function
+    def reparse_function(self, item, old_end, new_end):
+        change = new_end - old_end
+        span_start, span_end = self.spans[item]
+        function_tokens = self.tokens[span_start:span_end + change]
+        if not function_tokens:
+            return False
+
+        parser = Parser(function_tokens)
+        try:
+            # Functions defined earlier in the file are visible, the same as in a full parse
+            for node in self.ast[:item]:
+                if node[0] == 'FunctionDefinition':
+                    parser.symbol_table.define_function(node[2], node[1])
+            node = parser.parse_function_definition()
+        except (SyntaxError, NameError):
+            return False
+        if parser.errors or parser.pos != len(function_tokens):
+            return False
+        # A renamed function changes what the functions after it can see
+        if node[1:3] != self.ast[item][1:3]:
+            return False
+
+        self.ast[item] = node
+        self.spans[item] = (span_start, span_end + change)
+        self.shift_spans(item + 1, change)
+        self.reparsed_item = item
+        return True
+
+
+    # Move the spans of every item from the given one onwards by a number of tokens
+    def shift_spans(self, first_item, change):
+        if change:
+            for item in range(first_item, len(self.spans)):
+                span_start, span_end = self.spans[item]
+                self.spans[item] = (span_start + change, span_end + change)
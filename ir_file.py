@@ -0,0 +1,272 @@
+# Author: Thomas Lander
+# Date: 10/19/26
+# ir_file.py
+
+# Binary IR files, the handoff from a front end run (--emit-ir) to a back end run (--from-ir)
+# A file holds the AST, the 3-Address Code as generated, and the parser's symbols the optimizers need.
+# Everything is a flat array, so a reader maps the file and casts the arrays in place instead of parsing it:
+#
+#   header      magic "TCIR", version u16, flags u16, then u32 counts of strings, nodes, children, lines,
+#               operands, and symbols
+#   strings     u32 offsets (count + 1) into the UTF-8 bytes of every distinct string
+#   nodes       u8 kind and i64 value per AST node, children come before their parent, the root is last, equal
+#               leaves (strings, numbers, None) are one shared node
+#   children    u32 node indexes, a tuple or list node's value is (first child << 32) | number of children
+#   lines       u32 index of the first operand of every TAC line (count + 1)
+#   operands    u32 string ids, a line is its operands joined by single spaces
+#   symbols     u32 (name, type) string id pairs, indexed by the parser's symbol ids
+#
+# All numbers are little endian and every section starts on an 8 byte boundary.
+
+import mmap
+import struct
+import sys
+from array import array
+from my_parser import SymbolTable
+
+IR_MAGIC = b"TCIR"
+IR_VERSION = 2
+HEADER = struct.Struct("<4sHHIIIIII")
+
+# Flags, which parts the file holds
+HAS_AST = 1
+HAS_TAC = 2
+
+# AST node kinds
+TUPLE, LIST, STRING, INT, FLOAT, NONE, TRUE, FALSE, BIG_INT = range(9)
+INT64_MIN = -(1 << 63)
+INT64_MAX = (1 << 63) - 1
+
+
+# Arrays are written little endian whatever the machine is
+def little_endian(values):
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+class IRWriter:
+    def __init__(self):
+        self.strings = {}  # String -> id
+        self.kinds = array('B')
+        self.values = array('q')
+        self.children = array('I')
+        self.line_starts = array('I', [0])
+        self.operands = array('I')
+        self.symbols = array('I')
+        self.flags = 0
+        self.leaves = {}  # (kind, value) -> node, equal leaves are stored once
+
+
+    def string(self, text):
+        if text not in self.strings:
+            self.strings[text] = len(self.strings)
+        return self.strings[text]
+
+
+    # Adds a node and everything below it, returns its index
+    def add_node(self, node):
+        if isinstance(node, (tuple, list)):
+            indexes = [self.add_node(child) for child in node]
+            kind, value = (TUPLE if isinstance(node, tuple) else LIST), (len(self.children) << 32) | len(indexes)
+            self.children.extend(indexes)
+        elif node is None:
+            kind, value = NONE, 0
+        elif node is True or node is False:
+            kind, value = (TRUE if node else FALSE), 0
+        elif isinstance(node, int):
+            if INT64_MIN <= node <= INT64_MAX:
+                kind, value = INT, node
+            else:
+                kind, value = BIG_INT, self.string(str(node))
+        elif isinstance(node, float):
+            kind, value = FLOAT, struct.unpack("<q", struct.pack("<d", node))[0]
+        else:
+            kind, value = STRING, self.string(str(node))
+        if kind != TUPLE and kind != LIST:
+            if (kind, value) in self.leaves:
+                return self.leaves[kind, value]
+            self.leaves[kind, value] = len(self.kinds)
+        self.kinds.append(kind)
+        self.values.append(value)
+        return len(self.kinds) - 1
+
+
+    def add_ast(self, ast):
+        self.add_node(ast)
+        self.flags |= HAS_AST
+
+
+    def add_tac(self, tac):
+        for line in tac:
+            self.operands.extend(self.string(part) for part in line.split(" "))
+            self.line_starts.append(len(self.operands))
+        self.flags |= HAS_TAC
+
+
+    # Symbol id -> (name, type) list, ids of several units can be appended one after the other
+    def add_symbols(self, symbol_info):
+        for name, var_type in symbol_info:
+            self.symbols.extend((self.string(name), self.string(var_type)))
+
+
+    def write(self, path):
+        blob = bytearray()
+        offsets = array('I', [0])
+        for text in self.strings:  # Dicts keep insertion order, which is the id order
+            blob += text.encode("utf-8")
+            offsets.append(len(blob))
+
+        sections = [little_endian(offsets), bytes(blob), self.kinds.tobytes(), little_endian(self.values),
+                    little_endian(self.children), little_endian(self.line_starts), little_endian(self.operands),
+                    little_endian(self.symbols)]
+        with open(path, "wb") as file:
+            file.write(HEADER.pack(IR_MAGIC, IR_VERSION, self.flags, len(self.strings), len(self.kinds),
+                                   len(self.children), len(self.line_starts) - 1, len(self.operands),
+                                   len(self.symbols) // 2))
+            for section in sections:
+                file.write(section)
+                file.write(bytes(-len(section) % 8))
+
+
+# Writes an IR file, ast and tac can be left out
+def write_ir(path, ast = None, tac = None, symbol_info = None):
+    writer = IRWriter()
+    if ast is not None:
+        writer.add_ast(ast)
+    if tac is not None:
+        writer.add_tac(tac)
+    writer.add_symbols(symbol_info or [])
+    writer.write(path)
+    return writer
+
+
+# An IR file mapped into memory, the arrays are views of the mapping and strings are only decoded when used
+class IRFile:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+        try:
+            self.read_sections()
+        except (ValueError, TypeError, struct.error):
+            self.close()
+            raise ValueError(f"'{path}' is not a version {IR_VERSION} IR file")
+
+
+    def read_sections(self):
+        magic, version, self.flags, string_count, node_count, child_count, line_count, operand_count, symbol_count = \
+            HEADER.unpack_from(self.map, 0)
+        if magic != IR_MAGIC or version != IR_VERSION:
+            raise ValueError("bad header")
+        self.buffer = memoryview(self.map)
+        self.position = HEADER.size
+
+        self.offsets = self.section(4 * (string_count + 1), 'I')
+        self.blob = self.section(self.offsets[string_count], 'B')
+        self.kinds = self.section(node_count, 'B')
+        self.values = self.section(8 * node_count, 'q')
+        self.children = self.section(4 * child_count, 'I')
+        self.line_starts = self.section(4 * (line_count + 1), 'I')
+        self.operands = self.section(4 * operand_count, 'I')
+        self.symbol_strings = self.section(8 * symbol_count, 'I')
+        self.strings = [None] * string_count
+
+
+    # Helper, the next section as a typed view of the mapping
+    def section(self, size, typecode):
+        if self.position + size > len(self.buffer):
+            raise ValueError("truncated")
+        view = self.buffer[self.position:self.position + size]
+        self.position += size + (-size % 8)
+        if sys.byteorder != 'little' and typecode != 'B':
+            values = array(typecode, view.tobytes())
+            values.byteswap()
+            return values
+        return view.cast(typecode)
+
+
+    def string(self, index):
+        text = self.strings[index]
+        if text is None:
+            text = self.strings[index] = str(self.blob[self.offsets[index]:self.offsets[index + 1]], "utf-8")
+        return text
+
+
+    def has_ast(self):
+        return bool(self.flags & HAS_AST)
+
+
+    def has_tac(self):
+        return bool(self.flags & HAS_TAC)
+
+
+    # Rebuilds the AST, every node once, in the order they were written
+    def ast(self):
+        if not self.has_ast():
+            return None
+        nodes = []
+        kinds, values, children = self.kinds, self.values, self.children
+        for index in range(len(kinds)):
+            kind, value = kinds[index], values[index]
+            if kind == TUPLE or kind == LIST:
+                start, count = value >> 32, value & 0xFFFFFFFF
+                items = [nodes[child] for child in children[start:start + count]]
+                nodes.append(tuple(items) if kind == TUPLE else items)
+            elif kind == STRING:
+                nodes.append(self.string(value))
+            elif kind == INT:
+                nodes.append(value)
+            elif kind == FLOAT:
+                nodes.append(struct.unpack("<d", struct.pack("<q", value))[0])
+            elif kind == NONE:
+                nodes.append(None)
+            elif kind == BIG_INT:
+                nodes.append(int(self.string(value)))
+            else:
+                nodes.append(kind == TRUE)
+        return nodes[-1] if nodes else []
+
+
+    def tac(self):
+        if not self.has_tac():
+            return None
+        string, starts, operands = self.string, self.line_starts, self.operands
+        return [" ".join([string(operand) for operand in operands[starts[line]:starts[line + 1]]])
+                for line in range(len(starts) - 1)]
+
+
+    # Symbol id -> (name, type), as the parser's SymbolTable.symbol_info
+    def symbols(self):
+        strings = self.symbol_strings
+        return [(self.string(strings[i]), self.string(strings[i + 1])) for i in range(0, len(strings), 2)]
+
+
+    # The views have to be released before the mapping can be closed
+    def close(self):
+        for name in ('offsets', 'blob', 'kinds', 'values', 'children', 'line_starts', 'operands', 'symbol_strings',
+                     'buffer'):
+            view = self.__dict__.pop(name, None)
+            if isinstance(view, memoryview):
+                view.release()
+        self.map.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Stands in for the parser's SymbolTable when the front end ran in another process, the optimizers only need the
+# symbols by id, which answer the same questions as they do for the parser
+class LoadedSymbolTable:
+    def __init__(self, symbol_info):
+        self.symbol_info = symbol_info
+
+
+    variable_types = SymbolTable.variable_types
+    declared_names = SymbolTable.declared_names
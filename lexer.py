@@ -3,14 +3,18 @@
 # lexer.py
 
 import re
+import os
 
 # Credit to these websites for help: https://regexr.com/, and https://github.com/c-testsuite/c-testsuite for test files
 
+KEYWORDS = ['auto', 'break', 'case', 'char', 'const', 'continue', 'default', 'do', 'double', 'else', 'enum', 'extern',
+            'float', 'for', 'goto', 'if', 'inline', 'int', 'long', 'register', 'restrict', 'return', 'short', 'signed',
+            'sizeof', 'static', 'struct', 'switch', 'typedef', 'union', 'unsigned', 'void', 'volatile', 'while']
+
 # My Grammar:
+# Comments come before the arithmetic operators, otherwise "//" and "/*" would be lexed as two operators
 TOKEN_TYPES = [
-    (r'\b(auto|break|case|char|const|continue|default|do|double|else|enum|extern|float|for| \
-     goto|if|inline|int|long|register|restrict|return|short|signed|sizeof|static|struct| \
-     switch|typedef|union|unsigned|void|volatile|while)\b', 'KEYWORD'),
+    (r'\b(' + '|'.join(KEYWORDS) + r')\b', 'KEYWORD'),
     (r'\b([a-zA-Z_][a-zA-Z0-9_]*)\b', 'IDENTIFIER'),
     (r'0b[01]+', 'BINARY_LITERAL'),
     (r'0o?[0-7]+', 'OCTAL_LITERAL'),
@@ -19,66 +23,198 @@ TOKEN_TYPES = [
     (r'\b\d+\b', 'INTEGER_LITERAL'),
     (r'"(?:[^"\\]|\\.)*"', 'STRING_LITERAL'),
     (r"'(?:[^'\\]|\\.)'", 'CHARACTER_LITERAL'),
+    (r'//[^\n]*', 'SINGLE_LINE_COMMENT'),
+    (r'/\*[\s\S]*?\*/', 'MULTI_LINE_COMMENT'),
     (r'\+\+', 'INCREMENT_OPERATOR'), 
     (r'--', 'DECREMENT_OPERATOR'),
-    (r'[\+\-\*\/\%]+', 'ARITHMETIC_OPERATOR'),
-    (r'[=]', 'ASSIGNMENT_OPERATOR'),
-    (r'\b(?:and|or|not|&&|\|)\b', 'LOGICAL_OPERATOR'),
+    (r'[\+\-\*\/\%]=', 'ASSIGNMENT_OPERATOR'),
+    (r'[\+\-\*\/\%]', 'ARITHMETIC_OPERATOR'),
     (r'[<>]=?|==|!=', 'COMPARISON_OPERATOR'),
-    (r'[.;(){}]', 'PUNCTUATION'),
+    (r'[=]', 'ASSIGNMENT_OPERATOR'),
+    (r'&&|\|\||!', 'LOGICAL_OPERATOR'),
+    (r'[.,;:(){}]', 'PUNCTUATION'),
     (r'\s+', 'WHITESPACE'),
-    (r'//[^\n]*', 'SINGLE_LINE_COMMENT'),
-    (r'/\*[\s\S]*?\*/', 'MULTI_LINE_COMMENT'),
 ]
 
+# Parallel lexing, sources smaller than this are always lexed in one piece
+MIN_CHUNK_SIZE = 1 << 18
+# Tokens that can span lines, chunks must not split them
+PATTERNS = {token_type: pattern for pattern, token_type in TOKEN_TYPES}
+STRING_LITERAL = re.compile(PATTERNS['STRING_LITERAL'])
+CHARACTER_LITERAL = re.compile(PATTERNS['CHARACTER_LITERAL'])
+BLOCK_COMMENT = re.compile(PATTERNS['MULTI_LINE_COMMENT'])
+SPECIAL_CHARACTER = re.compile(r'["\'/]')
+
+
+# Token types that are skipped
+IGNORED_TOKEN_TYPES = {'WHITESPACE', 'SINGLE_LINE_COMMENT', 'MULTI_LINE_COMMENT'}
+
+# Compiled rule tables, built once per list of rules and shared by every Lexer
+# All rules are one pattern of named alternatives r0|r1|..., the regex engine tries them in order at each index
+# just like trying the rules one by one did, and the first that matches is the token
+LEXER_TABLES = {}
+
+
+def lexer_table(rules):
+    key = tuple(rules)
+    if key not in LEXER_TABLES:
+        pattern = re.compile("|".join(f"(?P<r{index}>{rule})" for index, (rule, _) in enumerate(rules)))
+        LEXER_TABLES[key] = (pattern, {f"r{index}": token_type for index, (_, token_type) in enumerate(rules)})
+    return LEXER_TABLES[key]
+
 
 class Lexer:
     # Initializing the lexer
     def __init__(self, rules):
-        self.rules = [(re.compile(pattern), token_type) for pattern, token_type in TOKEN_TYPES]
+        self.pattern, self.token_types = lexer_table(rules)
 
     # Tokenizing Function
     def tokenize(self, text):
+        return [token for token, _ in self.scan(text)]
+
+
+    # Tokenizes large sources in chunks on a process pool, the tokens are the same as tokenize gives
+    # Chunks start after a newline that is outside of any string, character literal, or comment, and only their
+    # first line number has to be known. A chunk that fails is lexed again here, so the error is the same too.
+    def tokenize_parallel(self, text, workers = None):
+        workers = workers or os.cpu_count() or 1
+        chunk_count = min(workers, len(text) // MIN_CHUNK_SIZE)
+        if chunk_count < 2:
+            return self.tokenize(text)
+
+        starts = [0] + split_points(text, chunk_count) + [len(text)]
+        lines = [1]
+        for start, end in zip(starts, starts[1:-1]):
+            lines.append(lines[-1] + text.count('\n', start, end))
+
+        # The process pool is only loaded when a file is big enough to need it
+        from concurrent.futures import ProcessPoolExecutor
+        chunks = [text[start:end] for start, end in zip(starts, starts[1:])]
+        with ProcessPoolExecutor(min(workers, len(chunks))) as pool:
+            results = list(pool.map(lex_chunk, chunks, lines))
+
         tokens = []
-        index = 0
-        lineNum = 1
-        columnNum = 1
+        for start, line, chunk_tokens in zip(starts, lines, results):
+            if chunk_tokens is None:
+                # Lexing on from here raises the error sequential lexing would, with its index in the whole text
+                return tokens + [token for token, _ in self.scan(text, start, line, 1)]
+            tokens += chunk_tokens
+        return tokens
 
-        while index < len(text):
-            match = None
 
+    # Scans tokens one at a time, yielding each token with the index it starts at
+    # Can start in the middle of the text when the line and column there are known
+    def scan(self, text, index = 0, lineNum = 1, columnNum = 1):
+        pattern = self.pattern
+        token_types = self.token_types
+        while index < len(text):
             # Checking if the new token matches something in the grammar
-            for pattern, tokenType in self.rules:
-                match = pattern.match(text, index)
-
-                if match:
-                    tokenText = match.group(0)
-                    tokenLength = len(tokenText)
-
-                    # Ignoring Whitespace
-                    if tokenType not in {'WHITESPACE', 'SINGLE_LINE_COMMENT', 'MULTI_LINE_COMMENT'}:
-                        tokens.append((tokenText, tokenType, lineNum, columnNum))
-
-                    # Updating index, lineNum, and columnNum
-                    index = match.end(0)
-                    length = tokenText.splitlines()
-                    if len(length) > 1:
-                        lineNum += len(length) - 1
-                        columnNum = len(length[-1]) + 1
-                    else:
-                        columnNum += tokenLength
-                    break
+            match = pattern.match(text, index)
+
+            if match:
+                tokenText = match.group(0)
+                tokenType = token_types[match.lastgroup]
+                tokenLength = len(tokenText)
+
+                # Ignoring Whitespace
+                if tokenType not in IGNORED_TOKEN_TYPES:
+                    yield (tokenText, tokenType, lineNum, columnNum), index
+
+                # Updating index, lineNum, and columnNum
+                index = match.end(0)
+                # Counting newlines directly, splitlines() drops a trailing one and blank lines were missed
+                newlines = tokenText.count('\n')
+                if newlines:
+                    lineNum += newlines
+                    columnNum = tokenLength - tokenText.rfind('\n')
+                else:
+                    columnNum += tokenLength
+                continue
           
             # Catching unsupported Grammar
-            if not match:
-                if index < len(text):
-                    errorChar = text[index]
-                else:
-                    # Else, End of File reached
-                    errorChar = '<EOF>'
+            raise SyntaxError(f"Unexpected character: {text[index]} at line {lineNum}, column {columnNum}")
 
-                print(f"Position: {index}, Line number: {lineNum}, Column number: {columnNum}")
-                raise SyntaxError(f"Unexpected character: {text[index]} at line {lineNum}, column {columnNum}")
-              
-        return tokens
+
+# Tokens lexed only when the parser gets to them, so a streaming compile never holds all of them
+# Indexes count from the start of the input, tokens before the last release() are dropped. A lexing error ends
+# the tokens early and is kept in error, for the parser to raise once it has reached the end.
+class TokenBuffer:
+    def __init__(self, tokens):
+        self.iterator = iter(tokens)
+        self.tokens = []
+        self.start = 0  # Index of self.tokens[0]
+        self.error = None
+
+
+    # Lexes text lazily
+    @classmethod
+    def from_text(cls, text):
+        return cls(token for token, _ in Lexer(TOKEN_TYPES).scan(text))
+
+
+    def __getitem__(self, index):
+        index -= self.start
+        if index < 0:
+            raise ValueError("Token was already released")
+        while index >= len(self.tokens):
+            try:
+                self.tokens.append(next(self.iterator))
+            except StopIteration:
+                raise IndexError("End of input")
+            except SyntaxError as error:
+                self.error = error
+                raise IndexError("End of input")
+        return self.tokens[index]
+
+
+    # Drops every token before index
+    def release(self, index):
+        del self.tokens[:index - self.start]
+        self.start = index
+
+
+# Helper for parallel lexing, tokenizes one chunk starting at the given line, None if it does not lex
+def lex_chunk(chunk, line):
+    try:
+        return [token for token, _ in Lexer(TOKEN_TYPES).scan(chunk, 0, line, 1)]
+    except SyntaxError:
+        return None
+
+
+# Helper for parallel lexing, up to count - 1 indexes that start a line outside of any multi-line token
+# Only quotes and slashes can start one, so the scan jumps from one of those to the next. After text the lexer
+# would fail on there are no more split points, the rest is one chunk and fails the same way.
+def split_points(text, count):
+    points = []
+    index = 0  # Everything before this is known to be outside of strings and comments
+    for chunk in range(1, count):
+        target = max(index, len(text) * chunk // count)
+        while True:
+            newline = text.find('\n', target)
+            if newline < 0:
+                return points
+            special = SPECIAL_CHARACTER.search(text, index, newline)
+            if special is None:
+                break
+            index = skip_token(text, special.start())
+            if index is None:
+                return points
+            target = max(index, target)
+        index = newline + 1
+        points.append(index)
+    return points
+
+
+# Helper for split_points, the index after the string, character, or comment starting at index, None if it is one
+# the lexer cannot read
+def skip_token(text, index):
+    char = text[index]
+    if char == '/':
+        if text.startswith('//', index):
+            end = text.find('\n', index)
+            return len(text) if end < 0 else end
+        match = BLOCK_COMMENT.match(text, index)
+        return match.end() if match else index + 1
+    match = (STRING_LITERAL if char == '"' else CHARACTER_LITERAL).match(text, index)
+    return match.end() if match else None
 
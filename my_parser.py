@@ -2,23 +2,75 @@
 # Date: 11/08/24
 # my_parser.py 
 
+from lexer import TokenBuffer
+from constant_eval import evaluate_binary, evaluate_unary, wrap_int
+
+# Precedence and associativity of every binary operator, higher binds tighter
+# AI helped me with the use of a precendence/priority table
+BINARY_OPERATORS = {
+    '||': (1, 'left'),  # Logical OR
+    '&&': (2, 'left'),  # Logical AND
+    '==': (3, 'left'), '!=': (3, 'left'),  # Comparison operators
+    '<': (4, 'left'), '>': (4, 'left'), '<=': (4, 'left'), '>=': (4, 'left'),  # More comparison operators
+    '+': (5, 'left'), '-': (5, 'left'),  # Addition and subtraction
+    '*': (6, 'left'), '/': (6, 'left'), '%': (6, 'left'),  # Multiplication, division, and modulus
+}
+
+# Operators that can appear in front of an operand
+PREFIX_OPERATORS = {'++', '--', '-', '!'}
+
+# Token types that can hold a binary operator
+OPERATOR_TOKEN_TYPES = {'ARITHMETIC_OPERATOR', 'COMPARISON_OPERATOR', 'LOGICAL_OPERATOR'}
+
+# Raised at the end of parsing when any errors were found, holds every (line, column, message) diagnostic
+class ParseError(SyntaxError):
+    def __init__(self, diagnostics, filename = None):
+        super().__init__(f"{len(diagnostics)} error(s) found")
+        self.diagnostics = diagnostics
+        self.filename = filename
+
+    # Keeps the diagnostics when the error is sent back from a worker process
+    def __reduce__(self):
+        return (ParseError, (self.diagnostics, self.filename))
+
+
 class Parser: 
 
-    def __init__(self, tokens):
+    # tokens is a list, or a TokenBuffer that lexes them as parsing gets to them
+    def __init__(self, tokens, keep_exited_scopes = True):
         self.tokens = tokens
         self.pos = 0
-        self.current_token = tokens[0]
-        self.symbol_table = SymbolTable()
+        self.current_token = self.token_at(0)
+        self.last_token = self.current_token  # Errors at the end of the input are reported here
+        self.symbol_table = SymbolTable(keep_exited_scopes)
+        # Every error found so far, parsing continues after each one
+        self.errors = []
+        # Token range [start, end) of every top-level item in the AST
+        self.spans = []
+        # Loops and switches the parser is inside of, break is only allowed in one
+        self.break_depth = 0
 
 
     # Function to move on to the next token    
     def next(self):
         self.pos += 1
-        # Check to see if the token_list is finished
-        if self.pos < len(self.tokens):
-            self.current_token = self.tokens[self.pos]
-        else:
-            self.current_token = None
+        # None once the token list is finished
+        self.current_token = self.token_at(self.pos)
+        if self.current_token is not None:
+            self.last_token = self.current_token
+
+
+    # Token at an index, None past the end
+    def token_at(self, index):
+        try:
+            return self.tokens[index]
+        except IndexError:
+            return None
+
+
+    # Lookahead, the token after the current one
+    def peek(self):
+        return self.token_at(self.pos + 1)
     
 
     # Function to double check that the token type is correct
@@ -31,24 +83,81 @@ class Parser:
         if self.current_token[1] != token_type or (token_value and self.current_token[0] != token_value):
             expected_value = token_value if token_value else token_type
             actual_value = repr(self.current_token[0]) if self.current_token else 'None'
-            raise SyntaxError(f"Expected {expected_value}, but got {actual_value} \
-                              at line {self.current_token[2]}, column {self.current_token[3]}")
+            raise SyntaxError(f"Expected {expected_value}, but got {actual_value}")
         
         self.next()
 
 
+    # Error Recovery - record the error with the position of the token it was found at
+    def report_error(self, error):
+        token = self.current_token if self.current_token is not None else self.last_token
+        self.errors.append((token[2], token[3], str(error)))
+
+
+    # Error Recovery - panic mode, skip ahead to the end of the broken statement
+    # Stops after a ';' or in front of the '}' closing the current block, nested {...} are skipped whole
+    def synchronize(self):
+        depth = 0
+        while self.current_token is not None:
+            token_text = self.current_token[0]
+            if token_text == '{':
+                depth += 1
+            elif token_text == '}':
+                if depth == 0:
+                    return
+                depth -= 1
+                if depth == 0:
+                    self.next()
+                    return
+            elif token_text == ';' and depth == 0:
+                self.next()
+                return
+            self.next()
+
+
+    # Error Recovery - report, leave the scopes the failed statement entered, and synchronize
+    def recover(self, error, scope_depth):
+        self.report_error(error)
+        while len(self.symbol_table.scope_names) > scope_depth:
+            self.symbol_table.exit_scope()
+        self.synchronize()
+
+
     # Main parsing function
     def parse(self):
-        ast = []
+        return list(self.parse_items())
+
 
+    # Parses the top-level items one at a time and yields each one as soon as it is complete
+    # Errors are still collected and raised together at the end of the input
+    def parse_items(self):
         # Start parsing - declarations, functions, etc.
         while self.current_token is not None:
-            if self.current_token and self.current_token[1] == 'KEYWORD':
-                ast.append(self.parse_function_definition())
-            else:
-                ast.append(self.parse_statement())
-    
-        return ast
+            start_pos = self.pos
+            scope_depth = len(self.symbol_table.scope_names)
+            try:
+                if self.current_token and self.current_token[1] == 'KEYWORD':
+                    item = self.parse_function_definition()
+                else:
+                    item = self.parse_statement()
+                self.spans.append((start_pos, self.pos))
+            except (SyntaxError, NameError) as error:
+                self.recover(error, scope_depth)
+                # A stray '}' at the top level, skip it so parsing moves on
+                if self.pos == start_pos:
+                    self.next()
+                continue
+            yield item
+            # A streamed token buffer can drop everything before the next item
+            if isinstance(self.tokens, TokenBuffer):
+                self.tokens.release(self.pos)
+
+        # The input ended early because it did not lex, that error comes first as it would without streaming
+        if isinstance(self.tokens, TokenBuffer) and self.tokens.error:
+            raise self.tokens.error
+        # Report every error at once
+        if self.errors:
+            raise ParseError(self.errors)
 
 
     # Function Definitions Parsing - "int main()" and such
@@ -94,7 +203,7 @@ class Parser:
 
             parameters.append((param_type, param_name))
 
-            if self.current_token[0] == ',':
+            if self.current_token and self.current_token[0] == ',':
                 self.expected_type('PUNCTUATION')
 
         return parameters
@@ -113,7 +222,7 @@ class Parser:
         if self.current_token and self.current_token[0] != ')':
             while True:
                 arguments.append(self.parse_expression())
-                if self.current_token[0] == ')':
+                if self.current_token and self.current_token[0] == ')':
                     break
                 self.expected_type('PUNCTUATION', ',')
 
@@ -127,7 +236,7 @@ class Parser:
         var_type = self.current_token[0]
         self.next()
         
-        if self.current_token[1] == 'IDENTIFIER':
+        if self.current_token and self.current_token[1] == 'IDENTIFIER':
             var_name = self.current_token[0]
             # Only declare the variable in the current (function) scope if it doesn’t already exist
             if not self.symbol_table.lookup(var_name, current_scope_only=True):
@@ -138,9 +247,9 @@ class Parser:
 
         # Double checking for additional assignments 
         assignment = None
-        if self.current_token[1] == 'ASSIGNMENT_OPERATOR':
-            # Skipping "=" and then parsing
-            self.next()
+        if self.current_token and self.current_token[1] == 'ASSIGNMENT_OPERATOR':
+            # Skipping "=" and then parsing, a declaration cannot use "+=" and the like
+            self.expected_type('ASSIGNMENT_OPERATOR', '=')
             assignment = self.parse_expression()
 
         self.expected_type('PUNCTUATION', ';')
@@ -159,13 +268,22 @@ class Parser:
         else:
             raise NameError(f"Variable '{var_name}' not declared.")
         
-        self.expected_type('ASSIGNMENT_OPERATOR', '=')
-        expression = self.parse_expression()
+        expression = self.parse_assigned_value(var_name)
         self.expected_type('PUNCTUATION', ';')
 
         return ('Assignment', var_name, expression)
 
 
+    # Helper for assignments, the value after "=" or after a compound operator, "x += 2" is "x = x + 2"
+    def parse_assigned_value(self, var_name, priority = 0):
+        operator = self.current_token[0]
+        self.expected_type('ASSIGNMENT_OPERATOR')
+        value_expr = self.parse_expression(priority)
+        if operator != '=':
+            value_expr = ('BinaryExpression', operator[0], ('Variable', var_name), value_expr)
+        return value_expr
+
+
     # Statement Parsing
     def parse_statement(self):
         # If no more tokens exist, stop parsing
@@ -184,30 +302,45 @@ class Parser:
                 return self.parse_declaration()
             elif self.current_token[0] == 'return':
                 return self.parse_return_statement()
+            elif self.current_token[0] == 'switch':
+                return self.parse_switch_statement()
+            elif self.current_token[0] == 'break':
+                return self.parse_break_statement()
         elif self.current_token[1] == 'IDENTIFIER':
             # Look ahead to identify if this is an assignemnt or unary operation
-            if self.pos + 1 < len(self.tokens) and self.tokens[self.pos + 1][1] in {'ASSIGNMENT_OPERATOR', 'INCREMENT_OPERATOR', 'DECREMENT_OPERATOR'}:
+            next_token = self.peek()
+            if next_token and next_token[1] in {'ASSIGNMENT_OPERATOR', 'INCREMENT_OPERATOR', 'DECREMENT_OPERATOR'}:
                 # Basic assignment
-                if self.tokens[self.pos + 1][1] == 'ASSIGNMENT_OPERATOR':
+                if next_token[1] == 'ASSIGNMENT_OPERATOR':
                     return self.parse_assignment()
                 # Handling post-increment/decrement
-                elif self.tokens[self.pos + 1][1] in {'INCREMENT_OPERATOR', 'DECREMENT_OPERATOR'}:
+                elif next_token[1] in {'INCREMENT_OPERATOR', 'DECREMENT_OPERATOR'}:
                     var_name = self.current_token[0]
+                    if not self.symbol_table.lookup(var_name):
+                        raise NameError(f"Variable '{var_name}' not declared.")
                     self.next()  
                     op_token = self.current_token
                     self.next()  
                     self.expected_type('PUNCTUATION', ';')
                     return ('UnaryExpression', op_token[0], ('Variable', var_name))
+            # Function call used as a statement - "foo(x);"
+            elif next_token and next_token[0] == '(':
+                call = self.parse_function_call()
+                self.expected_type('PUNCTUATION', ';')
+                return call
         # Handling pre-increment/decrement
         elif self.current_token[1] in {'INCREMENT_OPERATOR', 'DECREMENT_OPERATOR'}:
             op_token = self.current_token
             self.next()  
             var_name = self.current_token[0]
+            if self.current_token[1] == 'IDENTIFIER' and not self.symbol_table.lookup(var_name):
+                raise NameError(f"Variable '{var_name}' not declared.")
             self.expected_type('IDENTIFIER')
             self.expected_type('PUNCTUATION', ';')
             return ('UnaryExpression', op_token[0], ('Variable', var_name))
-        else:
-            raise SyntaxError(f"Unexpected token: {self.current_token}")
+
+        # Anything else is not a statement, raising here also keeps parse_block from looping forever
+        raise SyntaxError(f"Unexpected token: {self.current_token[0]!r}")
         
 
     # If-Statement Parsing: if (condition) {statements} 
@@ -240,10 +373,10 @@ class Parser:
         
         # Check if the body/statements is longer than one line
         if self.current_token and self.current_token[0] == '{':
-            body = self.parse_block() 
+            body = self.parse_breakable(self.parse_block)
         else:
-            single_statement = self.parse_statement()
-            body = [single_statement] if single_statement else []
+            single_statement = self.parse_breakable(self.parse_statement)
+            body = ('Block', [single_statement] if single_statement else [])
 
         return ('WhileLoop', condition, body)
     
@@ -279,12 +412,11 @@ class Parser:
             self.next()
 
         # Body
+        self.symbol_table.enter_scope()
         if self.current_token and self.current_token[0] == '{':
-            self.symbol_table.enter_scope()
-            body = self.parse_block()
+            body = self.parse_breakable(self.parse_block)
         else:
-            body = [self.parse_statement()]
-            self.symbol_table.exit_scope()
+            body = ('Block', [self.parse_breakable(self.parse_statement)])
         self.symbol_table.exit_scope()
 
         return ('ForLoop', initialization, condition, update, body)
@@ -304,6 +436,84 @@ class Parser:
         return ('ReturnStatement', return_value)
     
 
+    # Switch Parsing: switch (expression) { case constant: statements ... default: statements }
+    # The body is split into sections at its labels, ('Case', value, block) and ('Default', block) in source order.
+    # A section without a break falls into the next one, as in C.
+    def parse_switch_statement(self):
+        self.next()
+        self.expected_type('PUNCTUATION', '(')
+        expression = self.parse_expression()
+        self.expected_type('PUNCTUATION', ')')
+
+        self.symbol_table.enter_scope()
+        self.expected_type('PUNCTUATION', '{')
+        sections = []  # [kind, value, statements] while the body is read
+        case_values = set()
+        has_default = False
+
+        self.break_depth += 1
+        try:
+            while self.current_token and self.current_token[0] != '}':
+                scope_depth = len(self.symbol_table.scope_names)
+                try:
+                    if self.current_token[0] == 'case':
+                        self.next()
+                        value = self.parse_case_value()
+                        self.expected_type('PUNCTUATION', ':')
+                        if value in case_values:
+                            raise SyntaxError(f"Duplicate case value {value}")
+                        case_values.add(value)
+                        sections.append(['Case', value, []])
+                    elif self.current_token[0] == 'default':
+                        self.next()
+                        self.expected_type('PUNCTUATION', ':')
+                        if has_default:
+                            raise SyntaxError("Multiple default labels in one switch")
+                        has_default = True
+                        sections.append(['Default', None, []])
+                    elif not sections:
+                        raise SyntaxError(f"Expected 'case' or 'default', but got {self.current_token[0]!r}")
+                    else:
+                        sections[-1][2].append(self.parse_statement())
+                except (SyntaxError, NameError) as error:
+                    self.recover(error, scope_depth)
+        finally:
+            self.break_depth -= 1
+
+        self.expected_type('PUNCTUATION', '}')
+        self.symbol_table.exit_scope()
+
+        sections = [('Case', value, ('Block', statements)) if kind == 'Case' else ('Default', ('Block', statements))
+                    for kind, value, statements in sections]
+        return ('SwitchStatement', expression, sections)
+
+
+    # Helper for Switch Parsing, the value after 'case' has to be an integer constant expression
+    def parse_case_value(self):
+        value = constant_value(self.parse_expression())
+        if not isinstance(value, int):
+            raise SyntaxError("Case label must be an integer constant")
+        return wrap_int(value)
+
+
+    # Break Parsing: break; leaves the innermost loop or switch
+    def parse_break_statement(self):
+        if not self.break_depth:
+            raise SyntaxError("'break' outside of a loop or switch")
+        self.next()
+        self.expected_type('PUNCTUATION', ';')
+        return ('BreakStatement',)
+
+
+    # Helper to parse the body of a loop, break is allowed inside it
+    def parse_breakable(self, parse_body):
+        self.break_depth += 1
+        try:
+            return parse_body()
+        finally:
+            self.break_depth -= 1
+
+
     # Helper function to parse through Block Statements
     def parse_block(self, enter_scope = True):
         # Enter a new scope, if needed
@@ -315,7 +525,12 @@ class Parser:
 
         # Everything within brackets is considered inside the block
         while self.current_token and self.current_token[0] != '}':
-            statement = self.parse_statement()
+            scope_depth = len(self.symbol_table.scope_names)
+            try:
+                statement = self.parse_statement()
+            except (SyntaxError, NameError) as error:
+                self.recover(error, scope_depth)
+                continue
             if statement is not None:
                  statements.append(statement)  
 
@@ -327,42 +542,76 @@ class Parser:
         return ('Block', statements)
 
 
-    # Expression Parsing - ChatGPT helped me fill in some gaps here, mostly with helper functions
+    # Expression Parsing - Pratt style, operator chains are handled by one loop instead of recursion
     def parse_expression(self, priority = 0):
-        # Check for pre-increment or pre-decrement
-        if self.current_token[0] in ('++', '--'):
-            op_token = self.current_token
-            self.next()  
-            operand = self.parse_primaryExp() 
-            return ('UnaryExpression', op_token[0], operand)
+        if self.current_token is None:
+            raise SyntaxError("Unexpected end of input, expected an expression")
 
         # If the expression is ID + '=', treat it as an assignment
-        if self.current_token[1] == 'IDENTIFIER' and self.pos + 1 < len(self.tokens) \
-                            and self.tokens[self.pos + 1][1] == 'ASSIGNMENT_OPERATOR':
+        next_token = self.peek()
+        if self.current_token[1] == 'IDENTIFIER' and next_token and next_token[1] == 'ASSIGNMENT_OPERATOR':
             var_name = self.current_token[0]
             self.next()  
-            self.expected_type('ASSIGNMENT_OPERATOR', '=')
-            value_expr = self.parse_expression(priority)  
+            value_expr = self.parse_assigned_value(var_name, priority)
             return ('Assignment', var_name, value_expr)
-    
-        # Handle non-assignment expressions
-        left_expr = self.parse_primaryExp()
 
-        # While the next token is an operator, parse the binary operation
-        while self.current_token and self.is_operator(self.current_token) and \
-                            self.get_priority(self.current_token) > priority:
-            op_token = self.current_token
+        operands = [self.parse_unaryExp()]
+        operators = []
+
+        # While the next token is a binary operator, shift it or reduce the ones that bind tighter
+        while self.current_token and self.current_token[1] in OPERATOR_TOKEN_TYPES:
+            op = self.current_token[0]
+            if op not in BINARY_OPERATORS:
+                break
+            op_priority, associativity = BINARY_OPERATORS[op]
+            if op_priority <= priority:
+                break
+
+            while operators and (operators[-1][1] > op_priority or
+                                 (operators[-1][1] == op_priority and associativity == 'left')):
+                self.reduce_expression(operands, operators)
+
+            operators.append((op, op_priority))
+            self.next()
+            operands.append(self.parse_unaryExp())
+
+        while operators:
+            self.reduce_expression(operands, operators)
+
+        return operands[0]
+
+
+    # Helper function for Expression Parsing, combines the top operator with its two operands
+    def reduce_expression(self, operands, operators):
+        op, _ = operators.pop()
+        right_expr = operands.pop()
+        left_expr = operands.pop()
+        operands.append(('BinaryExpression', op, left_expr, right_expr))
+
+
+    # Helper function for Expression Parsing to handle prefix operators (++x, --x, -x, !x)
+    def parse_unaryExp(self):
+        prefix_ops = []
+        while self.current_token and self.current_token[0] in PREFIX_OPERATORS:
+            prefix_ops.append(self.current_token[0])
             self.next()
-            right_expr = self.parse_expression(self.get_priority(op_token))
-            left_expr = ('BinaryExpression', op_token[0], left_expr, right_expr)
 
-        return left_expr
+        operand = self.parse_primaryExp()
+        for op in reversed(prefix_ops):
+            # ++ and -- store into their operand, so it has to be a variable, "--4" or "++(x + 1)" is an error
+            if op in ('++', '--') and operand[0] != 'Variable':
+                raise SyntaxError(f"Operand of '{op}' has to be a variable")
+            operand = ('UnaryExpression', op, operand)
+
+        return operand
     
 
     # Helper function for Expression Parsing in order to parse a primary expression
     # (literal, identifer, or an expression in paratheses)
     def parse_primaryExp(self):
         token = self.current_token
+        if token is None:
+            raise SyntaxError("Unexpected end of input, expected an expression")
 
         # Takes in numeric literals (int, float, hex, binary, octal) 
         if token[1] in {'INTEGER_LITERAL', 'FLOATING_POINT_LIT', 'HEX_LITERAL', 'BINARY_LITERAL', 'OCTAL_LITERAL'}:
@@ -385,6 +634,14 @@ class Parser:
             return ('Number', value)
         
         elif token[1] == 'IDENTIFIER':
+            # Function calls are resolved later, they may be defined in another file
+            next_token = self.peek()
+            if next_token and next_token[0] == '(':
+                return self.parse_function_call()
+
+            # Checked before advancing, so the error points at the identifier
+            if not self.symbol_table.lookup(token[0]):
+                raise NameError(f"Variable '{token[0]}' not declared.")
             self.next()
             # Check for postfix increment or decrement
             if self.current_token and self.current_token[0] in ('++', '--'):
@@ -392,10 +649,7 @@ class Parser:
                 self.next()  
                 return ('UnaryExpression', op_token[0], ('Variable', token[0]), 'postfix')
 
-            if self.symbol_table.lookup(token[0]):
-                return ('Variable', token[0])
-            else:
-                raise NameError(f"Variable '{token[0]}' not declared.")
+            return ('Variable', token[0])
         elif token[1] == 'STRING_LITERAL':  
             self.next()
             return ('StringLiteral', token[0])
@@ -406,65 +660,118 @@ class Parser:
             self.expected_type('PUNCTUATION', ')')
             return expr
         else:
-            raise SyntaxError(f"Unexpected token: {token}")
-
+            raise SyntaxError(f"Unexpected token: {token[0]!r}")
 
-    # Helper function for Expression Parsing to check if a token is an operator
-    def is_operator(self, token):
-        return token[1] == "ARITHMETIC_OPERATOR" or "LOGICAL_OPERATOR"
 
-
-    # Helper function to ensure correct order of arthimetic operations
-    # AI helped me with the use of a precendence/priority table
-    def get_priority(self, token):
-        priority_map = {
-            '||': 1,  # Logical OR
-            '&&': 2,  # Logical AND
-            '==': 3, '!=': 3,  # Comparison operators
-            '<': 4, '>': 4, '<=': 4, '>=': 4,   # More comparison operators
-            '+': 5, '-': 5,  # Addition and subtraction
-            '*': 6, '/': 6, '%': 6,  # Multiplication, division, and modulus 
-        }
-        return priority_map.get(token[0], 0)
+# Value of a constant expression node, None if it is not one (e.g. it reads a variable)
+def constant_value(node):
+    if node[0] == 'Number':
+        return node[1]
+    if node[0] == 'UnaryExpression' and len(node) == 3 and node[1] in ('-', '!'):
+        value = constant_value(node[2])
+        return None if value is None else evaluate_unary(node[1], value)
+    if node[0] == 'BinaryExpression':
+        left, right = constant_value(node[2]), constant_value(node[3])
+        return None if left is None or right is None else evaluate_binary(node[1], left, right)
+    return None
 
 
+# Every name maps to a stack of (depth, type, symbol id) entries, the innermost declaration is on top.
+# Lookups are a single dict access and exiting a scope only touches the names declared in it.
 class SymbolTable:
-    def __init__(self):
-        self.scopes = [{}]  
-        # Tracking exited scopes
+    def __init__(self, keep_exited_scopes = True):
+        self.symbols = {}
+        # Names declared at each active scope depth, index 0 is the global scope
+        self.scope_names = [[]]
+        # Tracking exited scopes, only needed for printing the table afterwards
+        self.keep_exited_scopes = keep_exited_scopes
         self.exited_scopes = []
+        # Symbol id -> (name, type), IR files store the symbols under these ids
+        self.symbol_info = []
+
+    # Active scopes as {name: type} dicts, outermost first
+    @property
+    def scopes(self):
+        scopes = []
+        for depth, names in enumerate(self.scope_names):
+            scope = {}
+            for name in names:
+                for entry_depth, var_type, _ in self.symbols[name]:
+                    if entry_depth == depth:
+                        scope[name] = var_type
+            scopes.append(scope)
+        return scopes
 
     # Entering a new scope
     def enter_scope(self):
-        self.scopes.append({})
+        self.scope_names.append([])
 
     # Exiting a scope
     def exit_scope(self):
-        if not self.scopes:
+        if not self.scope_names:
             raise IndexError("No scope to exit")
-        exited_scope = self.scopes.pop()
-        self.exited_scopes.append(exited_scope)
+        exited_scope = {}
+        for name in self.scope_names.pop():
+            stack = self.symbols[name]
+            _, var_type, _ = stack.pop()
+            exited_scope[name] = var_type
+            if not stack:
+                del self.symbols[name]
+        if self.keep_exited_scopes:
+            self.exited_scopes.append(exited_scope)
         return exited_scope
 
+    # Adds a new symbol entry and returns its id
+    def add_symbol(self, name, var_type, depth):
+        symbol_id = len(self.symbol_info)
+        self.symbol_info.append((name, var_type))
+        self.scope_names[depth].append(name)
+        return symbol_id
+
     # Declaring variables in the Symbol Table
     def declare_variable(self, name, var_type):
-        if not self.scopes:
+        if not self.scope_names:
             raise IndexError("No scope available for declaration")
-        if name in self.scopes[-1]:
+        depth = len(self.scope_names) - 1
+        stack = self.symbols.setdefault(name, [])
+        if stack and stack[-1][0] == depth:
             raise NameError(f"Variable '{name}' already declared in this scope.")
-        self.scopes[-1][name] = var_type
+        symbol_id = self.add_symbol(name, var_type, depth)
+        stack.append((depth, var_type, symbol_id))
+        return symbol_id
 
     # Checking for if variables already exist
     def lookup(self, name, current_scope_only = False):
-        if current_scope_only:
-            return self.scopes[-1].get(name)
-        for scope in reversed(self.scopes):
-            if name in scope:
-                return scope[name]
-        return None
+        stack = self.symbols.get(name)
+        if not stack:
+            return None
+        depth, var_type, _ = stack[-1]
+        if current_scope_only and depth != len(self.scope_names) - 1:
+            return None
+        return var_type
+
+    # Name -> type for every name that was always declared with the same type, used by the optimizers
+    # Names declared with different types in different scopes are left out, since the name alone is ambiguous
+    def variable_types(self):
+        types = {}
+        ambiguous = set()
+        for name, var_type in self.symbol_info:
+            if types.setdefault(name, var_type) != var_type:
+                ambiguous.add(name)
+        for name in ambiguous:
+            del types[name]
+        return types
+
+    # Every declared variable name, whatever its type
+    def declared_names(self):
+        return {name for name, _ in self.symbol_info}
 
     # Check if function already exists
     def define_function(self, name, return_type):
-        if name in self.scopes[0]:
+        stack = self.symbols.setdefault(name, [])
+        if stack and stack[0][0] == 0:
             raise NameError(f"Function '{name}' already declared.")
-        self.scopes[0][name] = return_type
\ No newline at end of file
+        symbol_id = self.add_symbol(name, return_type, 0)
+        # Functions are global, so they sit below any local declarations of the same name
+        stack.insert(0, (0, return_type, symbol_id))
+        return symbol_id
@@ -2,245 +2,962 @@
 # Date: 12/02/24
 # three_address_code.py
 
+import heapq
+from collections import ChainMap
+from constant_eval import BINARY_OPERATORS, FLOAT_TYPES, INT_MAX, INT_MIN, INTEGER_TYPES, NEGATED_COMPARISONS, \
+    SWAPPED_COMPARISONS, convert, evaluate_binary, format_constant, parse_constant, wrap_int
+from three_address_code import Label, Temp, label_id, temp_id
+from dataflow import ControlFlowGraph, format_branch, format_table, jump_targets, liveness, parse_branch, \
+    parse_instruction, parse_table
+
+# Profile-guided loop unrolling, a loop is unrolled when it runs at least this many times per entry
+UNROLL_TRIP_COUNTS = ((16, 4), (4, 2))  # (average trips, unroll factor), checked in order
+MAX_UNROLLED_LINES = 64  # Unrolling never makes a loop longer than this
+
+
+# Conditional branches and jump tables in a listing
+def count_branches(tac):
+    return sum(1 for line in tac if line.startswith(("if ", "ifFalse ", "switch ")))
+
+
+# A listing cut after every END, the last piece holds whatever follows the last function and may be empty
+def split_functions(tac):
+    functions = [[]]
+    for line in tac:
+        functions[-1].append(line)
+        if line.endswith(" END"):
+            functions.append([])
+    return functions
+
+
 class Optimizer:
-    def __init__(self, tac):
+    def __init__(self, tac, symbol_table = None, profile = None):
         self.tac = tac
         self.constants = {} 
+        # Declared variable types, a constant stored into a variable is converted to its type
+        self.variable_types = symbol_table.variable_types() if symbol_table else {}
+        # Every declared name, renumbering never gives one of them to a temp
+        self.declared_names = symbol_table.declared_names() if symbol_table else set()
+        # First label id not used by the last renumbering
+        self.next_label = 1
+        # Times each block ran in the profile (by function name or label), kept up to date as labels change
+        self.block_counts = profile.block_counts(tac) if profile else {}
 
 
     # Main Optimization function, checks for true flags and applies the appropriate optimization techniques
-    def optimize(self, constant_folding = False, constant_propagation = False, dead_code_elimination = False):
+    def optimize(self, constant_folding = False, constant_propagation = False, dead_code_elimination = False,
+                 batch_folding = False, verify_batch = False, jump_threading = False, renumber = True, first_label = 1):
         optimized_tac = self.tac
 
-        if constant_folding:
+        # Profile-guided passes go first, while the block names still match the profile
+        # Unrolling copies a loop as it stands in the listing, so it has to run before layout moves the cold blocks
+        # of the loop out of it
+        if self.block_counts:
+            optimized_tac = self.apply_loop_unrolling(optimized_tac)
+            optimized_tac = self.apply_block_layout(optimized_tac)
+
+        if constant_folding and batch_folding:
+            optimized_tac = self.apply_batch_constant_folding(optimized_tac, verify_batch)
+        elif constant_folding:
             optimized_tac = self.apply_constant_folding(optimized_tac)
         if constant_propagation:
             optimized_tac = self.apply_constant_propagation(optimized_tac)
         if dead_code_elimination:
+            before = optimized_tac
             optimized_tac = self.apply_dead_code_elimination(optimized_tac)
+            if jump_threading:
+                optimized_tac = self.apply_jump_threading(optimized_tac)
+            optimized_tac = self.repeat_on_reduced_functions(before, optimized_tac, constant_propagation, jump_threading)
+        elif jump_threading:
+            optimized_tac = self.apply_jump_threading(optimized_tac)
+        # Optimizations leave gaps in the temp and label ids, the final pass closes them
+        if renumber:
+            optimized_tac = self.apply_renumbering(optimized_tac, first_label)
 
         return optimized_tac
 
 
+    # Helper for optimize, a removed loop leaves its final values to propagate and a branch threaded away can leave
+    # the value it tested dead, so the passes go again over every function that lost a branch, on its own, until none
+    # of them does
+    def repeat_on_reduced_functions(self, before, after, constant_propagation, jump_threading):
+        functions = split_functions(after)
+        pending = [index for index, (old, new) in enumerate(zip(split_functions(before), functions))
+                   if count_branches(new) < count_branches(old)]
+        while pending:
+            listing = [line for index in pending for line in functions[index]]
+            if constant_propagation:
+                listing = self.apply_constant_propagation(listing)
+            listing = self.apply_dead_code_elimination(listing)
+            if jump_threading:
+                listing = self.apply_jump_threading(listing)
+            reduced = []
+            for index, function in zip(pending, split_functions(listing)):
+                if count_branches(function) < count_branches(functions[index]):
+                    reduced.append(index)
+                functions[index] = function
+            pending = reduced
+        return [line for function in functions for line in function]
+
+
     # Constant Folding Optimization 
     # t1 = 1 + 3 --> t1 = 4
     def apply_constant_folding(self, tac):
-        optimized_tac = []
-
-        for line in tac:
-            # Check for assignments
-            if " = " in line:
-                var, expr = line.split(" = ", 1)
-                expr_parts = expr.split(" ")
-
-                # Try to evaluate expressions directly
-                if all(part.isdigit() or part.replace('.', '', 1).isdigit() for part in expr_parts \
-                        if part not in ['+', '-', '*', '/', '%']):
-                    try:
-                        result = self.evaluate_expression(expr_parts)
-                        optimized_tac.append(f"{var} = {result}")
-                        continue  
-                    # If evaluation fails, just skip to next
-                    except Exception:
-                        pass 
-
-            # Append unchanged line if can't fold 
-            optimized_tac.append(line)
-
+        return [self.fold_line(line) for line in tac]
+
+
+    # Helper for constant folding, returns the line with its right hand side folded if it is constant
+    def fold_line(self, line):
+        # Check for assignments
+        if " = " in line:
+            var, expr = line.split(" = ", 1)
+            expr_parts = expr.split(" ")
+
+            # Try to evaluate expressions directly
+            result = self.fold_expression(var, expr_parts)
+            if result is not None:
+                return f"{var} = {format_constant(result)}"
+
+        # Return unchanged line if can't fold
+        return line
+
+
+    # Batch Constant Folding
+    # Same result as apply_constant_folding, but the literal operations are folded together with NumPy
+    # Without NumPy this is just the scalar pass, with verify the scalar pass is run as well and has to agree
+    def apply_batch_constant_folding(self, tac, verify = False):
+        # NumPy is only loaded when batch folding is asked for
+        try:
+            from batch_fold import batch_constant_folding
+        except ImportError:
+            return self.apply_constant_folding(tac)
+
+        optimized_tac = batch_constant_folding(tac, self.variable_types, self.fold_line)
+
+        if verify:
+            expected = self.apply_constant_folding(tac)
+            for line, batch_line, scalar_line in zip(tac, optimized_tac, expected):
+                if batch_line != scalar_line:
+                    raise RuntimeError(f"Batch folding of '{line}' gave '{batch_line}', expected '{scalar_line}'")
         return optimized_tac
 
 
     # Constant Propagation Optimization
     # t1 = x + 2 --> t1 = 3 + 2 (where x = 3)
+    # Every variable has a value: a constant, or None once two paths disagree or a definition is not a constant. A
+    # variable no path has defined yet is left out. A variable with one definition has one value everywhere; the
+    # ones defined more than once have a value at the start of every block, worked out over the CFG with a worklist.
+    # Folding is part of the transfer, so values flow through branches, out of loops that do not change them, and
+    # through whole chains of folded temps in one pass.
     def apply_constant_propagation(self, tac):
-        optimized_tac = [] 
-        self.constants = {}
-        inside_loop = False  
-
-        for line in tac:
-            # Detect loop entry via labels (e.g., "L2:")
-            if ":" in line and "goto" not in line:  
-                label = line.split(":")[0]
-                # Set loop flag
-                if label.startswith("L"):
-                    inside_loop = True
-                optimized_tac.append(line) 
+        cfg = ControlFlowGraph(tac)
+        definition_counts = {}
+        users = {}  # Variable -> blocks reading it
+        for block in cfg.blocks:
+            for line_number in range(block.start, block.end):
+                _, defs, uses, _ = cfg.instructions[line_number]
+                for var in defs:
+                    definition_counts[var] = definition_counts.get(var, 0) + 1
+                for var in uses:
+                    users.setdefault(var, set()).add(block.index)
+        tracked = {var for var, count in definition_counts.items() if count > 1}
+        single_values = {}
+
+        entry_values = [None] * len(cfg.blocks)  # None until the block has been worked out
+        exit_values = [None] * len(cfg.blocks)
+        stale = set()  # Blocks reading a single definition value that changed
+        # Blocks in listing order, which is close to the order the values flow in
+        worklist = list(range(len(cfg.blocks)))
+        queued = set(worklist)
+        while worklist:
+            index = heapq.heappop(worklist)
+            queued.discard(index)
+            block = cfg.blocks[index]
+            values = self.meet_values([exit_values[predecessor] for predecessor in block.predecessors
+                                       if exit_values[predecessor] is not None])
+            if exit_values[index] is not None and values == entry_values[index] and index not in stale:
                 continue
+            stale.discard(index)
+            entry_values[index] = values
+            changed = []
+            values = self.block_values(cfg, block, dict(values), tracked, single_values, changed)
+            requeue = set(block.successors) if values != exit_values[index] else set()
+            exit_values[index] = values
+            for var in changed:
+                stale.update(users.get(var, ()))
+                requeue.update(users.get(var, ()))
+            for successor in requeue:
+                if successor not in queued:
+                    heapq.heappush(worklist, successor)
+                    queued.add(successor)
+
+        single_constants = {var: value for var, value in single_values.items() if value is not None}
+        optimized_tac = []
+        for block in cfg.blocks:
+            self.constants = ChainMap(dict(entry_values[block.index] or {}), single_constants)
+            for line_number in range(block.start, block.end):
+                optimized_tac.append(self.propagate_line(tac[line_number], cfg.instructions[line_number][0]))
+        return optimized_tac
 
-            # Reset loop flag when no longer in loop body
-            if "goto" in line and not "if" in line:
-                inside_loop = False
-                optimized_tac.append(line)
-                continue
 
-            # Check for assignments
-            if " = " in line:
-                var, expr = line.split(" = ", 1)
-                expr_parts = expr.split(" ")
-
-                # Replace variables in the expression with their constant values only if outside loops
-                if not inside_loop:
-                    expr_parts = [str(self.constants.get(part, part)) for part in expr_parts]
-
-                # If the entire expression becomes a constant, evaluate it
-                if all(part.isdigit() or part.replace('.', '', 1).isdigit() for part in expr_parts \
-                        if part not in ['+', '-', '*', '/', '%']):
-                    try:
-                        result = self.evaluate_expression(expr_parts)
-                        # Only update the constants map if outside a loop
-                        if not inside_loop:
-                            self.constants[var] = result
-                        optimized_tac.append(f"{var} = {result}")
-                    except Exception:
-                        optimized_tac.append(f"{var} = {' '.join(expr_parts)}")
+    # Helper for constant propagation, the values at the start of a block from the ends of its predecessors
+    def meet_values(self, exits):
+        if len(exits) < 2:
+            return exits[0] if exits else {}
+        values = dict(exits[0])
+        for other in exits[1:]:
+            for var, value in other.items():
+                if var not in values:
+                    values[var] = value
+                elif values[var] != value:
+                    values[var] = None
+        return values
+
+
+    # Helper for constant propagation, the values at the end of a block from the values at its start
+    # Variables defined once are kept in single_values instead, the ones whose value changed go into changed
+    def block_values(self, cfg, block, values, tracked, single_values, changed):
+        def value_of(var):
+            return values.get(var) if var in tracked else single_values.get(var)
+
+        def known(var):
+            return var in values if var in tracked else var in single_values
+
+        for line_number in range(block.start, block.end):
+            kind, defs, uses, _ = cfg.instructions[line_number]
+            for var in defs:
+                if kind != 'assign':
+                    value = None  # Parameters and call results are never constant
+                elif not all(known(use) for use in uses):
+                    # A value no path has defined yet may still turn out to be a constant
+                    values.pop(var, None)
+                    continue
                 else:
-                    # Keep partial propagation and update constants for direct assignments
-                    if not inside_loop and len(expr_parts) == 1 and expr_parts[0].isdigit():
-                        self.constants[var] = int(expr_parts[0])
-                    else:
-                        # Remove if not a constant
-                        self.constants.pop(var, None)
-                    optimized_tac.append(f"{var} = {' '.join(expr_parts)}")
-            else:
-                # Handle non-assignment lines (e.g., RETURN x)
-                parts = line.split(" ")
-                replaced_parts = [str(self.constants.get(part, part)) for part in parts]
-                optimized_tac.append(" ".join(replaced_parts))
-
-        return optimized_tac
+                    expr_parts = [value_of(part) or part for part in cfg.tac[line_number].split(" = ", 1)[1].split(" ")]
+                    result = self.fold_expression(var, expr_parts)
+                    value = None if result is None else format_constant(result)
+                if var in tracked:
+                    values[var] = value
+                elif single_values.get(var, False) != value:
+                    single_values[var] = value
+                    changed.append(var)
+        return values
+
+
+    # Helper for constant propagation, substitutes known constants into one line and folds it
+    def propagate_line(self, line, kind):
+        # Labels, jumps, and function boundaries have nothing to replace
+        if kind in ('label', 'jump', 'begin', 'end'):
+            return line
+
+        # Calls only define their result, the arguments were passed with PARAM
+        if kind == 'call':
+            self.constants.pop(line.split(" = ", 1)[0], None)
+            return line
+
+        # Check for assignments
+        if kind == 'assign':
+            var, expr = line.split(" = ", 1)
+            expr_parts = [self.constants.get(part) or part for part in expr.split(" ")]
+
+            # If the entire expression becomes a constant, evaluate it
+            result = self.fold_expression(var, expr_parts)
+            if result is not None:
+                self.constants[var] = format_constant(result)
+                return f"{var} = {format_constant(result)}"
+            # Remove if not a constant
+            self.constants.pop(var, None)
+            return f"{var} = {' '.join(expr_parts)}"
+
+        # Branches on a comparison have two operands
+        if kind == 'branch':
+            branch, condition, target = parse_branch(line)
+            return format_branch(branch, [self.constants.get(part) or part for part in condition], target)
+
+        # Handle non-assignment lines (e.g., RETURN x, PARAM x, switch x 0 L1 L2 else L3), only the operand
+        # is replaced
+        parts = line.split(" ")
+        if len(parts) > 1:
+            parts[1] = self.constants.get(parts[1]) or parts[1]
+        return " ".join(parts)
 
 
     # Dead Code Elimination
-    # Removes any code that unused / unreachable
-    # ChatGPT helped me debug this as I was having variables be deleted 
-    # despite being vital for the function of a loop, (i.e., "i" and such)
+    # Removes assignments whose value is never read (using liveness from dataflow.py), and labels nothing jumps to
+    # Calls may have side effects, so they are always retained
+    # Variables that only ever feed each other are faint and removed too, even when liveness keeps them, and so
+    # are whole loops nothing after them reads (see remove_dead_loops)
+    # Repeats until nothing else can be removed, since removing a line can make the values it read dead
     def apply_dead_code_elimination(self, tac):
-        used_vars = set()  # Variables used in the program
-        referenced_labels = set()  # Labels referenced in control flow (goto)
-        loop_dependent_vars = set()  # Variables that influence loop conditions or body
-        optimized_tac = []  # Store optimized TAC
-        label_positions = {}  # Track original label positions
-
-        print("\n[DEBUG] Starting Dead Code Elimination...")
-
-        # Step 1: Identify referenced labels and variables in control flow
-        for i, line in enumerate(tac):
-            print(f"[DEBUG] Processing Line {i}: {line}")
-            if ":" in line and "goto" not in line:  # Label (e.g., L1:)
-                label = line.split(":")[0]
-                label_positions[label] = i
-                print(f"[DEBUG] Found Label: {label}")
-            elif "goto" in line:
-                parts = line.split()
-                if "if" in parts:  # Conditional goto
-                    condition_var = parts[1]  # Condition variable (e.g., t1)
-                    used_vars.add(condition_var)
-                    loop_dependent_vars.add(condition_var)
-                    print(f"[DEBUG] Adding Conditional Variable to Used Vars: {condition_var}")
-                target_label = parts[-1]
-                referenced_labels.add(target_label)
-                print(f"[DEBUG] Adding Referenced Label: {target_label}")
-
-        # Step 2: Backward pass to find all used variables and retain control flow
-        for line in reversed(tac):
-            print(f"[DEBUG] Backward Processing Line: {line}")
-            if ":" in line and "goto" not in line:  # Label (e.g., L2:)
-                label = line.split(":")[0]
-                if label in referenced_labels:
-                    optimized_tac.insert(0, line)  # Retain labels
-                    print(f"[DEBUG] Retaining Label: {label}")
+        optimized_tac = tac
+
+        while True:
+            cfg = ControlFlowGraph(optimized_tac)
+            variables = cfg.variables
+            live_in, live_out = liveness(cfg)
+            useful = self.useful_variables(cfg)
+            keep = [True] * len(optimized_tac)
+
+            # Walk every block backwards from the variables live at its end
+            for block in cfg.blocks:
+                live = live_out[block.index]
+                for line_number in range(block.end - 1, block.start - 1, -1):
+                    kind, defs, uses, _ = cfg.instructions[line_number]
+                    def_bits = variables.bits(defs)
+                    if kind == 'assign' and (not live & def_bits or defs[0] not in useful):
+                        keep[line_number] = False
+                        continue
+                    live = (live & ~def_bits) | variables.bits(uses)
+
+            referenced_labels = {label for instruction in cfg.instructions for label in jump_targets(instruction)}
+            for line_number, (kind, _, _, label) in enumerate(cfg.instructions):
+                if kind == 'label' and label not in referenced_labels:
+                    keep[line_number] = False
+
+            if all(keep):
+                # Only whole loops can still go
+                reduced = self.remove_dead_loops(optimized_tac, cfg, live_in)
+                if reduced is None:
+                    return optimized_tac
+                optimized_tac = reduced
+            else:
+                optimized_tac = [line for line, kept in zip(optimized_tac, keep) if kept]
+
+
+    # Helper for dead code elimination, the variables whose value can reach a return, a call argument, or a
+    # branch. Any other variable is faint: its assignments only feed each other, like "x = x + 2" in a loop
+    # when x is never read after it.
+    def useful_variables(self, cfg):
+        feeds = {}  # Variable -> variables its assignments read
+        useful = set()
+        for kind, defs, uses, _ in cfg.instructions:
+            if kind == 'assign':
+                feeds.setdefault(defs[0], set()).update(uses)
+            else:
+                useful.update(uses)
+        worklist = list(useful)
+        while worklist:
+            for var in feeds.get(worklist.pop(), ()):
+                if var not in useful:
+                    useful.add(var)
+                    worklist.append(var)
+        return useful
+
+
+    # Helper for dead code elimination, removes counted loops whose work is not observed
+    # L1: ifFalse i < n goto L2 / <body> / goto L1 / L2:  -->  L1: goto L2
+    # A loop qualifies when it is innermost, is only entered at its header, only leaves from the test there, has
+    # no calls, and steps its counter toward a bound that does not change, so it always ends. Every variable it
+    # assigns that is read after it needs a closed form: the counter, a sum "w = w + c" stepped once per trip, or
+    # a constant stored on every trip. Those are set to their final values (which needs a constant trip count)
+    # and the rest of the loop is dropped. Returns None if no loop could be removed.
+    def remove_dead_loops(self, tac, cfg, live_in):
+        label_lines = {target: line_number for line_number, (kind, _, _, target) in enumerate(cfg.instructions)
+                       if kind == 'label'}
+        # Back edges from the bottom up, so replacing one loop does not move the lines of the ones above it
+        optimized_tac = list(tac)
+        removed = False
+        for line_number in range(len(tac) - 1, -1, -1):
+            kind, _, _, header = cfg.instructions[line_number]
+            if kind != 'jump' or label_lines.get(header, line_number) >= line_number:
                 continue
+            replacement = self.counted_loop_replacement(cfg, label_lines[header], line_number, live_in)
+            if replacement is not None:
+                first_line, lines = replacement
+                optimized_tac[first_line:line_number + 1] = lines
+                removed = True
+        return optimized_tac if removed else None
+
+
+    # Helper for dead loop removal, what the loop from a header label at start to its back edge at end can be
+    # replaced with, as (first line replaced, new lines). The header labels stay, other code jumps to them.
+    def counted_loop_replacement(self, cfg, start, end, live_in):
+        instructions = cfg.instructions
+        first = cfg.label_blocks[instructions[start][3]]
+        last = first
+        while cfg.blocks[last].end <= end:
+            last += 1
+        loop = range(first, last + 1)
+        test = first
+        while instructions[cfg.blocks[test].end - 1][0] == 'label':
+            test += 1
+        test_line = cfg.blocks[test].end - 1
+        kind, _, _, exit_label = instructions[test_line]
+        if kind != 'branch':
+            return None
+        branch, condition, _ = parse_branch(cfg.tac[test_line])
+        exit_from = test
+        if cfg.label_blocks.get(exit_label) in loop:
+            # Not threaded yet, "if i < n goto L5 / goto L2", the loop is left by the goto after the test
+            exit_from = test + 1
+            kind, _, _, exit_label = instructions[cfg.blocks[exit_from].start]
+            if exit_from >= last or kind != 'jump':
+                return None
+            branch = 'ifFalse' if branch == 'if' else 'if'
+        exit_block = cfg.label_blocks.get(exit_label)
+        if exit_block is None or exit_block in loop:
+            return None
+
+        # Nothing with an effect, and no way in or out but the header and its test
+        if any(instructions[line_number][0] not in ('label', 'assign', 'branch', 'jump', 'table')
+               for line_number in range(start, end + 1)):
+            return None
+        skipped = set()  # Blocks that some trips jump over
+        for block in loop:
+            if block > test and any(predecessor not in loop for predecessor in cfg.blocks[block].predecessors):
+                return None
+            for successor in cfg.blocks[block].successors:
+                if successor not in loop:
+                    if block != exit_from or successor != exit_block:
+                        return None
+                elif successor <= block and not (block == last and successor == first):
+                    return None  # A loop inside this one
+                else:
+                    skipped.update(range(block + 1, successor))
+        every_trip = [block for block in range(test + 1, last + 1) if block not in skipped]
+
+        definitions = {}  # Variable -> lines that assign it in the loop
+        for line_number in range(start, end + 1):
+            for var in instructions[line_number][1]:
+                definitions.setdefault(var, []).append(line_number)
+
+        # The comparison that keeps the loop going, with the counter on the left
+        if len(condition) != 3 or condition[1] not in NEGATED_COMPARISONS:
+            return None
+        counter, comparison, bound = condition
+        if branch == 'if':
+            comparison = NEGATED_COMPARISONS[comparison]
+        if bound in definitions:
+            counter, comparison, bound = bound, SWAPPED_COMPARISONS[comparison], counter
+        if counter not in definitions or bound in definitions or not (bound.isidentifier() or
+                                                                      isinstance(parse_constant(bound), int)):
+            return None
+        if self.variable_types.get(counter) in FLOAT_TYPES or self.variable_types.get(bound) in FLOAT_TYPES:
+            return None
+        step = self.loop_step(cfg, counter, definitions, every_trip)
+        if not isinstance(step, int) or not ((comparison in ('<', '<=') and step > 0) or
+                                             (comparison in ('>', '>=') and step < 0)):
+            return None
+
+        first_line = cfg.blocks[test].start
+        while instructions[first_line][0] == 'label':
+            first_line += 1
+        observed = set(definitions) & set(cfg.variables.members(live_in[exit_block]))
+        lines = []
+        if observed:
+            entries = [predecessor for block in range(first, test + 1) for predecessor in cfg.blocks[block].predecessors
+                       if predecessor not in loop]
+            trips = self.trip_count(cfg, counter, comparison, bound, step, entries)
+            if trips is None:
+                return None
+            trips, final_count = trips
+            for var in sorted(observed):
+                change = self.loop_step(cfg, var, definitions, every_trip)
+                if var == counter:
+                    lines.append(f"{var} = {final_count}")
+                elif isinstance(change, int) and self.variable_types.get(var) in INTEGER_TYPES:
+                    # The sum itself when it starts at a known value, else what the loop adds to it
+                    initial = self.entry_value(cfg, var, entries)
+                    if isinstance(initial, int):
+                        lines.append(f"{var} = {wrap_int(initial + change * trips)}")
+                    elif trips:
+                        lines.append(f"{var} = {var} + {wrap_int(change * trips)}")
+                elif isinstance(change, str):
+                    if trips:
+                        lines.append(f"{var} = {change}")
+                else:
+                    return None
+        return first_line, lines + [f"goto {exit_label}"]
+
+
+    # Helper for dead loop removal, how a variable changes on each trip of a loop, if it is assigned only once
+    # there and on every trip: the step c of "w = w + c" (also written "t = w + c / w = t") as an int, the
+    # constant of "w = 5" as a string, and None for anything else
+    def loop_step(self, cfg, var, definitions, every_trip):
+        lines = definitions.get(var, ())
+        if len(lines) != 1 or not any(cfg.blocks[block].start <= lines[0] < cfg.blocks[block].end
+                                      for block in every_trip):
+            return None
+        line_number = lines[0]
+        parts = cfg.tac[line_number].split(" = ", 1)[1].split(" ")
+        if len(parts) == 1 and parse_constant(parts[0]) is not None:
+            return parts[0]
+        if len(parts) == 1 and len(definitions.get(parts[0], ())) == 1:
+            # Through a temporary computed earlier in the same block
+            temp_line = definitions[parts[0]][0]
+            block = next(block for block in every_trip
+                         if cfg.blocks[block].start <= line_number < cfg.blocks[block].end)
+            if not cfg.blocks[block].start <= temp_line < line_number:
+                return None
+            parts = cfg.tac[temp_line].split(" = ", 1)[1].split(" ")
+        if len(parts) != 3:
+            return None
+        left, op, right = parts
+        if op == '+' and right == var:
+            left, right = right, left
+        step = parse_constant(right)
+        if left != var or op not in ('+', '-') or not isinstance(step, int):
+            return None
+        return step if op == '+' else -step
+
+
+    # Helper for dead loop removal, (trips, final counter) of a loop that keeps going while
+    # "counter comparison bound", None unless the counter starts at a constant and the bound is one
+    def trip_count(self, cfg, counter, comparison, bound, step, entries):
+        limit = parse_constant(bound)
+        initial = self.entry_value(cfg, counter, entries)
+        if not isinstance(limit, int) or not isinstance(initial, int):
+            return None
+
+        # Counting down is counting up with every value negated
+        distance, stride = (limit - initial, step) if comparison in ('<', '<=') else (initial - limit, -step)
+        if comparison in ('<', '>'):
+            trips = -(-distance // stride) if distance > 0 else 0
+        else:
+            trips = distance // stride + 1 if distance >= 0 else 0
+        final_count = initial + step * trips
+        if not INT_MIN <= final_count <= INT_MAX:
+            return None  # The counter would overflow on the way
+        return trips, final_count
+
+
+    # Helper for dead loop removal, the constant a variable holds when a loop is entered from the given blocks
+    # Each is followed back for as long as only one block leads to it, the assignment found first has to store the
+    # same constant for all of them, else None
+    def entry_value(self, cfg, var, entries):
+        values = set()
+        for block in entries:
+            value = None
+            seen = set()
+            while block not in seen:
+                seen.add(block)
+                definition = next((line_number for line_number in range(cfg.blocks[block].end - 1,
+                                                                         cfg.blocks[block].start - 1, -1)
+                                   if var in cfg.instructions[line_number][1]), None)
+                if definition is not None:
+                    if cfg.instructions[definition][0] == 'assign':
+                        value = cfg.tac[definition].split(" = ", 1)[1]
+                    break
+                if len(cfg.blocks[block].predecessors) != 1:
+                    break
+                block = cfg.blocks[block].predecessors[0]
+            values.add(value)
+        return parse_constant(values.pop()) if len(values) == 1 and None not in values else None
+
+
+    # Jump Threading and Branch Simplification
+    # if t1 goto L1 / goto L2 / L1:  -->  ifFalse t1 goto L2 / L1:
+    # goto L1 ... L1: goto L2  -->  goto L2
+    # Jumps to the next line, branches on constants, unreachable code, and labels nothing jumps to are removed.
+    # Repeats until nothing changes, since every step can open up the others
+    def apply_jump_threading(self, tac):
+        optimized_tac = tac
+        while True:
+            simplified = self.remove_unreachable_code(self.simplify_branches(optimized_tac))
+            if simplified == optimized_tac:
+                return simplified
+            optimized_tac = simplified
+
+
+    # Helper for jump threading, one pass of inverting, threading, and dropping branches
+    def simplify_branches(self, tac):
+        instructions = [parse_instruction(line) for line in tac]
+        label_lines = {target: line_number for line_number, (kind, _, _, target) in enumerate(instructions)
+                       if kind == 'label'}
+
+        # Labels at the given line and right after it, they all mark the same spot
+        def labels_at(line_number):
+            labels = set()
+            while line_number < len(tac) and instructions[line_number][0] == 'label':
+                labels.add(instructions[line_number][3])
+                line_number += 1
+            return labels, line_number
+
+        # Follows a chain of labels that only hold a goto to the label it finally ends at
+        def final_target(label):
+            seen = set()
+            while label in label_lines and label not in seen:
+                seen.add(label)
+                _, next_line = labels_at(label_lines[label])
+                if next_line < len(tac) and instructions[next_line][0] == 'jump':
+                    label = instructions[next_line][3]
+                else:
+                    break
+            return label
 
-            if "goto" in line:  # Goto statement (e.g., if t1 goto L2)
-                parts = line.split()
-                if "if" in parts:  # Conditional goto
-                    condition_var = parts[1]  # Condition variable
-                    used_vars.add(condition_var)
-                    loop_dependent_vars.add(condition_var)
-                    print(f"[DEBUG] Adding Conditional Variable to Used Vars: {condition_var}")
-                target_label = parts[-1]
-                referenced_labels.add(target_label)
-                optimized_tac.insert(0, line)  # Retain the goto statement
-                print(f"[DEBUG] Retaining Goto Statement: {line}")
+        optimized_tac = []
+        line_number = 0
+        while line_number < len(tac):
+            kind, _, _, target = instructions[line_number]
+            line = tac[line_number]
+            line_number += 1
+
+            if kind == 'table':
+                value, low, case_labels, default = parse_table(line)
+                case_labels = [final_target(label) for label in case_labels]
+                default = final_target(default)
+                constant = parse_constant(value)
+                # A constant value always takes the same case, and a table whose cases all go one way is a jump
+                if isinstance(constant, int):
+                    kind = 'jump'
+                    target = case_labels[constant - low] if 0 <= constant - low < len(case_labels) else default
+                elif all(label == default for label in case_labels):
+                    kind = 'jump'
+                    target = default
+                else:
+                    optimized_tac.append(format_table(value, low, case_labels, default))
+                    continue
+
+            if kind not in ('branch', 'jump'):
+                optimized_tac.append(line)
                 continue
 
-            if " = " in line:  # Assignment statement
+            target = final_target(target)
+            if kind == 'branch':
+                branch, condition, _ = parse_branch(line)
+                # A constant condition is either always or never taken
+                value = self.evaluate_expression(condition)
+                if value is not None:
+                    if (value != 0) == (branch == "if"):
+                        kind = 'jump'
+                    else:
+                        continue
+                # Jumping over a goto, the condition is inverted and the goto is taken instead
+                elif line_number < len(tac) and instructions[line_number][0] == 'jump':
+                    following_labels, _ = labels_at(line_number + 1)
+                    if target in following_labels or target in map(final_target, following_labels):
+                        branch = "ifFalse" if branch == "if" else "if"
+                        target = final_target(instructions[line_number][3])
+                        line_number += 1
+
+            # A jump to the line that comes next anyway does nothing
+            next_labels, _ = labels_at(line_number)
+            if target in next_labels:
+                continue
+
+            optimized_tac.append(f"goto {target}" if kind == 'jump' else format_branch(branch, condition, target))
+
+        # Labels nothing jumps to anymore are dropped, which merges the blocks around them
+        referenced_labels = set()
+        for line in optimized_tac:
+            if " goto " in line or line.startswith("goto "):
+                referenced_labels.add(line.split()[-1])
+            elif line.startswith("switch "):
+                referenced_labels.update(jump_targets(parse_instruction(line)))
+        return [line for line in optimized_tac
+                if not (line.endswith(":") and " " not in line and line[:-1] not in referenced_labels)]
+
+
+    # Helper for jump threading, drops every block that cannot be reached from its function entry
+    def remove_unreachable_code(self, tac):
+        cfg = ControlFlowGraph(tac)
+        reachable = [False] * len(cfg.blocks)
+        worklist = [block.index for block in cfg.blocks
+                    if block.index == 0 or cfg.instructions[block.start][0] == 'begin']
+        while worklist:
+            block_index = worklist.pop()
+            if not reachable[block_index]:
+                reachable[block_index] = True
+                worklist.extend(cfg.blocks[block_index].successors)
+
+        optimized_tac = []
+        for block in cfg.blocks:
+            for line_number in range(block.start, block.end):
+                # The function boundaries always stay, even after a return
+                if reachable[block.index] or cfg.instructions[line_number][0] in ('begin', 'end'):
+                    optimized_tac.append(tac[line_number])
+        return optimized_tac
+
+
+    # Renumbering
+    # Temps and labels are renamed t1, t2, ... and L1, L2, ... in order of first use, so the ids left after
+    # optimization are dense again. Declared variables and parameters that look like temps are never renamed or reused.
+    def apply_renumbering(self, tac, first_label = 1):
+        instructions = [parse_instruction(line) for line in tac]
+        reserved = set(self.declared_names)
+        for kind, defs, _, _ in instructions:
+            if kind == 'begin':
+                reserved.update(defs)
+
+        temps = {}
+        labels = {}
+        next_temp = 1
+
+        def rename_temp(name):
+            nonlocal next_temp
+            if name in reserved or temp_id(name) is None:
+                return name
+            if name not in temps:
+                while str(Temp(next_temp)) in reserved:
+                    next_temp += 1
+                temps[name] = str(Temp(next_temp))
+                next_temp += 1
+            return temps[name]
+
+        def rename_label(name):
+            if label_id(name) is None:
+                return name
+            if name not in labels:
+                labels[name] = str(Label(first_label + len(labels)))
+            return labels[name]
+
+        renumbered = []
+        for line, (kind, _, _, target) in zip(tac, instructions):
+            if kind == 'label':
+                line = f"{rename_label(target)}:"
+            elif kind == 'jump':
+                line = f"goto {rename_label(target)}"
+            elif kind == 'branch':
+                branch, condition, _ = parse_branch(line)
+                line = format_branch(branch, [rename_temp(part) for part in condition], rename_label(target))
+            elif kind == 'table':
+                value, low, case_labels, default = parse_table(line)
+                line = format_table(rename_temp(value), low, map(rename_label, case_labels), rename_label(default))
+            elif kind in ('assign', 'call'):
                 var, expr = line.split(" = ", 1)
-                expr_vars = expr.split(" ")
-
-                # Mark variables as loop-dependent if they influence the loop
-                if any(part in loop_dependent_vars for part in expr_vars) or var in loop_dependent_vars:
-                    loop_dependent_vars.add(var)
-                    loop_dependent_vars.update(part for part in expr_vars if part.isidentifier())
-                    used_vars.add(var)
-                    used_vars.update(part for part in expr_vars if part.isidentifier())
-                    optimized_tac.insert(0, line)  # Retain assignment
-                    print(f"[DEBUG] Retaining Loop-Dependent Assignment: {line}")
-                    continue
+                # String literals and the callee of a call are left as they are
+                if kind == 'assign' and not expr.startswith('"'):
+                    expr = " ".join(map(rename_temp, expr.split(" ")))
+                line = f"{rename_temp(var)} = {expr}"
+            elif kind in ('return', 'param'):
+                parts = line.split(" ")
+                line = " ".join(parts[:1] + [rename_temp(part) for part in parts[1:]])
+            renumbered.append(line)
+
+        self.next_label = first_label + len(labels)
+        # Counts follow their labels, labels that were removed take their counts with them
+        self.block_counts = {labels.get(name, name): count for name, count in self.block_counts.items()
+                             if label_id(name) is None or name in labels}
+        return renumbered
+
+
+    # Block Layout (profile-guided)
+    # Blocks are reordered so the hot path falls straight through and blocks that never ran sit at the end
+    # of their function. Every block first gets a label and an explicit jump to the block it used to fall into,
+    # so any order is correct, then the jumps that end up pointing at the next line are dropped again.
+    def apply_block_layout(self, tac):
+        cfg = ControlFlowGraph(tac)
+        names = cfg.block_names()
+        self.fresh_label = max((label_id(target) or 0 for kind, _, _, target in cfg.instructions
+                                if kind == 'label'), default = 0) + 1
 
-                # Retain assignments that are otherwise used
-                if var in used_vars or any(part in used_vars for part in expr_vars):
-                    used_vars.add(var)
-                    used_vars.update(part for part in expr_vars if part.isidentifier())
-                    optimized_tac.insert(0, line)  # Retain assignment
-                    print(f"[DEBUG] Retaining Relevant Assignment: {line}")
-                else:
-                    print(f"[DEBUG] Removing Unused Assignment: {line}")
+        optimized_tac = []
+        function_blocks = []
+        for block in cfg.blocks:
+            if cfg.instructions[block.start][0] == 'begin':
+                function_blocks = []
+            function_blocks.append(block)
+            if cfg.instructions[block.end - 1][0] == 'end':
+                optimized_tac += self.layout_function(tac, cfg, names, function_blocks)
+        return self.remove_fallthrough_jumps(optimized_tac)
+
+
+    # Helper for block layout, lays out the blocks of one function
+    def layout_function(self, tac, cfg, names, blocks):
+        counts = [self.block_counts.get(names[block.index]) for block in blocks]
+        if None in counts:
+            # No profile for this function, it is left as it is
+            return [line for block in blocks for line in tac[block.start:block.end]]
+
+        # Every block gets a label, and falling into the next block becomes a jump
+        labels = []
+        block_lines = []
+        for block, count in zip(blocks, counts):
+            kind, _, _, target = cfg.instructions[block.start]
+            if kind == 'label' or kind == 'begin':
+                label = target if kind == 'label' else names[block.index]
+                lines = tac[block.start:block.end]
+            else:
+                label = str(Label(self.fresh_label))
+                self.fresh_label += 1
+                self.block_counts[label] = count
+                lines = [f"{label}:"] + tac[block.start:block.end]
+            labels.append(label)
+            block_lines.append(lines)
+        for position, (block, lines) in enumerate(zip(blocks, block_lines)):
+            if cfg.instructions[block.end - 1][0] not in ('jump', 'table', 'return', 'end'):
+                lines.append(f"goto {labels[position + 1]}")
+
+        # Chains of hot successors, the entry first and the block holding END last
+        position_of = {block.index: position for position, block in enumerate(blocks)}
+        last = len(blocks) - 1
+        placed = [False] * len(blocks)
+        order = []
+        current = 0
+        while current is not None:
+            placed[current] = True
+            order.append(current)
+            successors = [position_of[successor] for successor in blocks[current].successors
+                          if successor in position_of and not placed[position_of[successor]]
+                          and position_of[successor] != last]
+            if successors:
+                current = max(successors, key = lambda position: (counts[position], -position))
+            else:
+                # The next chain starts at the hottest block left, blocks that never ran keep their order
+                remaining = [position for position in range(last) if not placed[position]]
+                current = max(remaining, key = lambda position: (counts[position], -position)) if remaining else None
+        if not placed[last]:
+            order.append(last)
+
+        return [line for position in order for line in block_lines[position]]
+
+
+    # Helper for block layout, drops jumps to the next line and branches over a jump (the condition is inverted)
+    # Unlike jump threading, every label stays, so the block counts still have their names
+    def remove_fallthrough_jumps(self, tac):
+        instructions = [parse_instruction(line) for line in tac]
+
+        # Labels at the given line and right after it
+        def labels_at(line_number):
+            labels = set()
+            while line_number < len(tac) and instructions[line_number][0] == 'label':
+                labels.add(instructions[line_number][3])
+                line_number += 1
+            return labels
+
+        optimized_tac = []
+        line_number = 0
+        while line_number < len(tac):
+            kind, _, _, target = instructions[line_number]
+            line = tac[line_number]
+            line_number += 1
+            if kind == 'jump' and target in labels_at(line_number):
                 continue
+            if kind == 'branch' and line_number < len(tac) and instructions[line_number][0] == 'jump' \
+                    and target in labels_at(line_number + 1):
+                branch, condition, _ = parse_branch(line)
+                line = format_branch('ifFalse' if branch == 'if' else 'if', condition, instructions[line_number][3])
+                line_number += 1
+            optimized_tac.append(line)
+        return optimized_tac
 
-            # Non-assignment lines (e.g., RETURN x)
-            for part in line.split():
-                if part.isidentifier():
-                    used_vars.add(part)
-                    print(f"[DEBUG] Adding Used Variable from Non-Assignment Line: {part}")
-            optimized_tac.insert(0, line)  # Retain the line
-
-        # Step 3: Ensure labels and control flow integrity
-        for label, pos in label_positions.items():
-            if label in referenced_labels and all(f"{label}:" not in line for line in optimized_tac):
-                # Insert label at its original position if missing
-                optimized_tac.insert(pos, f"{label}:")
-                print(f"[DEBUG] Reinserting Missing Label: {label}")
-
-        # Ensure "END" stays at the end and labels are not misplaced
-        end_index = len(optimized_tac)
-        for i, line in enumerate(optimized_tac):
-            if "END" in line:
-                end_index = i
-                break
-
-        # Place all misplaced labels before "END"
-        labels_to_move = [line for line in optimized_tac[end_index:] if ":" in line and "goto" not in line]
-        optimized_tac = [line for line in optimized_tac if line not in labels_to_move]
-        optimized_tac = optimized_tac[:end_index] + labels_to_move + optimized_tac[end_index:]
-
-        print("[DEBUG] Finished Dead Code Elimination.\n")
+
+    # Loop Unrolling (profile-guided)
+    # L1: <body> goto L1  -->  L1: <body> <body> goto L1
+    # The body of an innermost loop is repeated, so the jump back to the top runs once every few iterations.
+    # Each copy still tests the loop condition, so this is correct for any trip count, and the profile only
+    # decides how many copies pay off. Counts are carried per line and given back to the blocks afterwards, since
+    # the copies add blocks and move the names of unlabeled ones.
+    def apply_loop_unrolling(self, tac):
+        cfg = ControlFlowGraph(tac)
+        line_counts = [None] * len(tac)
+        for block, name in zip(cfg.blocks, cfg.block_names()):
+            line_counts[block.start:block.end] = [self.block_counts.get(name)] * (block.end - block.start)
+        instructions = cfg.instructions
+        label_lines = {target: line_number for line_number, (kind, _, _, target) in enumerate(instructions)
+                       if kind == 'label'}
+        self.fresh_label = max((label_id(label) or 0 for label in label_lines), default = 0) + 1
+        references = {}  # Label -> lines that jump to it
+        for line_number, instruction in enumerate(instructions):
+            for target in jump_targets(instruction):
+                references.setdefault(target, []).append(line_number)
+
+        optimized_tac = list(tac)
+        optimized_counts = list(line_counts)
+        unrolled = False
+        # Back edges from the bottom up, so unrolling one loop does not move the lines of the ones above it
+        for line_number in range(len(tac) - 1, -1, -1):
+            kind, _, _, header = instructions[line_number]
+            if kind != 'jump' or label_lines.get(header, line_number) >= line_number:
+                continue
+            start = label_lines[header]
+            factor = self.unroll_factor(instructions, label_lines, references, start, line_number)
+            if factor < 2:
+                continue
+            body = tac[start + 1:line_number]
+            copies = []
+            for _ in range(factor - 1):
+                copies += self.copy_loop_body(body, instructions[start + 1:line_number])
+            optimized_tac[line_number:line_number] = copies
+            # Every copy runs about 1/factor of the iterations, the original body the rest
+            body_counts = line_counts[start + 1:line_number]
+            optimized_counts[line_number:line_number] = [count // factor for count in body_counts] * (factor - 1)
+            optimized_counts[start + 1:line_number] = [count - (factor - 1) * (count // factor)
+                                                       for count in body_counts]
+            unrolled = True
+
+        if unrolled:
+            cfg = ControlFlowGraph(optimized_tac)
+            for block, name in zip(cfg.blocks, cfg.block_names()):
+                self.block_counts.pop(name, None)
+                if optimized_counts[block.start] is not None:
+                    self.block_counts[name] = optimized_counts[block.start]
         return optimized_tac
 
 
+    # Helper for loop unrolling, one more copy of a loop body with fresh labels for the labels inside it
+    def copy_loop_body(self, body, instructions):
+        renamed = {}
+        for kind, _, _, target in instructions:
+            if kind == 'label':
+                renamed[target] = str(Label(self.fresh_label))
+                self.fresh_label += 1
+
+        copy = []
+        for line, (kind, _, _, target) in zip(body, instructions):
+            if kind == 'label':
+                line = f"{renamed[target]}:"
+            elif kind in ('branch', 'jump') and target in renamed:
+                line = f"{line.rsplit(' ', 1)[0]} {renamed[target]}"
+            elif kind == 'table':
+                value, low, case_labels, default = parse_table(line)
+                line = format_table(value, low, [renamed.get(label, label) for label in case_labels],
+                                    renamed.get(default, default))
+            copy.append(line)
+        return copy
+
+
+    # Helper for loop unrolling, how many copies of the loop body starting at the header label are worth it
+    # Returns 1 when the loop must not or should not be unrolled
+    def unroll_factor(self, instructions, label_lines, references, start, end):
+        body = instructions[start + 1:end]
+        if not body:
+            return 1
+        inside = {target for kind, _, _, target in body if kind == 'label'}
+        for line_number in range(start + 1, end):
+            kind = instructions[line_number][0]
+            # Only innermost loops in one function, a jump back inside the body is another loop
+            if kind in ('begin', 'end') or any(target in inside and label_lines[target] < line_number
+                                               for target in jump_targets(instructions[line_number])):
+                return 1
+        # Nothing may jump into the middle of the loop from outside
+        for label in inside:
+            if any(not start < line_number < end for line_number in references.get(label, ())):
+                return 1
+
+        # Average trips per entry, from the count of the header and of the block with the back edge
+        header_count = self.block_counts.get(instructions[start][3])
+        back_edge_label = next((instructions[line_number][3] for line_number in range(end, start - 1, -1)
+                                if instructions[line_number][0] == 'label'), None)
+        back_edge_count = self.block_counts.get(back_edge_label)
+        if not header_count or back_edge_count is None or header_count <= back_edge_count:
+            return 1
+        trips = back_edge_count / (header_count - back_edge_count)
+        for min_trips, factor in UNROLL_TRIP_COUNTS:
+            if trips >= min_trips:
+                # Smaller factors for longer bodies
+                while factor > 1 and len(body) * factor > MAX_UNROLLED_LINES:
+                    factor //= 2
+                return factor
+        return 1
+
+
     # Helper function to evaluate TAC expressions, used in constant folding and propagation
+    # Returns None if the expression is not made of constants or cannot be folded
     def evaluate_expression(self, expr_parts):
-        # Separate parts of the variable
         if len(expr_parts) == 1:  # Single constant value
-            return int(expr_parts[0])  # Directly return the value
-        elif len(expr_parts) == 3:  # Binary operation
-            left = int(expr_parts[0])
-            operator = expr_parts[1]
-            right = int(expr_parts[2])
-
-            # Evaluate the expression
-            if operator == '+':
-                return left + right
-            elif operator == '-':
-                return left - right
-            elif operator == '*':
-                return left * right
-            elif operator == '/':
-                return left / right
-            elif operator == '%':
-                return left % right
-            else:
-                raise ValueError(f"Unsupported operator: {operator}")
-        else:
-            raise ValueError(f"Unexpected expression format: {expr_parts}")
-
+            return parse_constant(expr_parts[0])
+        elif len(expr_parts) == 3 and expr_parts[1] in BINARY_OPERATORS:  # Binary operation
+            left = parse_constant(expr_parts[0])
+            right = parse_constant(expr_parts[2])
+            if left is not None and right is not None:
+                return evaluate_binary(expr_parts[1], left, right)
+        return None
+
+
+    # Helper to fold the right hand side of "var = expr", the result has the type of var if it was declared
+    def fold_expression(self, var, expr_parts):
+        result = self.evaluate_expression(expr_parts)
+        if result is not None and var in self.variable_types:
+            result = convert(result, self.variable_types[var])
+        return result
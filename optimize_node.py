@@ -1,29 +1,90 @@
 # Author: Thomas Lander
 # Date: 11/08/24
-# optimize.py 
+# optimize_node.py
 
+# AST level optimizations, run before the AST is turned into 3-Address Code
+# so constant expressions never become temps in the first place
 
-# Add optimization for the actual 3ac
+from constant_eval import convert, evaluate_binary, evaluate_unary
 
 class NodeOptimizer:
-    def __init__(self, ast):
+    def __init__(self, ast, symbol_table = None):
         self.ast = ast
         self.constant_values = {}
+        # Declared variable types, a constant stored into a variable is converted to its type
+        self.variable_types = symbol_table.variable_types() if symbol_table else {}
+        # Hash-consing, structurally identical expression nodes are one shared tuple
+        # Keys hold the ids of already shared children, so building a key never walks the whole subtree
+        self.nodes = {}
+        self.shared_ids = set()
+        # Folding results, keyed by the id of a shared node, so every distinct subtree is folded once
+        self.folded = {}
+
+
+    # Returns the shared node for the given parts, creating it the first time it is seen
+    def make(self, *parts):
+        key = tuple([id(part) if part.__class__ is tuple else
+                     part if part.__class__ is str else
+                     (list, *map(id, part)) if part.__class__ is list else
+                     (part.__class__, part) for part in parts])
+        node = self.nodes.get(key)
+        if node is None:
+            node = parts
+            self.nodes[key] = node
+            self.shared_ids.add(id(node))
+        return node
+
+
+    # Faster make() for the common node types, the caller builds the key itself
+    def share(self, key, *parts):
+        node = self.nodes.get(key)
+        if node is None:
+            node = parts
+            self.nodes[key] = node
+            self.shared_ids.add(id(node))
+        return node
+
+
+    # Turns an expression from the parser into shared nodes, bottom up
+    def intern(self, node):
+        if node.__class__ is not tuple or id(node) in self.shared_ids:
+            return node
+        return self.make(*[self.intern(part) if part.__class__ is tuple else
+                           [self.intern(item) for item in part] if part.__class__ is list else
+                           part for part in node])
+
 
     def optimize(self, constant_folding = False, constant_propagation = False, dead_code_elimination = False):
         # Apply optimization techniques based on flags
         if constant_folding:
-            self.ast = [self.constant_folding(node) for node in self.ast]
+            self.ast = self.fold_statements(self.ast)
         if constant_propagation:
-            self.ast = [self.propagate_constants(node) for node in self.ast]
+            self.ast = [self.propagate_function(node) for node in self.ast]
+            # Conditions that became constant can now have their dead branches pruned
+            self.ast = self.fold_statements(self.ast)
         if dead_code_elimination:
             self.ast = [self.remove_dead_code(node) for node in self.ast]
-        
+
         return self.ast
 
 
     # Constant folding for binary expressions and direct numeric computations
+    # Works on expressions, statements are handled by fold_statement
     def constant_folding(self, node):
+        if node is None:
+            return None
+        # Nodes straight from the parser are folded directly, the result is built from shared nodes
+        if id(node) not in self.shared_ids:
+            return self.fold_expression(node)
+        folded = self.folded.get(id(node))
+        if folded is None:
+            folded = self.fold_expression(node)
+            self.folded[id(node)] = folded
+        return folded
+
+
+    # Helper for constant folding, folds one shared node whose result is not cached yet
+    def fold_expression(self, node):
         node_type = node[0]
 
         if node_type == 'BinaryExpression':
@@ -31,178 +92,370 @@ class NodeOptimizer:
             # Recursively simplify left and right expressions
             left = self.constant_folding(left)
             right = self.constant_folding(right)
-    
+
             # Check if both sides are now constants after folding
             if left[0] == 'Number' and right[0] == 'Number':
-                result = self.evaluate_exp(operator, float(left[1]), float(right[1]))
-                return ('Number', str(result))  # Return a simplified constant expression
-            else:
-                return ('BinaryExpression', operator, left, right)
+                result = self.evaluate_exp(operator, left[1], right[1])
+                if result is not None:
+                    # Return a simplified constant expression
+                    return self.share(('Number', result.__class__, result), 'Number', result)
+            return self.share(('BinaryExpression', operator, id(left), id(right)), 'BinaryExpression', operator, left, right)
 
         elif node_type == 'UnaryExpression':
-            _, operator, operand = node
+            _, operator, operand, *optional = node
             operand = self.constant_folding(operand)
             if operand[0] == 'Number':
                 # Handle unary operations on constants
-                if operator == '++':
-                    return ('Number', str(int(operand[1]) + 1))
-                elif operator == '--':
-                    return ('Number', str(int(operand[1]) - 1))
-            return ('UnaryExpression', operator, operand)
+                result = evaluate_unary(operator, operand[1])
+                if result is not None:
+                    return self.share(('Number', result.__class__, result), 'Number', result)
+            return self.make('UnaryExpression', operator, operand, *optional)
+
+        elif node_type == 'Assignment':
+            _, var_name, value = node
+            value = self.typed_value(self.variable_types.get(var_name), self.constant_folding(value))
+            return self.make('Assignment', var_name, value)
+
+        elif node_type == 'FunctionCall':
+            _, function_name, arguments = node
+            return self.make('FunctionCall', function_name, [self.constant_folding(argument) for argument in arguments])
+
+        # Return other types as-is (Number, Variable, etc.)
+        elif node_type == 'Number':
+            value = node[1]
+            return self.share(('Number', value.__class__, value), 'Number', value)
+        elif node_type == 'Variable':
+            return self.share(('Variable', node[1]), 'Variable', node[1])
+        return self.intern(node)
+
+
+    # Folds a list of statements, a folded statement can turn into zero or more statements
+    def fold_statements(self, statements):
+        folded = []
+        for statement in statements:
+            folded.extend(self.fold_statement(statement))
+        return folded
+
+
+    # Folds a single statement and returns the list of statements that replace it
+    def fold_statement(self, node):
+        node_type = node[0]
+
+        if node_type == 'FunctionDefinition':
+            _, return_type, function_name, parameters, body = node
+            return [('FunctionDefinition', return_type, function_name, parameters, self.fold_block(body))]
 
         elif node_type == 'IfStatement':
             _, condition, if_block, else_block = node
             optimized_condition = self.constant_folding(condition)
             if optimized_condition[0] == 'Number':
-                # Simplify if condition is a constant
-                if optimized_condition[1] == '1':
-                    return self.constant_folding(if_block)
-                elif optimized_condition[1] == '0':
-                    return self.constant_folding(else_block) if else_block else None
+                # Only the branch that is taken is left
+                if optimized_condition[1] != 0:
+                    return self.fold_statements(if_block[1])
+                return self.fold_statements(else_block[1]) if else_block else []
             else:
                 # Recursively fold both branches
-                optimized_if_block = [self.constant_folding(stmt) for stmt in if_block]
-                optimized_else_block = [self.constant_folding(stmt) for stmt in else_block] if else_block else None
-                return ('IfStatement', optimized_condition, optimized_if_block, optimized_else_block)
+                optimized_else_block = self.fold_block(else_block) if else_block else None
+                return [('IfStatement', optimized_condition, self.fold_block(if_block), optimized_else_block)]
+
+        elif node_type == 'WhileLoop':
+            _, condition, body = node
+            optimized_condition = self.constant_folding(condition)
+            # A loop that never runs is removed
+            if optimized_condition[0] == 'Number' and optimized_condition[1] == 0:
+                return []
+            return [('WhileLoop', optimized_condition, self.fold_block(body))]
 
         elif node_type == 'ForLoop':
             _, init, condition, update, body = node
-            optimized_init = self.constant_folding(init) if init else None
-            optimized_condition = self.constant_folding(condition) if condition else None
-            optimized_update = self.constant_folding(update) if update else None
-            optimized_body = [self.constant_folding(stmt) for stmt in body]
-            return ('ForLoop', optimized_init, optimized_condition, optimized_update, optimized_body)
+            optimized_init = self.fold_statement(init)[0] if init else None
+            optimized_condition = self.constant_folding(condition)
+            # A loop that never runs only keeps its initialization
+            if optimized_condition is not None and optimized_condition[0] == 'Number' and optimized_condition[1] == 0:
+                return [optimized_init] if optimized_init else []
+            optimized_update = self.constant_folding(update)
+            return [('ForLoop', optimized_init, optimized_condition, optimized_update, self.fold_block(body))]
+
+        elif node_type == 'SwitchStatement':
+            _, expression, sections = node
+            sections = [section[:-1] + (self.fold_block(section[-1]),) for section in sections]
+            return [('SwitchStatement', self.constant_folding(expression), sections)]
+
+        elif node_type == 'Declaration':
+            if len(node) == 4:
+                _, var_type, var_name, value = node
+                return [('Declaration', var_type, var_name, self.typed_value(var_type, self.constant_folding(value)))]
+            return [node]
 
         elif node_type == 'ReturnStatement':
             _, value = node
-            return ('ReturnStatement', self.constant_folding(value))
+            return [('ReturnStatement', self.constant_folding(value))]
 
         # Process function blocks and any nested statements
         elif node_type == 'Block':
-            return ('Block', [self.constant_folding(stmt) for stmt in node[1]])
+            return [self.fold_block(node)]
+
+        # Expression statements (Assignment, UnaryExpression, FunctionCall)
+        return [self.constant_folding(node)]
 
-        # Return other types as-is (Number, Variable, etc.)
-        return node
-        
 
-    # Helper to evaluate expressions during folding
+    # Helper to fold every statement inside a block
+    def fold_block(self, block):
+        return ('Block', self.fold_statements(block[1]))
+
+
+    # Helper to evaluate expressions during folding, returns None if it cannot be folded
     def evaluate_exp(self, operator, left, right):
-        if operator == '+':
-            return left + right
-        elif operator == '-':
-            return left - right
-        elif operator == '*':
-            return left * right
-        elif operator == '/':
-            return left / right 
-        elif operator == '%':
-            return left % right
-        else:
-            raise ValueError(f"Unknown operator: {operator}")
+        return evaluate_binary(operator, left, right)
+
+
+    # Helper to convert a constant to the type of the variable it is stored in, other values are unchanged
+    def typed_value(self, var_type, value):
+        if var_type is None or value is None or value[0] != 'Number':
+            return value
+        result = convert(value[1], var_type)
+        return self.share(('Number', result.__class__, result), 'Number', result)
+
+
+    # Constant propagation, runs over one function at a time
+    def propagate_function(self, node):
+        if node[0] != 'FunctionDefinition':
+            return node
+        _, return_type, function_name, parameters, body = node
+        self.constant_values = {}
+        return ('FunctionDefinition', return_type, function_name, parameters, self.propagate_block(body))
+
+
+    # Helper to propagate through every statement of a block, in order
+    def propagate_block(self, block):
+        return ('Block', [self.propagate_constants(statement) for statement in block[1]])
 
 
     # Constant propagation for declarations and assignments
-    # ChatGPT has been helping me debug, not to much avail however
+    # self.constant_values holds the variables known to be constant at the current statement
     def propagate_constants(self, node):
         node_type = node[0]
 
-        # Check if Declaration and if it is of the form "int x = 5"
         # Node Structure - ('Declaration', var_type, var_name, assignment)
         #               OR ('Declaration', var_type, var_name)
-        if node_type == 'Declaration' and len(node) == 4:
-            _, var_type, var_name, value = node
-            value = self.constant_folding(value)  
-            # If value exists and is a number
-            if value and value[0] == 'Number':
-                # Store the constant 
-                self.constant_values[var_name] = value[1]
+        if node_type == 'Declaration':
+            if len(node) == 4:
+                _, var_type, var_name, value = node
+                value = self.typed_value(var_type, self.constant_folding(self.substitute(value)))
+                self.record_value(var_name, value)
+                return ('Declaration', var_type, var_name, value)
+            self.constant_values.pop(node[2], None)
             return node
-        
-        # Node Structure - ('Assignment', var_name, expression)
+
+        elif node_type == 'IfStatement':
+            _, condition, if_block, else_block = node
+            condition = self.constant_folding(self.substitute(condition))
+
+            # Each branch starts from the same values, afterwards only values both agree on are kept
+            before = dict(self.constant_values)
+            if_block = self.propagate_block(if_block)
+            after_if = self.constant_values
+            self.constant_values = dict(before)
+            if else_block:
+                else_block = self.propagate_block(else_block)
+            self.constant_values = {name: value for name, value in self.constant_values.items()
+                                    if after_if.get(name) == value}
+            return ('IfStatement', condition, if_block, else_block)
+
+        elif node_type == 'WhileLoop':
+            _, condition, body = node
+            # Anything the loop assigns is not constant inside or after it
+            self.forget_assigned(node)
+            condition = self.constant_folding(self.substitute(condition))
+            body = self.propagate_block(body)
+            self.forget_assigned(node)
+            return ('WhileLoop', condition, body)
+
+        elif node_type == 'ForLoop':
+            _, init, condition, update, body = node
+            init = self.propagate_constants(init) if init else None
+            self.forget_assigned(node)
+            condition = self.constant_folding(self.substitute(condition))
+            body = self.propagate_block(body)
+            update = self.substitute(update)
+            self.forget_assigned(node)
+            return ('ForLoop', init, condition, update, body)
+
+        elif node_type == 'SwitchStatement':
+            _, expression, sections = node
+            expression = self.constant_folding(self.substitute(expression))
+            # A section is entered from the dispatch or by falling out of the one before it, so it only starts
+            # with the values nothing in the switch assigns, and those are also all that is known after it
+            self.forget_assigned(node)
+            before = self.constant_values
+            propagated = []
+            for section in sections:
+                self.constant_values = dict(before)
+                propagated.append(section[:-1] + (self.propagate_block(section[-1]),))
+            self.constant_values = before
+            return ('SwitchStatement', expression, propagated)
+
+        elif node_type == 'ReturnStatement':
+            _, value = node
+            return ('ReturnStatement', self.constant_folding(self.substitute(value)))
+
+        elif node_type == 'Block':
+            return self.propagate_block(node)
+
+        # Expression statements (Assignment, UnaryExpression, FunctionCall)
+        return self.constant_folding(self.substitute(node))
+
+
+    # Helper to remember or forget a variable depending on whether its new value is constant
+    def record_value(self, var_name, value):
+        if value is not None and value[0] == 'Number':
+            self.constant_values[var_name] = value[1]
+        else:
+            self.constant_values.pop(var_name, None)
+
+
+    # Helper to replace variables with their constant values in an expression
+    # Assignments and ++/-- inside the expression update the known values as they are reached
+    def substitute(self, node):
+        if node is None:
+            return None
+        node_type = node[0]
+
+        if node_type == 'Variable':
+            if node[1] in self.constant_values:
+                value = self.constant_values[node[1]]
+                return self.share(('Number', value.__class__, value), 'Number', value)
+            return self.share(('Variable', node[1]), 'Variable', node[1])
+
+        elif node_type == 'BinaryExpression':
+            _, operator, left, right = node
+            left = self.substitute(left)
+            right = self.substitute(right)
+            return self.share(('BinaryExpression', operator, id(left), id(right)), 'BinaryExpression', operator, left, right)
+
+        elif node_type == 'UnaryExpression':
+            _, operator, operand, *optional = node
+            if operator in ('++', '--'):
+                # The variable itself is changed, so it is not constant anymore
+                self.constant_values.pop(operand[1], None)
+                return self.intern(node)
+            return self.make('UnaryExpression', operator, self.substitute(operand), *optional)
+
         elif node_type == 'Assignment':
             _, var_name, value = node
-            evaluated_value = self.constant_folding(value)
-            if evaluated_value[0] == 'Number':
-                self.constant_values[var_name] = evaluated_value[1]
-            elif var_name in self.constant_values:
-                # Remove if no longer a constant
-                del self.constant_values[var_name] 
-            return ('Assignment', var_name, evaluated_value)
+            value = self.typed_value(self.variable_types.get(var_name), self.constant_folding(self.substitute(value)))
+            self.record_value(var_name, value)
+            return self.make('Assignment', var_name, value)
+
+        elif node_type == 'FunctionCall':
+            _, function_name, arguments = node
+            return self.make('FunctionCall', function_name, [self.substitute(argument) for argument in arguments])
+
+        return self.intern(node)
+
+
+    # Helper to forget every variable assigned anywhere inside a node (used for loops)
+    def forget_assigned(self, node):
+        if isinstance(node, list):
+            for item in node:
+                self.forget_assigned(item)
+        elif isinstance(node, tuple) and node:
+            if node[0] in ('Assignment', 'Declaration'):
+                self.constant_values.pop(node[1] if node[0] == 'Assignment' else node[2], None)
+            elif node[0] == 'UnaryExpression' and node[1] in ('++', '--'):
+                self.constant_values.pop(node[2][1], None)
+            for child in node[1:]:
+                self.forget_assigned(child)
 
-        elif node_type == 'Variable':
-            var_name = node[1]
-            if var_name in self.constant_values:
-                return ('Number', self.constant_values[var_name])
-            return node
-        
-        # Recursively handle BinaryExpression, UnaryExpression, IfStatement, ForLoop, WhileLoop, Block, etc.
-        elif node_type in {'BinaryExpression', 'UnaryExpression', 'IfStatement', 'ForLoop', 'WhileLoop', 'Block', 'ReturnStatement'}:
-            return self.constant_folding(node)
-
-        # Recursively handle other nodes that may contain expressions
-        elif isinstance(node[1:], tuple):
-            return (node[0], *[self.propagate_constants(child) if isinstance(child, tuple) else child for child in node[1:]])
-        
-        # Return just the node if unapplicable for propagation
-        return node
 
     # Removing Dead Code
-    def remove_dead_code(self, ast):
-        used_vars = set()
-        cleaned_ast = []
-        
-        # Step 1: Collect all used variables in the AST
-        for node in ast:
-            self.collect_used_variables(node, used_vars)
-        #print(f"Used variables after collection: {used_vars}") 
-
-        # Step 2: Filter out declarations and assignments for unused variables
-        for node in ast:
+    # Declarations and assignments of variables that are never read are dropped, as long as
+    # computing their value has no side effects. Repeats until nothing else can be removed.
+    def remove_dead_code(self, node):
+        if node[0] != 'FunctionDefinition':
+            return node
+        _, return_type, function_name, parameters, body = node
+
+        while True:
+            used_vars = set()
+            self.collect_used_variables(body, used_vars)
+            cleaned_body = self.remove_unused(body, used_vars)
+            if cleaned_body == body:
+                break
+            body = cleaned_body
+
+        return ('FunctionDefinition', return_type, function_name, parameters, body)
+
+
+    # Helper for dead code, drops the statements in a block that only write unused variables
+    def remove_unused(self, block, used_vars):
+        statements = []
+        for node in block[1]:
             node_type = node[0]
             # Node Structure - ('Declaration', var_type, var_name, assignment)
             #               OR ('Declaration', var_type, var_name)
             if node_type == 'Declaration':
-                var_name = node[2]
-                if var_name in used_vars:
-                    cleaned_ast.append(node)
-                    #(f"Keeping used variable declaration: {var_name}")
-                else:
-                    #print(f"Removing unused variable declaration: {var_name}")  # Debug statement
+                if node[2] not in used_vars and (len(node) == 3 or self.is_pure(node[3])):
                     continue
- 
-            else:
-                # For other nodes (like ReturnStatement), keep them as they are.
-                cleaned_ast.append(node)
+            elif node_type == 'Assignment':
+                if node[1] not in used_vars and self.is_pure(node[2]):
+                    continue
+            elif node_type == 'UnaryExpression' and node[1] in ('++', '--'):
+                if node[2][1] not in used_vars:
+                    continue
+            elif node_type == 'IfStatement':
+                _, condition, if_block, else_block = node
+                else_block = self.remove_unused(else_block, used_vars) if else_block else None
+                node = ('IfStatement', condition, self.remove_unused(if_block, used_vars), else_block)
+            elif node_type == 'WhileLoop':
+                node = ('WhileLoop', node[1], self.remove_unused(node[2], used_vars))
+            elif node_type == 'ForLoop':
+                _, init, condition, update, body = node
+                node = ('ForLoop', init, condition, update, self.remove_unused(body, used_vars))
+            elif node_type == 'SwitchStatement':
+                _, expression, sections = node
+                node = ('SwitchStatement', expression,
+                        [section[:-1] + (self.remove_unused(section[-1], used_vars),) for section in sections])
+            elif node_type == 'Block':
+                node = self.remove_unused(node, used_vars)
+            statements.append(node)
+
+        return ('Block', statements)
+
+
+    # Helper for dead code, expressions without calls, assignments or ++/-- can be dropped
+    def is_pure(self, node):
+        if isinstance(node, list):
+            return all(self.is_pure(item) for item in node)
+        if not isinstance(node, tuple) or not node:
+            return True
+        if node[0] in {'FunctionCall', 'Assignment'} or (node[0] == 'UnaryExpression' and node[1] in ('++', '--')):
+            return False
+        return all(self.is_pure(child) for child in node[1:])
 
-        return cleaned_ast
 
     # Helper method for dead code
     def collect_used_variables(self, node, used_vars):
-        #Recursively traverse the AST to collect all variables that are actually used.
+        # Recursively traverse the AST to collect all variables that are actually read.
         if isinstance(node, tuple):
             node_type = node[0]
 
             if node_type == 'Variable':
                 # Collect variable if it’s used in any expression
                 used_vars.add(node[1])
+                return
 
-            # Node Structure - ('Declaration', var_type, var_name, assignment)
-            #               OR ('Declaration', var_type, var_name)
-            elif node_type == 'Declaration':
-                # Only add the declared variable if it's assigned a value
-                if len(node) > 3 and node[3] is not None:
-                    used_vars.add(node[2]) 
-                    self.collect_used_variables(node[3], used_vars)
+            # A statement like "x++;" only writes x, it does not count as a use
+            if node_type == 'Block':
+                for statement in node[1]:
+                    if statement[0] == 'UnaryExpression' and statement[1] in ('++', '--'):
+                        continue
+                    self.collect_used_variables(statement, used_vars)
+                return
 
             # Traverse child nodes in expressions, assignments, control structures, etc.
             for child in node[1:]:
-                if isinstance(child, tuple):
-                    self.collect_used_variables(child, used_vars)
-                elif isinstance(child, list):
-                    for item in child:
-                        self.collect_used_variables(item, used_vars)
-    
-
-# Example usage:
-# optimizer = Optimizer(ast)
-# optimized_ast = optimizer.optimize()
\ No newline at end of file
+                self.collect_used_variables(child, used_vars)
+        elif isinstance(node, list):
+            for item in node:
+                self.collect_used_variables(item, used_vars)
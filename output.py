@@ -0,0 +1,157 @@
+# Author: Thomas Lander
+# Date: 10/19/26
+# output.py
+
+# Output of the compiler
+# Everything the compiler shows goes through one OutputWriter: the artifacts (tokens, AST, symbol table, TAC,
+# assembly) and the reports (what was inlined, execution counts, files written). Only the artifacts that were asked
+# for are rendered at all, so a compile that only wants assembly does not pay for formatting the AST.
+# Formats:
+#   text     the readable listing, a title between two rules and then the artifact
+#   json     one JSON document with a list of {"artifact", "title", "data"} records, written at the end
+#   ndjson   the same records, one compact JSON object per line as they are produced
+# Errors are always written, as 'error' records in the JSON formats.
+
+import sys
+
+EMITTABLE = ('tokens', 'ast', 'symbols', 'tac', 'asm')  # What --emit can select, reports are on unless --quiet
+FORMATS = ('text', 'json', 'ndjson')
+BUFFER_SIZE = 1 << 20
+RULE = '-' * 50
+
+
+class OutputWriter:
+    def __init__(self, artifacts, format = 'text', path = None, titles = True):
+        self.artifacts = set(artifacts) | {'error'}
+        self.format = format
+        self.path = path
+        self.titles = titles  # Without titles a single text artifact is just itself, e.g. an assembly file
+        self.records = []  # Collected for the json format
+        # One buffered stream, every artifact is written to it with a single write
+        self.stream = open(path, 'w', buffering = BUFFER_SIZE) if path else sys.stdout
+
+
+    # Whether an artifact is shown, callers can skip the work of producing one that is not
+    def wants(self, artifact):
+        return artifact in self.artifacts
+
+
+    # Writes one artifact, render turns its data into text lines and is only called for the text format
+    def emit(self, artifact, title, data, render):
+        if artifact not in self.artifacts:
+            return
+        if self.format == 'text':
+            lines = [RULE, title, RULE] if title and self.titles else []
+            lines += render(data)
+            self.stream.write("\n".join(lines) + "\n")
+        else:
+            import json  # Only the json formats need it
+            record = {"artifact": artifact, "title": title, "data": data}
+            if self.format == 'ndjson':
+                self.stream.write(json.dumps(record, separators = (',', ':'), default = str) + "\n")
+            else:
+                self.records.append(record)
+
+
+    def tokens(self, tokens, title):
+        self.emit('tokens', title, tokens, token_lines)
+
+
+    def ast(self, ast, title):
+        self.emit('ast', title, ast, lambda node: list(ast_lines(node)))
+
+
+    def symbols(self, symbol_table):
+        if self.wants('symbols'):
+            self.emit('symbols', "Symbol Table:", symbol_table_data(symbol_table), symbol_table_lines)
+
+
+    def tac(self, tac, title):
+        self.emit('tac', title, tac, list)
+
+
+    def asm(self, assembly_code, title):
+        self.emit('asm', title, assembly_code.splitlines(), list)
+
+
+    # A one line report
+    def message(self, text):
+        self.emit('report', None, text, lambda text: [text])
+
+
+    # An error that stopped the compile
+    def error(self, text):
+        self.emit('error', None, text, lambda text: [text])
+
+
+    # Every error found in a file
+    def diagnostics(self, file, diagnostics):
+        data = {"file": file, "diagnostics": [{"line": line, "column": column, "message": message}
+                                              for line, column, message in diagnostics]}
+        self.emit('error', None, data, diagnostic_lines)
+
+
+    # Finishes the output, nothing is lost if this is not called on an error, but json needs it to be written
+    def close(self):
+        if self.format == 'json':
+            import json
+            json.dump(self.records, self.stream, separators = (',', ':'), default = str)
+            self.stream.write("\n")
+        if self.path:
+            self.stream.close()
+        else:
+            self.stream.flush()
+
+
+def diagnostic_lines(data):
+    lines = [f"{len(data['diagnostics'])} error(s) in file '{data['file']}':"]
+    lines += [f"  {data['file']}:{error['line']}:{error['column']}: {error['message']}" for error in data["diagnostics"]]
+    return lines
+
+
+# Token table (I loved the way Tullis's AI written code printed in code review, so I used the same template)
+def token_lines(tokens):
+    lines = [f"{'Token':<20} {'Type':<20} {'Line':<5} {'Column':<5}", '-' * 50]
+    for tokenText, tokenType, line, column in tokens:
+        lines.append(f"{repr(tokenText):<20} {tokenType:<20} {line:<5} {column:<5}")
+    return lines
+
+
+# The AST one node per line, children indented below their parent
+def ast_lines(node, indent = 0):
+    spacing = '  ' * indent
+    if isinstance(node, tuple):
+        yield f"{spacing}{node[0]}"
+        for child in node[1:]:
+            yield from ast_lines(child, indent + 1)
+    elif isinstance(node, list):
+        for item in node:
+            yield from ast_lines(item, indent)
+    else:
+        # Strings are printed whole instead of being broken down
+        yield f"{spacing}{node}"
+
+
+# The global scope and every local scope, the active ones first
+def symbol_table_data(symbol_table):
+    return {
+        "global": dict(symbol_table.scopes[0]),
+        "scopes": [dict(scope) for scope in symbol_table.scopes[1:]],
+        "exited_scopes": [dict(scope) for scope in symbol_table.exited_scopes]
+    }
+
+
+def symbol_table_lines(data):
+    lines = ["Global Scope (function declarations):"]
+    lines += [f"  {func_name}: {func_type}" for func_name, func_type in data["global"].items()]
+
+    def scope_lines(scope):
+        if not scope:
+            return ["  No local variables."]
+        return [f"  {var_name}: {var_type}" for var_name, var_type in scope.items()]
+
+    for scope_level, scope in enumerate(data["scopes"], start = 1):
+        lines += ["", f"Local Variables in Active Scope Level {scope_level}:"] + scope_lines(scope)
+    for scope_level, scope in enumerate(data["exited_scopes"], start = len(data["scopes"]) + 1):
+        lines += ["", f"Local Variables in Scope Level {scope_level}:"] + scope_lines(scope)
+    return lines
@@ -0,0 +1,81 @@
+# Author: Thomas Lander
+# Date: 10/19/26
+# profile_data.py
+
+# Block execution profiles for profile-guided optimization
+# A profile is recorded by running the TAC straight out of ThreeAddressCodeGenerator in the virtual machine, and
+# maps every function to the number of times each of its blocks ran. Blocks are named the way
+# ControlFlowGraph.block_names does: the function name for its entry, the label of a labeled block, and "L3.1"
+# for the first unlabeled block after L3. A later compile of the same source produces the same names.
+#
+# The file is JSON:
+#   {"format": "tac-block-profile", "version": 1,
+#    "functions": {"main": {"main": 1, "L1": 101, "L1.1": 100, "L2": 1}}}
+
+import json
+from dataflow import ControlFlowGraph
+
+PROFILE_FORMAT = "tac-block-profile"
+PROFILE_VERSION = 1
+
+
+class Profile:
+    def __init__(self, functions = None):
+        self.functions = functions or {}  # Function -> {block name -> times it ran}
+
+
+    # Profile of everything a virtual machine has run so far
+    @classmethod
+    def from_vm(cls, vm):
+        functions = {}
+        for function, label, count, _ in vm.block_report():
+            functions.setdefault(function, {})[label] = count
+        return cls(functions)
+
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as file:
+            data = json.load(file)
+        if data.get("format") != PROFILE_FORMAT or data.get("version") != PROFILE_VERSION:
+            raise ValueError(f"'{path}' is not a version {PROFILE_VERSION} block profile")
+        return cls(data["functions"])
+
+
+    def save(self, path):
+        with open(path, "w") as file:
+            json.dump({"format": PROFILE_FORMAT, "version": PROFILE_VERSION, "functions": self.functions},
+                      file, indent = 2)
+
+
+    # Times a function was called, None if the profile does not know it
+    def entry_count(self, function):
+        return self.functions.get(function, {}).get(function)
+
+
+    # Block name -> count for one listing, only for the functions whose blocks still match the profile
+    def block_counts(self, tac):
+        cfg = ControlFlowGraph(tac)
+        counts = {}
+        for function, names in self.function_blocks(cfg).items():
+            if function in self.functions and set(names) == set(self.functions[function]):
+                counts.update((name, self.functions[function][name]) for name in names)
+        return counts
+
+
+    # Functions of a listing the profile has no usable counts for, because they are missing or have changed
+    def stale_functions(self, tac):
+        cfg = ControlFlowGraph(tac)
+        return [function for function, names in self.function_blocks(cfg).items()
+                if set(names) != set(self.functions.get(function, ()))]
+
+
+    # Helper, function -> names of its blocks
+    def function_blocks(self, cfg):
+        functions = {}
+        function = None
+        for block, name in zip(cfg.blocks, cfg.block_names()):
+            if cfg.instructions[block.start][0] == 'begin':
+                function = name
+            functions.setdefault(function, []).append(name)
+        return functions
@@ -0,0 +1,299 @@
+# Author: Thomas Lander
+# Date: 10/19/26
+# tac_vm.py
+
+# Virtual machine that runs 3-Address Code directly, so optimizer output can be checked and measured without assembling
+# The TAC is decoded once into a flat array of (opcode, a, b, c) tuples:
+#   - every variable and constant of a function is a slot in its frame, constants are preloaded into the frame
+#     template, so an operand is always just an index
+#   - labels are gone, jumps hold the index of the instruction they go to, a jump table holds a tuple of them
+#   - an ENTER instruction starts every basic block and counts how often the block runs
+#   - a branch on a comparison is one IF_LT..IF_NE instruction holding both operands and the target
+# Execution counts are kept per block, which gives the dynamic instruction count of every label and function.
+
+from constant_eval import INT_MIN, INT_MAX, NEGATED_COMPARISONS, wrap_int, evaluate_binary, parse_constant
+from dataflow import ControlFlowGraph, parse_branch, parse_table
+
+# Opcodes
+ENTER, MOVE, ADD, SUB, MUL, DIV, MOD, LT, GT, LE, GE, EQ, NE, AND, OR, \
+    JUMP, IF, IF_FALSE, IF_LT, IF_GT, IF_LE, IF_GE, IF_EQ, IF_NE, TABLE, PARAM, CALL, RETURN = range(28)
+
+BINARY_OPCODES = {'+': ADD, '-': SUB, '*': MUL, '/': DIV, '%': MOD, '<': LT, '>': GT, '<=': LE, '>=': GE,
+                  '==': EQ, '!=': NE, '&&': AND, '||': OR}
+BRANCH_OPCODES = {'<': IF_LT, '>': IF_GT, '<=': IF_LE, '>=': IF_GE, '==': IF_EQ, '!=': IF_NE}
+
+MAX_CALL_DEPTH = 10000
+
+
+class TACRuntimeError(RuntimeError):
+    pass
+
+
+# One function after decoding
+class DecodedFunction:
+    def __init__(self, name, params):
+        self.name = name
+        self.params = params
+        self.entry = None  # Index of its first instruction
+        self.slots = {}  # Variable or constant -> slot index
+        self.template = []  # Initial frame, variables start at 0 and constants hold their value
+
+
+    # Slot of a TAC operand, constants get a slot holding their value
+    def slot(self, operand):
+        if operand not in self.slots:
+            self.slots[operand] = len(self.template)
+            if operand.startswith('"'):
+                value = operand[2:-2]  # String literals are written as ""text""
+            else:
+                value = parse_constant(operand)
+            self.template.append(0 if value is None else value)
+        return self.slots[operand]
+
+
+class TACVirtualMachine:
+    def __init__(self, tac):
+        self.tac = tac
+        self.code = []
+        self.functions = {}  # Name -> DecodedFunction
+        self.blocks = []  # (function, label, number of instructions) per basic block
+        self.block_counts = []
+        self.decode()
+
+
+    # Decodes the TAC into the instruction array, one pass plus a fixup of the jump targets
+    def decode(self):
+        cfg = ControlFlowGraph(self.tac)
+        leaders = {block.start: (block, name) for block, name in zip(cfg.blocks, cfg.block_names())}
+        label_targets = {}  # Label -> index of the ENTER of its block
+        jumps = []  # (instruction index, label) to patch
+        call_targets = []  # (instruction index, function name) to patch
+        tables = []  # (instruction index, lowest case, case labels, default label) to patch
+        function = None
+
+        for line_number, line in enumerate(self.tac):
+            kind, defs, _, target = cfg.instructions[line_number]
+
+            if line_number in leaders:
+                block, label = leaders[line_number]
+                if kind == 'begin':
+                    function = DecodedFunction(label, defs)
+                    for param in defs:
+                        function.slot(param)
+                    function.entry = len(self.code)
+                    self.functions[label] = function
+                elif kind == 'label':
+                    label_targets[target] = len(self.code)
+                # Labels, BEGIN, and END are not instructions of their own
+                size = sum(1 for index in range(block.start, block.end)
+                           if cfg.instructions[index][0] not in ('label', 'begin', 'end'))
+                size += cfg.instructions[block.end - 1][0] == 'end'  # Falling off the end is an implicit return
+                self.code.append((ENTER, len(self.blocks), 0, 0))
+                self.blocks.append((function.name, label, size))
+
+            if kind == 'assign':
+                var, expr = line.split(" = ", 1)
+                dest = function.slot(var)
+                parts = expr.split(" ")
+                if expr.startswith('"') or len(parts) == 1:
+                    if expr == "UNINITIALIZED":
+                        continue
+                    self.code.append((MOVE, dest, function.slot(expr), 0))
+                elif len(parts) == 3 and parts[1] in BINARY_OPCODES:
+                    self.code.append((BINARY_OPCODES[parts[1]], dest, function.slot(parts[0]), function.slot(parts[2])))
+                else:
+                    raise TACRuntimeError(f"Cannot decode TAC line: {line}")
+            elif kind == 'call':
+                var, expr = line.split(" = ", 1)
+                _, name, count = expr.split(" ")
+                call_targets.append((len(self.code), name))
+                self.code.append((CALL, function.slot(var), name, int(count)))
+            elif kind == 'param':
+                self.code.append((PARAM, function.slot(line.split(" ", 1)[1]), 0, 0))
+            elif kind == 'branch':
+                branch, condition, _ = parse_branch(line)
+                jumps.append((len(self.code), target))
+                if len(condition) == 3 and condition[1] in BRANCH_OPCODES:
+                    # ifFalse jumps on the opposite comparison
+                    left, operator, right = condition
+                    operator = operator if branch == "if" else NEGATED_COMPARISONS[operator]
+                    self.code.append((BRANCH_OPCODES[operator], function.slot(left), function.slot(right), None))
+                elif len(condition) == 1:
+                    self.code.append((IF if branch == "if" else IF_FALSE, function.slot(condition[0]), None, 0))
+                else:
+                    raise TACRuntimeError(f"Cannot decode TAC line: {line}")
+            elif kind == 'jump':
+                jumps.append((len(self.code), target))
+                self.code.append((JUMP, None, 0, 0))
+            elif kind == 'table':
+                value, low, labels, default = parse_table(line)
+                tables.append((len(self.code), low, labels, default))
+                self.code.append((TABLE, function.slot(value), 0, None))
+            elif kind == 'return':
+                parts = line.split(" ", 1)
+                self.code.append((RETURN, function.slot(parts[1]) if len(parts) > 1 else -1, 0, 0))
+            elif kind == 'end':
+                self.code.append((RETURN, -1, 0, 0))
+
+        for index, label in jumps:
+            if label not in label_targets:
+                raise TACRuntimeError(f"Jump to undefined label '{label}'")
+            op, a, b, c = self.code[index]
+            if op == JUMP:
+                self.code[index] = (op, label_targets[label], 0, c)
+            elif op == IF or op == IF_FALSE:
+                self.code[index] = (op, a, label_targets[label], c)
+            else:  # Comparison branches use a and b for the operands
+                self.code[index] = (op, a, b, label_targets[label])
+        for index, low, labels, default in tables:
+            for label in labels + [default]:
+                if label not in label_targets:
+                    raise TACRuntimeError(f"Jump to undefined label '{label}'")
+            # Operand c holds (lowest case, case targets, default target)
+            op, a, b, _ = self.code[index]
+            self.code[index] = (op, a, b, (low, tuple(label_targets[label] for label in labels), label_targets[default]))
+        # Calls hold the callee itself, unknown functions only fail if the call is reached
+        for index, name in call_targets:
+            op, a, _, c = self.code[index]
+            self.code[index] = (op, a, self.functions.get(name, name), c)
+
+
+    # Runs a function and returns its result, block counts accumulate over runs until reset() is called
+    # max_blocks bounds the number of blocks entered, so a program that never ends raises instead of hanging
+    def run(self, function_name = 'main', args = (), max_blocks = 10_000_000):
+        if function_name not in self.functions:
+            raise TACRuntimeError(f"No function named '{function_name}'")
+        if len(self.block_counts) != len(self.blocks):
+            self.reset()
+        code = self.code
+        counts = self.block_counts
+        function = self.functions[function_name]
+        frame = list(function.template)
+        count = min(len(args), len(function.params))
+        frame[:count] = args[:count]
+        pc = function.entry
+        params = []
+        stack = []
+        blocks_left = max_blocks
+
+        # Dispatch loop, the most common instructions are tested first
+        while True:
+            op, a, b, c = code[pc]
+            pc += 1
+            if op == ENTER:
+                counts[a] += 1
+                blocks_left -= 1
+                if not blocks_left:
+                    raise TACRuntimeError(f"Stopped after {max_blocks} blocks, the program may not terminate")
+            elif op == MOVE:
+                frame[a] = frame[b]
+            elif op == IF_FALSE:
+                if not frame[a]:
+                    pc = b
+            elif op == JUMP:
+                pc = a
+            elif op == IF_LT:
+                if frame[a] < frame[b]:
+                    pc = c
+            elif op == IF_GE:
+                if frame[a] >= frame[b]:
+                    pc = c
+            elif op == ADD:
+                value = frame[b] + frame[c]
+                if type(value) is int and not INT_MIN <= value <= INT_MAX:
+                    value = wrap_int(value)
+                frame[a] = value
+            elif op == SUB:
+                value = frame[b] - frame[c]
+                if type(value) is int and not INT_MIN <= value <= INT_MAX:
+                    value = wrap_int(value)
+                frame[a] = value
+            elif op == LT:
+                frame[a] = int(frame[b] < frame[c])
+            elif op == GT:
+                frame[a] = int(frame[b] > frame[c])
+            elif op == LE:
+                frame[a] = int(frame[b] <= frame[c])
+            elif op == GE:
+                frame[a] = int(frame[b] >= frame[c])
+            elif op == EQ:
+                frame[a] = int(frame[b] == frame[c])
+            elif op == NE:
+                frame[a] = int(frame[b] != frame[c])
+            elif op == IF:
+                if frame[a]:
+                    pc = b
+            elif op == IF_GT:
+                if frame[a] > frame[b]:
+                    pc = c
+            elif op == IF_LE:
+                if frame[a] <= frame[b]:
+                    pc = c
+            elif op == IF_EQ:
+                if frame[a] == frame[b]:
+                    pc = c
+            elif op == IF_NE:
+                if frame[a] != frame[b]:
+                    pc = c
+            elif op == MUL:
+                value = frame[b] * frame[c]
+                if type(value) is int and not INT_MIN <= value <= INT_MAX:
+                    value = wrap_int(value)
+                frame[a] = value
+            elif op == DIV or op == MOD:
+                value = evaluate_binary('/' if op == DIV else '%', frame[b], frame[c])
+                if value is None:
+                    raise TACRuntimeError("Division by zero")
+                frame[a] = value
+            elif op == TABLE:
+                low, targets, default = c
+                case = frame[a] - low
+                pc = targets[case] if 0 <= case < len(targets) else default
+            elif op == AND:
+                frame[a] = int(frame[b] != 0 and frame[c] != 0)
+            elif op == OR:
+                frame[a] = int(frame[b] != 0 or frame[c] != 0)
+            elif op == PARAM:
+                params.append(frame[a])
+            elif op == CALL:
+                if isinstance(b, str):
+                    raise TACRuntimeError(f"Call to undefined function '{b}'")
+                if len(stack) == MAX_CALL_DEPTH:
+                    raise TACRuntimeError("Call stack overflow")
+                arguments = params[len(params) - c:]
+                del params[len(params) - c:]
+                stack.append((pc, frame, a))
+                frame = list(b.template)
+                count = min(c, len(b.params))
+                frame[:count] = arguments[:count]
+                pc = b.entry
+            else:  # RETURN, and falling off the end of a function
+                value = frame[a] if a >= 0 else 0
+                if not stack:
+                    return value
+                pc, frame, dest = stack.pop()
+                frame[dest] = value
+
+
+    # Clears the block counts
+    def reset(self):
+        self.block_counts = [0] * len(self.blocks)
+
+
+    # Total TAC instructions executed so far
+    def instruction_count(self):
+        return sum(count * size for count, (_, _, size) in zip(self.block_counts, self.blocks))
+
+
+    # (function, label, times entered, instructions executed) for every block
+    def block_report(self):
+        return [(function, label, count, count * size)
+                for count, (function, label, size) in zip(self.block_counts, self.blocks)]
+
+
+    # Function -> instructions executed in it
+    def function_counts(self):
+        counts = {}
+        for function, _, _, instructions in self.block_report():
+            counts[function] = counts.get(function, 0) + instructions
+        return counts
@@ -0,0 +1,9 @@
+// errors: 3
+int main() {
+    int x = 1;
+    int v = --4;
+    int w = ++(x + 1);
+    int y = ++--x;
+    int z = -++x;
+    return v + w + y + z + ++(x);
+}
@@ -0,0 +1,15 @@
+// errors: 3
+int first() {
+    int a = ;
+    return a;
+}
+
+int second(int x) {
+    x = x + ;
+    return x;
+}
+
+int main() {
+    int y = 2
+    return first() + second(y);
+}
@@ -0,0 +1,8 @@
+// errors: 4
+int main() {
+    int a = 1;
+    x++;
+    --w;
+    a = y--;
+    return a + zz;
+}
@@ -0,0 +1,20 @@
+int L1() {
+    return 4;
+}
+
+int L2(int x) {
+    return x + 1;
+}
+
+int main() {
+    int i = 0;
+    int total = 0;
+    while (i < 5) {
+        total = total + L1();
+        if (total > 10) {
+            total = L2(total);
+        }
+        i = i + 1;
+    }
+    return total;
+}
@@ -0,0 +1,10 @@
+// inlined: square
+int main() {
+    int i = 0;
+    int total = 0;
+    while (i < 6) {
+        total = total + square(i);
+        i = i + 1;
+    }
+    return total - count_down(total);
+}
@@ -0,0 +1,16 @@
+int square(int x) {
+    return x * x;
+}
+
+int unused(int y) {
+    return y + 1;
+}
+
+int count_down(int n) {
+    int steps = 0;
+    while (n > 40) {
+        n = n - 7;
+        steps = steps + 1;
+    }
+    return steps;
+}
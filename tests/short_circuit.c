@@ -0,0 +1,29 @@
+int count(int n) {
+	int total = 0;
+	for (int i = 0; i < n && total < 40; i = i + 1) {
+		if (i == 3 || i == 5) {
+			total = total + 10;
+		} else {
+			if (!(i > 7)) {
+				total = total + 1;
+			}
+		}
+	}
+	return total;
+}
+
+int main() {
+	int x = 0;
+	int y = 5;
+	int z = 0;
+	if (x != 0 && 10 / x > 1) {
+		z = 1;
+	}
+	int w = x && ++y;
+	int v = y || (x = 7);
+	while (x < 3 && y != 100)
+		x = x + 1;
+	for (; z < 2 || x < 0;)
+		z = z + 1;
+	return count(20) + x * 10 + y + z + w + v;
+}
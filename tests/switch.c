@@ -0,0 +1,42 @@
+int dense(int x) {
+	int r = 0;
+	switch (x) {
+		case 1: r = 10; break;
+		case 2: r = 20; break;
+		case 3: r = 30;
+		case 4: r = r + 4; break;
+		case 6: r = 60; break;
+		default: r = 1;
+	}
+	return r;
+}
+
+int sparse(int x) {
+	switch (x) {
+		case -40: return 1;
+		case 3: return 2;
+		case 700: return 3;
+		case 9000: return 4;
+		case 9001: return 5;
+		case 9002: return 6;
+		case 9003: return 7;
+		case 65000: return 8;
+	}
+	return 0;
+}
+
+int main() {
+	int sum = 0;
+	int i = 0;
+	for (i = 0; i < 8; i++) {
+		sum = sum + dense(i);
+	}
+	while (1) {
+		sum = sum + sparse(i * 1000 + 1);
+		i++;
+		if (i > 9) {
+			break;
+		}
+	}
+	return sum + sparse(0 - 40) + sparse(3) + sparse(700) + sparse(9003) + sparse(65000);
+}
@@ -0,0 +1,10 @@
+int main() {
+    int t1 = 5;
+    int t2 = 0;
+    int x = t1 + 2 * 3;
+    while (t2 < 3) {
+        t2 = t2 + 1;
+        x = x + t1 * t2;
+    }
+    return x + t1 + t2;
+}
@@ -2,34 +2,139 @@
 # Date: 11/08/24
 # three_address_code.py
 
+import re
+from constant_eval import COMPARISON_OPERATORS
+from dataflow import format_table
+
+TEMP_NAME = re.compile(r't([1-9]\d*)')
+LABEL_NAME = re.compile(r'L([1-9]\d*)')
+
+# Switch lowering, see visit_switch_statement
+MIN_TABLE_CASES = 4  # A jump table needs at least this many cases
+MIN_TABLE_DENSITY = 0.4  # and at least this share of its slots have to be cases
+MAX_LINEAR_CLUSTERS = 3  # Up to this many cases and tables are tested one after the other, more are binary searched
+
+
+# Temporaries and labels are integer ids, they only become "t3" / "L2" when a line is written out
+class Temp:
+    __slots__ = ('id',)
+
+    def __init__(self, temp_id):
+        self.id = temp_id
+
+    def __str__(self):
+        return f"t{self.id}"
+
+    def __eq__(self, other):
+        return isinstance(other, Temp) and other.id == self.id
+
+    def __hash__(self):
+        return hash(('t', self.id))
+
+
+class Label:
+    __slots__ = ('id',)
+
+    def __init__(self, label_id):
+        self.id = label_id
+
+    def __str__(self):
+        return f"L{self.id}"
+
+    def __eq__(self, other):
+        return isinstance(other, Label) and other.id == self.id
+
+    def __hash__(self):
+        return hash(('L', self.id))
+
+
+# Id of a temp or label name in a TAC line, None if the name is not one
+def temp_id(name):
+    match = TEMP_NAME.fullmatch(name)
+    return int(match.group(1)) if match else None
+
+
+def label_id(name):
+    match = LABEL_NAME.fullmatch(name)
+    return int(match.group(1)) if match else None
+
+
+# Splits sorted case values into clusters (first, last) of indexes, a cluster of more than one case is a jump table
+# From each case the longest run that is still dense enough becomes a table, any other case stands alone
+def case_clusters(values):
+    clusters = []
+    first = 0
+    while first < len(values):
+        last = first
+        for end in range(first + MIN_TABLE_CASES - 1, len(values)):
+            if end - first + 1 >= MIN_TABLE_DENSITY * (values[end] - values[first] + 1):
+                last = end
+        clusters.append((first, last))
+        first = last + 1
+    return clusters
+
+
+# Whether an expression can be evaluated when C would skip it, as the right side of && or ||
+# Calls, assignments, ++ and -- have effects, and a division could be the very one the left side guards against
+def can_evaluate_eagerly(node):
+    node_type = node[0]
+    if node_type in ('Number', 'Variable', 'StringLiteral'):
+        return True
+    if node_type == 'BinaryExpression':
+        return node[1] not in ('/', '%') and can_evaluate_eagerly(node[2]) and can_evaluate_eagerly(node[3])
+    if node_type == 'UnaryExpression':
+        return node[1] in ('-', '!') and can_evaluate_eagerly(node[2])
+    return False
+
+
 class ThreeAddressCodeGenerator:
     def __init__(self, ast):
         self.ast = ast
         self.temp_var_count = 0
         self.label_counter = 1
         self.code = []
+        # End labels of the loops and switches being generated, break jumps to the innermost one
+        self.break_labels = []
+        # Ids a temp must not take, because the program has a name of its own like t1
+        self.reserved_temps = set()
 
 
-    # Temporary variables "t1", "t2" to hold expressions
+    # Temporary variables t1, t2 to hold expressions
     def new_temp(self):
         self.temp_var_count += 1
-        return f"t{self.temp_var_count}"
+        while self.temp_var_count in self.reserved_temps:
+            self.temp_var_count += 1
+        return Temp(self.temp_var_count)
     
 
     # Create labels for blocks
     def new_label(self):
-        label = f"L{self.label_counter}"
+        label = Label(self.label_counter)
         self.label_counter += 1
         return label
 
 
     # Generate 3-Point Code for the given AST
     def generate(self):
+        self.reserve_names(self.ast)
         for node in self.ast:
             self.visit(node)
         return self.code
 
 
+    # Names in the AST that look like temps are kept out of new_temp, so "int t1;" is never overwritten by one
+    def reserve_names(self, ast):
+        nodes = [ast]
+        while nodes:
+            node = nodes.pop()
+            if isinstance(node, (tuple, list)):
+                nodes.extend(node)
+            elif isinstance(node, str):
+                reserved = temp_id(node)
+                if reserved is not None:
+                    self.reserved_temps.add(reserved)
+
+
     # Function to handle different node types in the AST
     def visit(self, node):
         node_type = node[0]
@@ -44,14 +149,20 @@ class ThreeAddressCodeGenerator:
             self.visit_while_loop(node)
         elif node_type == 'ForLoop':
             self.visit_for_loop(node)
+        elif node_type == 'SwitchStatement':
+            self.visit_switch_statement(node)
+        elif node_type == 'BreakStatement':
+            self.code.append(f"goto {self.break_labels[-1]}")
         elif node_type == 'ReturnStatement':
             self.visit_return_statement(node)
         elif node_type == 'Declaration':
             self.visit_declaration(node)
         elif node_type == 'Assignment':
-            self.visit_assignment(node)
+            return self.visit_assignment(node)
         elif node_type == 'UnaryExpression':
-            self.visit_unary_expression(node)
+            return self.visit_unary_expression(node)
+        elif node_type == 'FunctionCall':
+            return self.visit_function_call(node)
         elif node_type in {'Number', 'Variable', 'StringLiteral'}:
             return self.visit_primary_expression(node)
         else:
@@ -62,7 +173,8 @@ class ThreeAddressCodeGenerator:
     # Takes in node - ('FunctionDefinition', return_type, function_name, parameters, body)
     def visit_function_definition(self, node):
         _, return_type, function_name, parameters, body = node
-        self.code.append(f"{function_name}() BEGIN")
+        param_names = ", ".join(param_name for _, param_name in parameters)
+        self.code.append(f"{function_name}({param_names}) BEGIN")
 
         # Body that contains Statements
         for statement in body[1]: 
@@ -74,6 +186,9 @@ class ThreeAddressCodeGenerator:
     # Takes in node - ('BinaryExpression', operator, left_expr, right_expr))
     def visit_binary_expression(self, node):
         _, operator, left, right = node
+        # && and || compute both sides and combine them without a branch, unless the right side must be skipped
+        if operator in ('&&', '||') and not can_evaluate_eagerly(right):
+            return self.visit_logical_value(node)
         leftside = self.visit(left)
         rightside = self.visit(right)
 
@@ -83,6 +198,66 @@ class ThreeAddressCodeGenerator:
         return temp_var
 
 
+    # Helper for && and || whose right side only runs when the left side did not decide, the result is 1 or 0
+    def visit_logical_value(self, node):
+        true_label = self.new_label()
+        false_label = self.new_label()
+        end_label = self.new_label()
+        temp_var = self.new_temp()
+        self.visit_condition(node, true_label, false_label)
+        self.code.append(f"{true_label}:")
+        self.code.append(f"{temp_var} = 1")
+        self.code.append(f"goto {end_label}")
+        self.code.append(f"{false_label}:")
+        self.code.append(f"{temp_var} = 0")
+        self.code.append(f"{end_label}:")
+        return temp_var
+
+
+    # Conditions of ifs and loops are lowered straight into jumps to true_label or false_label, nothing is stored
+    # && and || become short-circuit branches and ! swaps the targets, and a comparison is a single
+    # "if a < b goto L" branch, which the back end turns into one cmp and one conditional jump
+    def visit_condition(self, node, true_label, false_label):
+        node_type = node[0]
+        if node_type == 'BinaryExpression' and node[1] in ('&&', '||'):
+            _, operator, left, right = node
+            right_label = self.new_label()
+            if operator == '&&':
+                self.visit_condition(left, right_label, false_label)
+            else:
+                self.visit_condition(left, true_label, right_label)
+            self.code.append(f"{right_label}:")
+            self.visit_condition(right, true_label, false_label)
+            return
+        if node_type == 'UnaryExpression' and node[1] == '!':
+            self.visit_condition(node[2], false_label, true_label)
+            return
+
+        if node_type == 'BinaryExpression' and node[1] in COMPARISON_OPERATORS:
+            _, operator, left, right = node
+            leftside = self.visit(left)
+            rightside = self.visit(right)
+            self.code.append(f"if {leftside} {operator} {rightside} goto {true_label}")
+        else:
+            condition_temp = self.visit(node)
+            self.code.append(f"if {condition_temp} goto {true_label}")
+        self.code.append(f"goto {false_label}")
+
+
+    # Handling function calls, arguments are passed with PARAM before the CALL
+    # Takes in node - ('FunctionCall', function_name, arguments)
+    def visit_function_call(self, node):
+        _, function_name, arguments = node
+        arg_values = [self.visit(argument) for argument in arguments]
+        for value in arg_values:
+            self.code.append(f"PARAM {value}")
+
+        temp_var = self.new_temp()
+        self.code.append(f"{temp_var} = CALL {function_name} {len(arg_values)}")
+
+        return temp_var
+
+
     # Handling if-statements
     # Takes in node - ('IfStatement', condition, block, temp_block)
     def visit_if_statement(self, node):
@@ -90,14 +265,9 @@ class ThreeAddressCodeGenerator:
         true_label = self.new_label()
         end_label = self.new_label()
 
-        # Evaluate condition
-        condition_temp = self.visit(condition)
-        self.code.append(f"if {condition_temp} goto {true_label}")
-
-        # Set false branch (else statement) if it exists
-        if false_body:
-            false_label = self.new_label()
-            self.code.append(f"goto {false_label}")
+        # Evaluate condition, a false condition goes to the else statement if it exists, otherwise it skips the body
+        false_label = self.new_label() if false_body else end_label
+        self.visit_condition(condition, true_label, false_label)
 
         # True branch
         self.code.append(f"{true_label}:")
@@ -116,7 +286,7 @@ class ThreeAddressCodeGenerator:
 
 
     # Handling while loops
-    # Takes in node - ('WhileLoop', condition, body)
+    # Takes in node - ('WhileLoop', condition, ('Block', statements))
     def visit_while_loop(self, node):
         _, condition, body = node
         start_label = self.new_label()
@@ -127,14 +297,14 @@ class ThreeAddressCodeGenerator:
         self.code.append(f"{start_label}:")
 
         # Evaluate the conditional statement
-        condition_temp = self.visit(condition)
-        self.code.append(f"if {condition_temp} goto {body_label}")
-        self.code.append(f"goto {end_label}")
+        self.visit_condition(condition, body_label, end_label)
 
         # Loop body
         self.code.append(f"{body_label}:")
-        for statement in body:
+        self.break_labels.append(end_label)
+        for statement in body[1]:
             self.visit(statement)
+        self.break_labels.pop()
 
         self.code.append(f"goto {start_label}")
         self.code.append(f"{end_label}:")
@@ -149,28 +319,89 @@ class ThreeAddressCodeGenerator:
         end_label = self.new_label()
 
         # Loop initialization
-        self.visit(initialization)
+        if initialization is not None:
+            self.visit(initialization)
 
         # Start of the loop
         self.code.append(f"{start_label}:")
 
-        # Evaluate the conditional statement
-        condition_temp = self.visit(condition)
-        self.code.append(f"if {condition_temp} goto {body_label}")
-        self.code.append(f"goto {end_label}")
+        # Evaluate the conditional statement, a loop without one only ends with a break or return
+        if condition is not None:
+            self.visit_condition(condition, body_label, end_label)
 
         # Loop body
         self.code.append(f"{body_label}:")
+        self.break_labels.append(end_label)
         for statement in body[1]:
             self.visit(statement)
+        self.break_labels.pop()
 
         # Update the 3rd statment
-        self.visit(update)
+        if update is not None:
+            self.visit(update)
 
         self.code.append(f"goto {start_label}")
         self.code.append(f"{end_label}:")
 
 
+    # Handling switch statements
+    # Takes in node - ('SwitchStatement', expression, [('Case', value, block) or ('Default', block), ...])
+    # The dispatch picks how to find the case: dense runs of case values become a jump table ("switch" in the TAC),
+    # which is one bounds check and one indirect jump, and the cases and tables left are either tested one after
+    # the other (only a few) or binary searched, so no switch takes more than O(log n) compares.
+    # The sections follow in source order, so a section without a break falls into the next one.
+    def visit_switch_statement(self, node):
+        _, expression, sections = node
+        value = self.visit(expression)
+        section_labels = [self.new_label() for _ in sections]
+        end_label = self.new_label()
+
+        cases = sorted((section[1], label) for section, label in zip(sections, section_labels) if section[0] == 'Case')
+        default_label = next((label for section, label in zip(sections, section_labels) if section[0] == 'Default'),
+                             end_label)
+        clusters = case_clusters([case_value for case_value, _ in cases])
+        self.dispatch_cases(value, cases, clusters, default_label)
+
+        self.break_labels.append(end_label)
+        for section, label in zip(sections, section_labels):
+            self.code.append(f"{label}:")
+            for statement in section[-1][1]:
+                self.visit(statement)
+        self.break_labels.pop()
+        self.code.append(f"{end_label}:")
+
+
+    # Helper for switch statements, jumps to the case of value among the clusters, or to the default
+    def dispatch_cases(self, value, cases, clusters, default_label):
+        if len(clusters) > MAX_LINEAR_CLUSTERS:
+            # Binary search, values below the middle cluster go left
+            middle = len(clusters) // 2
+            upper_label = self.new_label()
+            self.code.append(f"if {value} >= {cases[clusters[middle][0]][0]} goto {upper_label}")
+            self.dispatch_cases(value, cases, clusters[:middle], default_label)
+            self.code.append(f"{upper_label}:")
+            self.dispatch_cases(value, cases, clusters[middle:], default_label)
+            return
+
+        for position, (first, last) in enumerate(clusters):
+            if first == last:
+                self.code.append(f"if {value} == {cases[first][0]} goto {cases[first][1]}")
+                continue
+            # Jump table, the slots between the cases go to the default
+            low = cases[first][0]
+            slots = [default_label] * (cases[last][0] - low + 1)
+            for case_value, label in cases[first:last + 1]:
+                slots[case_value - low] = label
+            if position == len(clusters) - 1:
+                # Nothing to test after the last table, a value outside of it is the default
+                self.code.append(format_table(value, low, map(str, slots), default_label))
+                return
+            next_label = self.new_label()
+            self.code.append(format_table(value, low, map(str, slots), next_label))
+            self.code.append(f"{next_label}:")
+        self.code.append(f"goto {default_label}")
+
+
     # Handling return statements
     # Takes in node - ('ReturnStatement', return_value)
     def visit_return_statement(self, node):
@@ -206,6 +437,9 @@ class ThreeAddressCodeGenerator:
         expr_value = self.visit(expression)
         self.code.append(f"{var_name} = {expr_value}")
 
+        # The value of an assignment is the assigned variable, as in "if (x = y)"
+        return var_name
+
 
     # Handling Unary Operators
     # Takes in node - ('UnaryExpression', operator, ('Variable', var_name))
@@ -240,6 +474,17 @@ class ThreeAddressCodeGenerator:
                 # decrement, then use updated value
                 self.code.append(f"{var_name} = {var_name} - 1")
                 return var_name
+        # Negation, 0 - x
+        elif operator == '-':
+            temp_var = self.new_temp()
+            self.code.append(f"{temp_var} = 0 - {var_name}")
+            return temp_var
+
+        # Logical not, x == 0
+        elif operator == '!':
+            temp_var = self.new_temp()
+            self.code.append(f"{temp_var} = {var_name} == 0")
+            return temp_var
         else:
             raise ValueError(f"Unknown unary operator: {operator}")
 
@@ -0,0 +1,246 @@
+# Author: Thomas Lander
+# Date: 10/19/26
+# whole_program.py
+
+from lexer import Lexer, TOKEN_TYPES
+from my_parser import Parser, ParseError
+from three_address_code import ThreeAddressCodeGenerator
+from optimize import Optimizer
+from assembly import TACtoAssemblyConverter
+
+# With a profile, a function is only inlined if it was called at least this share as often as the most called one
+HOT_CALL_FRACTION = 0.01
+
+
+# Lex and parse a single translation unit, runs inside a worker process
+def parse_unit(file_path):
+    with open(file_path, 'r') as file:
+        content = file.read()
+
+    tokens = Lexer(TOKEN_TYPES).tokenize(content)
+    # Exited scopes are never printed in whole-program mode, so they are not kept
+    parser = Parser(tokens, keep_exited_scopes = False)
+    try:
+        ast = parser.parse()
+    except ParseError as error:
+        error.filename = file_path
+        raise
+
+    return file_path, ast, parser.symbol_table
+
+
+# Compiles several files as one program with a shared function index
+class WholeProgram:
+    def __init__(self, files):
+        self.files = files
+        self.units = {}  # file -> AST
+        self.symbol_tables = {}  # file -> SymbolTable of that unit
+        self.function_index = {}  # function name -> (file, return_type, parameters)
+        self.call_graph = {}  # function name -> set of called function names
+        self.block_counts = {}  # block name -> times it ran, from the profile given to generate_tac
+
+
+    # Parse every translation unit, in parallel when there is more than one
+    def parse_units(self, parallel = True):
+        if parallel and len(self.files) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor() as pool:
+                results = list(pool.map(parse_unit, self.files))
+        else:
+            results = [parse_unit(file) for file in self.files]
+
+        for file_path, ast, symbol_table in results:
+            self.units[file_path] = ast
+            self.symbol_tables[file_path] = symbol_table
+
+        self.build_index()
+        self.resolve_calls()
+
+
+    # Global index of every function definition across all units
+    def build_index(self):
+        self.function_index = {}
+        for file_path, ast in self.units.items():
+            for node in ast:
+                if node[0] != 'FunctionDefinition':
+                    continue
+                _, return_type, function_name, parameters, _ = node
+                if function_name in self.function_index:
+                    other_file = self.function_index[function_name][0]
+                    raise NameError(f"Function '{function_name}' defined in both '{other_file}' and '{file_path}'.")
+                self.function_index[function_name] = (file_path, return_type, parameters)
+
+
+    # Check that every call has a definition somewhere and build the call graph
+    def resolve_calls(self):
+        self.call_graph = {}
+        for file_path, ast in self.units.items():
+            for node in ast:
+                if node[0] != 'FunctionDefinition':
+                    continue
+                calls = []
+                self.collect_calls(node, calls)
+                self.call_graph[node[2]] = {call[1] for call in calls}
+
+                for _, callee, arguments in calls:
+                    if callee not in self.function_index:
+                        raise NameError(f"Function '{callee}' called in '{file_path}' is not defined in any file.")
+                    parameters = self.function_index[callee][2]
+                    if len(arguments) != len(parameters):
+                        raise SyntaxError(f"Function '{callee}' expects {len(parameters)} arguments, "
+                                          f"but got {len(arguments)} in '{file_path}'")
+
+
+    # Helper to collect every FunctionCall node below the given node
+    def collect_calls(self, node, calls):
+        if isinstance(node, tuple):
+            if node and node[0] == 'FunctionCall':
+                calls.append(node)
+            for child in node[1:]:
+                self.collect_calls(child, calls)
+        elif isinstance(node, list):
+            for item in node:
+                self.collect_calls(item, calls)
+
+
+    # Dead Function Elimination
+    # Removes every function that cannot be reached from main
+    def eliminate_dead_functions(self, entry = 'main'):
+        if entry not in self.function_index:
+            return set()
+
+        reachable = set()
+        worklist = [entry]
+        while worklist:
+            function_name = worklist.pop()
+            if function_name in reachable:
+                continue
+            reachable.add(function_name)
+            worklist.extend(self.call_graph.get(function_name, ()))
+
+        removed = set(self.function_index) - reachable
+        for file_path, ast in self.units.items():
+            self.units[file_path] = [node for node in ast
+                                     if node[0] != 'FunctionDefinition' or node[2] in reachable]
+        for function_name in removed:
+            del self.function_index[function_name]
+            del self.call_graph[function_name]
+
+        return removed
+
+
+    # Function Inlining
+    # Calls to functions whose body is a single "return expression" are replaced by that expression
+    # With a profile, functions the profiled run called rarely stay out of line, they are not worth the code. The
+    # entry count of a function is how often all of its call sites ran together, and only functions called at least
+    # HOT_CALL_FRACTION as often as the most called one are inlined
+    def inline_functions(self, profile = None):
+        min_calls = 0
+        if profile is not None:
+            calls = [profile.entry_count(name) for name in self.function_index if name != 'main']
+            min_calls = max(1, HOT_CALL_FRACTION * max((count for count in calls if count is not None), default = 0))
+
+        candidates = {}
+        for ast in self.units.values():
+            for node in ast:
+                if node[0] == 'FunctionDefinition' and node[2] not in self.call_graph.get(node[2], ()):
+                    calls = profile.entry_count(node[2]) if profile is not None else None
+                    if calls is not None and calls < min_calls:
+                        continue
+                    _, _, function_name, parameters, body = node
+                    statements = body[1]
+                    if len(statements) == 1 and statements[0][0] == 'ReturnStatement' \
+                            and statements[0][1] is not None and self.is_pure(statements[0][1]):
+                        candidates[function_name] = ([name for _, name in parameters], statements[0][1])
+
+        # Only the functions that replaced at least one call count as inlined
+        inlined = set()
+        for file_path, ast in self.units.items():
+            self.units[file_path] = [self.inline_calls(node, candidates, inlined) for node in ast]
+        self.resolve_calls()
+
+        return inlined
+
+
+    # Helper for inlining, rewrites calls below the given node and adds the functions it inlined to inlined
+    def inline_calls(self, node, candidates, inlined):
+        if isinstance(node, list):
+            return [self.inline_calls(item, candidates, inlined) for item in node]
+        if not isinstance(node, tuple) or not node:
+            return node
+
+        node = tuple(self.inline_calls(child, candidates, inlined) for child in node)
+        if node[0] == 'FunctionCall' and node[1] in candidates:
+            _, function_name, arguments = node
+            param_names, expression = candidates[function_name]
+            # Only pure arguments can be substituted, otherwise side effects could be duplicated
+            if all(self.is_pure(argument) for argument in arguments):
+                inlined.add(function_name)
+                return self.substitute(expression, dict(zip(param_names, arguments)))
+        return node
+
+
+    # Helper for inlining, replaces parameter variables with the argument expressions
+    def substitute(self, node, bindings):
+        if isinstance(node, list):
+            return [self.substitute(item, bindings) for item in node]
+        if not isinstance(node, tuple) or not node:
+            return node
+        if node[0] == 'Variable' and node[1] in bindings:
+            return bindings[node[1]]
+        return tuple(self.substitute(child, bindings) for child in node)
+
+
+    # Expressions without calls or ++/-- can be duplicated or dropped safely
+    def is_pure(self, node):
+        if isinstance(node, list):
+            return all(self.is_pure(item) for item in node)
+        if not isinstance(node, tuple) or not node:
+            return True
+        if node[0] in {'FunctionCall', 'UnaryExpression', 'Assignment'}:
+            return False
+        return all(self.is_pure(child) for child in node[1:])
+
+
+    # Generate TAC for every unit, labels stay unique across units (temps only live inside one function)
+    # With a profile the block counts of every unit are collected in self.block_counts for generate_assembly
+    def generate_tac(self, constant_folding = False, constant_propagation = False, dead_code_elimination = False,
+                     batch_folding = False, verify_batch = False, jump_threading = False, profile = None):
+        generator = ThreeAddressCodeGenerator([])
+        tac_units = {}
+        # Renumbered labels continue from the previous unit, so they stay unique in a merged listing
+        next_label = 1
+
+        for file_path, ast in self.units.items():
+            generator.ast = ast
+            generator.code = []
+            tac = generator.generate()
+
+            if constant_folding or constant_propagation or dead_code_elimination or jump_threading or profile:
+                optimizer = Optimizer(tac, self.symbol_tables[file_path], profile)
+                tac = optimizer.optimize(
+                    constant_folding = constant_folding,
+                    constant_propagation = constant_propagation,
+                    dead_code_elimination = dead_code_elimination,
+                    batch_folding = batch_folding,
+                    verify_batch = verify_batch,
+                    jump_threading = jump_threading,
+                    first_label = next_label
+                )
+                next_label = optimizer.next_label
+                self.block_counts.update(optimizer.block_counts)
+            tac_units[file_path] = tac
+
+        return tac_units
+
+
+    # Generate x86 for every unit, either one listing per unit or a single merged listing
+    def generate_assembly(self, tac_units, merged = False):
+        assembly_units = {}
+        for file_path, tac in tac_units.items():
+            converter = TACtoAssemblyConverter(tac, self.block_counts)
+            assembly_units[file_path] = converter.convert()
+
+        if merged:
+            return "\n".join(assembly_units[file_path] for file_path in self.files)
+        return assembly_units